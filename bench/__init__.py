@@ -0,0 +1,39 @@
+import contextlib
+import os
+import shutil
+import tempfile
+
+from src.snapshot import JSON_SNAPSHOT_PATH
+
+@contextlib.contextmanager
+def throwaway_datastore():
+    '''
+    Runs the body of the with statement against a json datastore of its own,
+    which starts out from the empty json dump and is removed afterwards. The
+    mutations of a benchmark do not need to survive a crash, so they are not
+    synced unless STREAMS_DURABILITY says otherwise.
+
+    The datastore is loaded by the first import of src.data_store, which must
+    come inside the body.
+    '''
+    os.environ.setdefault('STREAMS_DURABILITY', 'os')
+    os.environ['STREAMS_DATASTORE_BACKEND'] = 'json'
+
+    # the datastore keeps its files under src/json_dump of the working
+    # directory
+    directory = tempfile.mkdtemp()
+    os.makedirs(os.path.join(directory, 'src', 'json_dump'))
+    shutil.copy(JSON_SNAPSHOT_PATH, os.path.join(directory, JSON_SNAPSHOT_PATH))
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+
+        # let the background checkpoint finish before the files are removed
+        from src.data_store import data_store
+        data_store.checkpoint()
+        data_store.flush()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
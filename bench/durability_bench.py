@@ -0,0 +1,69 @@
+'''
+
+Durability benchmark
+
+Measures the latency of committing one mutation at each DURABILITY level, for
+both datastore backends. Run from the root of the repo:
+
+    python3 -m bench.durability_bench [commits]
+
+'''
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from src.persistence import DURABILITY_LEVELS, MutationLog
+from src.sqlite_data_store import SYNCHRONOUS
+
+def percentile(latencies, fraction):
+    return sorted(latencies)[int(len(latencies) * fraction)]
+
+def report(backend, durability, latencies):
+    print(f'{backend:<8}{durability:<10}'
+          f'mean {sum(latencies) / len(latencies) * 1e6:>9.1f}us   '
+          f'p50 {percentile(latencies, 0.5) * 1e6:>9.1f}us   '
+          f'p99 {percentile(latencies, 0.99) * 1e6:>9.1f}us')
+
+def bench_json(directory, durability, commits):
+    log = MutationLog(os.path.join(directory, f'{durability}.log'), durability)
+    latencies = []
+
+    for index in range(commits):
+        start = time.perf_counter()
+        log.sync(log.append('insert_token', [f'token {index}', index]))
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+def bench_sqlite(directory, durability, commits):
+    connection = sqlite3.connect(os.path.join(directory, f'{durability}.db'))
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute(f'PRAGMA synchronous = {SYNCHRONOUS[durability]}')
+    connection.execute('CREATE TABLE tokens (token TEXT PRIMARY KEY, u_id INTEGER)')
+    latencies = []
+
+    for index in range(commits):
+        start = time.perf_counter()
+        connection.execute('INSERT INTO tokens VALUES (?, ?)', (f'token {index}', index))
+        connection.commit()
+        latencies.append(time.perf_counter() - start)
+
+    connection.close()
+    return latencies
+
+if __name__ == '__main__':
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    # the files live on the same disk as the datastore
+    directory = tempfile.mkdtemp(dir='src/json_dump')
+    try:
+        for durability in DURABILITY_LEVELS:
+            report('json', durability, bench_json(directory, durability, commits))
+        for durability in DURABILITY_LEVELS:
+            report('sqlite', durability, bench_sqlite(directory, durability, commits))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,90 @@
+'''
+
+Handle benchmark
+
+Registers users who all share the same name, so every handle after the first
+needs a numeric suffix, and reports how long registrations take as the number
+of colliding users grows. Also times the full scan handle generation used
+before the handle index on the first few thousand of them. Run from the root
+of the repo:
+
+    python3 -m bench.handle_bench [users]
+
+'''
+
+import os
+import sys
+import time
+
+# the passwords of the benchmark are hashed with a single iteration, so that
+# registrations time the handles rather than the hashing
+os.environ.setdefault('STREAMS_PASSWORD_HASH_ITERATIONS', '1')
+
+from bench import throwaway_datastore
+from src.handles import HandleSuffixes
+
+REPORT_EVERY = 10000
+SCAN_USERS = 2000
+
+def scan_unique_handle(users, base_handle):
+    '''
+    Handle generation from before the handle index, which scans every user for
+    each suffix it tries
+    '''
+    duplicate_count = -1
+    handle_str = base_handle
+
+    while any(user['handle_str'] == handle_str for user in users.values()):
+        duplicate_count += 1
+        handle_str = base_handle + str(duplicate_count)
+
+    return handle_str
+
+def bench_scan(num_users):
+    users = {}
+    start = time.perf_counter()
+
+    for u_id in range(num_users):
+        users[u_id] = {'u_id': u_id, 'handle_str': scan_unique_handle(users, 'johnsmith')}
+
+    return time.perf_counter() - start
+
+def bench_register(num_users):
+    from src.auth import auth_register_v1
+    from src.data_store import data_store
+
+    batch_start = time.perf_counter()
+    for index in range(num_users):
+        auth_register_v1(f'john{index}@smith.com', 'password', 'John', 'Smith')
+
+        if (index + 1) % REPORT_EVERY == 0:
+            elapsed = time.perf_counter() - batch_start
+            print(f'users {index + 1:>8}   {elapsed / REPORT_EVERY * 1e6:>8.1f}us per registration')
+            batch_start = time.perf_counter()
+
+    handles = [data_store.get_user_from_u_id(u_id)['handle_str'] for u_id in (0, 1, num_users - 1)]
+    print(f'handles {handles}')
+
+    start = time.perf_counter()
+    for index in range(num_users):
+        data_store.is_duplicate_handle(f'johnsmith{index}')
+    print(f'is_duplicate_handle   {(time.perf_counter() - start) / num_users * 1e6:>8.1f}us per check')
+
+    # the same counters as registration, once they have caught up with the
+    # suffixes taken
+    handle_suffixes = HandleSuffixes()
+    handle_suffixes.unique_handle('johnsmith', data_store.is_duplicate_handle)
+
+    start = time.perf_counter()
+    for _ in range(num_users):
+        handle_suffixes.unique_handle('johnsmith', data_store.is_duplicate_handle)
+    print(f'unique_handle         {(time.perf_counter() - start) / num_users * 1e6:>8.1f}us per handle')
+
+if __name__ == '__main__':
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    scan_seconds = bench_scan(SCAN_USERS)
+    print(f'scan    {SCAN_USERS:>8}   {scan_seconds / SCAN_USERS * 1e6:>8.1f}us per handle')
+
+    with throwaway_datastore():
+        bench_register(num_users)
@@ -0,0 +1,57 @@
+'''
+
+Import benchmark
+
+Registers users through the Flask app in process, one auth/register/v2
+request at a time and then as batches sent to admin/users/import/v1, and
+reports the users registered per second each way. Run from the root of the
+repo:
+
+    python3 -m bench.import_bench [users] [batch size]
+
+'''
+
+import sys
+import time
+
+from bench import throwaway_datastore
+
+def new_user(name, index):
+    return {
+        'email': f'{name}{index}@test.com',
+        'password': 'password',
+        'name_first': 'John',
+        'name_last': 'Smith'
+    }
+
+def bench_import(num_users, batch_size):
+    from src.config import PASSWORD_HASH_ITERATIONS, PASSWORD_HASH_WORKERS
+    from src.server import APP
+
+    # the global owner of the empty json dump
+    client = APP.test_client()
+    owner = client.post('/auth/login/v2', json={'email': 'owner@gmail.com', 'password': 'password'}).get_json()
+
+    print(f'{PASSWORD_HASH_ITERATIONS} iterations, {PASSWORD_HASH_WORKERS} hashing processes')
+
+    start = time.perf_counter()
+    for index in range(num_users):
+        client.post('/auth/register/v2', json=new_user('register', index))
+    elapsed = time.perf_counter() - start
+    print(f'auth/register/v2           {num_users / elapsed:>8.1f} users/s')
+
+    start = time.perf_counter()
+    for first in range(0, num_users, batch_size):
+        client.post('/admin/users/import/v1', json={
+            'token': owner['token'],
+            'users': [new_user('import', index) for index in range(first, min(first + batch_size, num_users))]
+        })
+    elapsed = time.perf_counter() - start
+    print(f'admin/users/import/v1      {num_users / elapsed:>8.1f} users/s   batches of {batch_size}')
+
+if __name__ == '__main__':
+    num_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    with throwaway_datastore():
+        bench_import(num_users, batch_size)
@@ -0,0 +1,96 @@
+'''
+
+Login benchmark
+
+Logs in from several threads at once through the Flask app in process, and
+reports login throughput and latency at each level of concurrency, with
+passwords hashed on the request's thread and in the process pool. While the
+logins run, another thread keeps requesting a user's profile, to show how
+much the hashing holds up requests that do not hash. Run from the root of
+the repo:
+
+    python3 -m bench.login_bench [logins per thread]
+
+'''
+
+import os
+import statistics
+import sys
+import threading
+import time
+
+from bench import throwaway_datastore
+
+CONCURRENCY = [1, 2, 4, 8]
+
+def percentile(latencies, fraction):
+    return sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+def bench_logins(logins_per_thread):
+    from src.config import PASSWORD_HASH_ITERATIONS, PASSWORD_HASH_WORKERS
+    from src.passwords import password_hasher
+    from src.server import APP
+
+    client = APP.test_client()
+    user = client.post('/auth/register/v2', json={
+        'email': 'john@smith.com',
+        'password': 'password',
+        'name_first': 'John',
+        'name_last': 'Smith'
+    }).get_json()
+    credentials = {'email': 'john@smith.com', 'password': 'password'}
+    profile = {'token': user['token'], 'u_id': user['auth_user_id']}
+
+    print(f'{PASSWORD_HASH_ITERATIONS} iterations, {os.cpu_count()} cpus')
+
+    for name, workers in [('thread', 0), (f'pool of {PASSWORD_HASH_WORKERS}', PASSWORD_HASH_WORKERS)]:
+        password_hasher.shutdown()
+        password_hasher.workers = workers
+
+        for concurrency in CONCURRENCY:
+            latencies = []
+            profile_latencies = []
+            done = threading.Event()
+
+            def login():
+                thread_client = APP.test_client()
+                for _ in range(logins_per_thread):
+                    start = time.perf_counter()
+                    thread_client.post('/auth/login/v2', json=credentials)
+                    latencies.append(time.perf_counter() - start)
+
+            def read_profile():
+                thread_client = APP.test_client()
+                while not done.is_set():
+                    start = time.perf_counter()
+                    thread_client.get('/user/profile/v1', query_string=profile)
+                    profile_latencies.append(time.perf_counter() - start)
+                    time.sleep(0.001)
+
+            threads = [threading.Thread(target=login) for _ in range(concurrency)]
+            reader = threading.Thread(target=read_profile)
+            reader.start()
+
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            done.set()
+            reader.join()
+
+            print(
+                f'{name:<10} {concurrency:>2} threads   {len(latencies) / elapsed:>6.1f} logins/s   '
+                f'p50 {statistics.median(latencies) * 1e3:>6.1f}ms   p99 {percentile(latencies, 0.99) * 1e3:>6.1f}ms   '
+                f'profile p50 {statistics.median(profile_latencies) * 1e3:>5.2f}ms   p99 {percentile(profile_latencies, 0.99) * 1e3:>6.2f}ms'
+            )
+
+    password_hasher.shutdown()
+
+if __name__ == '__main__':
+    logins_per_thread = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    with throwaway_datastore():
+        bench_logins(logins_per_thread)
@@ -0,0 +1,101 @@
+'''
+
+Memory benchmark
+
+Measures the memory taken per user and per message by the json Datastore's
+in-memory records, against the plain dicts they were kept in before, as
+they come out of the json text dump. Run from the root of the repo:
+
+    python3 -m bench.memory_bench [messages] [users]
+
+'''
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from src.message_log import MessageLocator, MessageLog
+from src.records import User
+
+CHANNEL_ID = 1
+
+def measure(build):
+    '''
+    Returns the bytes still allocated by the object build returns, and the
+    object
+    '''
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    built = build()
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    return size, built
+
+def report(name, count, size):
+    print(f'{name:<28}{size / count:>9.1f} bytes each   ({size / 2 ** 20:.1f}MiB for {count})')
+
+def user_dicts_json(num_users):
+    return json.dumps([{
+        'u_id': u_id,
+        'email': f'john.smith{u_id}@example.com',
+        'name_first': 'John',
+        'name_last': 'Smith',
+        'handle_str': f'johnsmith{u_id}'
+    } for u_id in range(num_users)])
+
+def message_dicts_json(num_messages):
+    return json.dumps([{
+        'message_id': message_id,
+        'u_id': message_id % 1000,
+        'message': f'message {message_id}',
+        'time_created': 1600000000.0 + message_id
+    } for message_id in range(num_messages)])
+
+def bench_users(num_users):
+    contents = user_dicts_json(num_users)
+
+    size, _ = measure(lambda: json.loads(contents))
+    report('user dicts', num_users, size)
+
+    # the dicts are only kept until their record is made
+    size, _ = measure(lambda: [User.load(user) for user in json.loads(contents)])
+    report('User records', num_users, size)
+
+def bench_messages(num_messages, directory):
+    contents = message_dicts_json(num_messages)
+
+    size, messages = measure(lambda: json.loads(contents))
+    report('message dicts', num_messages, size)
+
+    def build_log():
+        message_log = MessageLog(os.path.join(directory, f'{CHANNEL_ID}.dat'))
+        locator = MessageLocator()
+        for message in messages:
+            slot = message_log.append(message['message_id'], message['u_id'], message['message'], message['time_created'])
+            locator.set(message['message_id'], CHANNEL_ID, slot)
+
+        # a checkpoint moves the message text out of memory and into the data file
+        message_log.flush()
+        return message_log, locator
+
+    size, _ = measure(build_log)
+    report('message log and locator', num_messages, size)
+
+    data_size = os.path.getsize(os.path.join(directory, f'{CHANNEL_ID}.dat'))
+    report('message data file (disk)', num_messages, data_size)
+
+if __name__ == '__main__':
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    num_users = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    bench_users(num_users)
+
+    directory = tempfile.mkdtemp()
+    try:
+        bench_messages(num_messages, directory)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,68 @@
+'''
+
+Message benchmark
+
+Sends messages to a single channel and reports how long a send takes as the
+channel grows, then how long it takes to read the newest page and a page
+from deep in the history, a page of the messages sent in a time range from
+each, and a page either side of a cursor at each. Run from the root of the
+repo:
+
+    python3 -m bench.message_bench [messages]
+
+'''
+
+import sys
+import time
+
+from bench import throwaway_datastore
+
+REPORTS = 10
+PAGE_SIZE = 50
+
+def bench_send(num_messages):
+    from src.auth import auth_register_v1
+    from src.channels import channels_create_v1
+    from src.data_store import data_store
+    from src.message import message_send_v1
+
+    auth_user_id = auth_register_v1('john@smith.com', 'password', 'John', 'Smith')['auth_user_id']
+    channel_id = channels_create_v1(auth_user_id, 'busy channel', True)['channel_id']
+
+    report_every = max(num_messages // REPORTS, 1)
+    batch_start = time.perf_counter()
+    for index in range(num_messages):
+        message_send_v1(auth_user_id, channel_id, f'message {index}')
+
+        if (index + 1) % report_every == 0:
+            elapsed = time.perf_counter() - batch_start
+            print(f'messages {index + 1:>9}   {elapsed / report_every * 1e6:>8.1f}us per send')
+            batch_start = time.perf_counter()
+
+    for start in [0, num_messages // 2, num_messages - PAGE_SIZE]:
+        page_start = time.perf_counter()
+        page = data_store.get_messages_page_from_channel_or_dm_id(channel_id, start, PAGE_SIZE)
+        elapsed = time.perf_counter() - page_start
+        print(f'page at {start:>9}   {elapsed * 1e6:>8.1f}us   newest {page[0]["message"]!r}')
+
+    # every time range holds PAGE_SIZE messages, starting from the message at start
+    for start in [0, num_messages // 2, num_messages - PAGE_SIZE]:
+        time_start = data_store.get_message_from_message_id(start)['time_created']
+        time_end = data_store.get_message_from_message_id(start + PAGE_SIZE - 1)['time_created']
+        range_start = time.perf_counter()
+        page = data_store.get_messages_page_from_channel_or_dm_id_in_time_range(channel_id, time_start, time_end, 0, PAGE_SIZE)
+        elapsed = time.perf_counter() - range_start
+        print(f'range at {start:>8}   {elapsed * 1e6:>8.1f}us   {len(page)} messages')
+
+    for message_id in [num_messages - 1, num_messages // 2, PAGE_SIZE]:
+        cursor_start = time.perf_counter()
+        page = data_store.get_messages_page_from_channel_or_dm_id_before_message_id(channel_id, message_id, PAGE_SIZE)
+        data_store.get_num_messages_from_channel_or_dm_id_after_message_id(channel_id, page[0]['message_id'])
+        elapsed = time.perf_counter() - cursor_start
+        print(f'before {message_id:>10}   {elapsed * 1e6:>8.1f}us   newest {page[0]["message"]!r}')
+
+if __name__ == '__main__':
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with throwaway_datastore():
+        bench_send(num_messages)
@@ -0,0 +1,48 @@
+'''
+
+Session benchmark
+
+Fills a SessionStore with sessions spread over many users, then times ending
+all of one user's sessions through the store's u_id index, against finding
+them with a scan of every session (as admin_user_remove did with the token
+dict). Runs in a throwaway directory:
+
+    python3 -m bench.session_bench [sessions] [users]
+
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from src.sessions import SessionStore
+
+def bench_revoke(num_sessions, num_users):
+    directory = tempfile.mkdtemp()
+    try:
+        sessions = SessionStore(os.path.join(directory, 'sessions.log'), 24 * 60 * 60, durable=False)
+        session_ids = {}
+        for index in range(num_sessions):
+            session_ids[sessions.create(index % num_users)] = index % num_users
+
+        start = time.perf_counter()
+        for u_id in range(num_users // 2):
+            [session_id for session_id, session_u_id in session_ids.items() if session_u_id == u_id]
+        scan = (time.perf_counter() - start) / (num_users // 2)
+
+        start = time.perf_counter()
+        for u_id in range(num_users // 2):
+            sessions.revoke_user(u_id)
+        indexed = (time.perf_counter() - start) / (num_users // 2)
+
+        print(f'{num_sessions} sessions of {num_users} users   scan {scan * 1e6:>8.1f}us   index {indexed * 1e6:>6.1f}us per user')
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    num_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    num_users = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    bench_revoke(num_sessions, num_users)
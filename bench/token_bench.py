@@ -0,0 +1,54 @@
+'''
+
+Token benchmark
+
+Sends authenticated requests to the Flask app in process, on a single thread,
+and reports the requests per second it serves with the token cache turned off
+(every request verifies its token's signature, as before the cache) and on.
+Also times token_to_auth_id on its own. Run from the root of the repo:
+
+    python3 -m bench.token_bench [requests]
+
+'''
+
+import sys
+import time
+
+from bench import throwaway_datastore
+
+def bench_requests(num_requests):
+    from src.config import TOKEN_CACHE_SIZE
+    from src.other import token_to_auth_id
+    from src.server import APP
+    from src.token_cache import token_cache
+
+    client = APP.test_client()
+    user = client.post('/auth/register/v2', json={
+        'email': 'john@smith.com',
+        'password': 'password',
+        'name_first': 'John',
+        'name_last': 'Smith'
+    }).get_json()
+    params = {'token': user['token'], 'u_id': user['auth_user_id']}
+
+    for name, capacity in [('without cache', 0), ('with cache', TOKEN_CACHE_SIZE)]:
+        token_cache.capacity = capacity
+        token_cache.clear()
+
+        start = time.perf_counter()
+        for _ in range(num_requests):
+            client.get('/user/profile/v1', query_string=params)
+        elapsed = time.perf_counter() - start
+
+        lookup_start = time.perf_counter()
+        for _ in range(num_requests):
+            token_to_auth_id(user['token'])
+        lookup = (time.perf_counter() - lookup_start) / num_requests
+
+        print(f'{name:<14}   {num_requests / elapsed:>8.0f} requests/s   token_to_auth_id {lookup * 1e6:>6.1f}us   {token_cache.get_stats()}')
+
+if __name__ == '__main__':
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with throwaway_datastore():
+        bench_requests(num_requests)
@@ -1,8 +1,13 @@
 from re import U
 from src.data_store import data_store
+from src.token_cache import token_cache
 from src.error import InputError
 from src.error import AccessError
 from src.other import check_type
+from src.other import base_handle_str_generation
+from src.auth import check_registration
+from src.passwords import password_hasher
+from src.config import IMPORT_USERS_MAX
 
 
 def admin_userpermission_change_v1(auth_user_id, u_id, permission_id):
@@ -88,7 +93,110 @@ def admin_user_remove_v1(auth_user_id, u_id):
         raise InputError ('u_id refers to a user who is the only global owner and they are being demoted to a user')
 
     data_store.admin_user_remove(u_id)
+    token_cache.discard_user(u_id)
 
     return {}
 
 
+def admin_stats_v1(auth_user_id):
+    '''
+    admin/stats/v1
+    Returns internal statistics about the Streams server.
+
+    Method: GET
+
+    Arguments:
+        token           (str) - unique user token
+
+    Exceptions:
+        AccessError - Occurs when the authorised user is not a global owner
+
+    Return Value:
+        Returns {persistence, token_cache} on success
+    '''
+
+    check_type(auth_user_id, int)
+
+    if data_store.is_stream_owner(auth_user_id) == False:
+        raise AccessError('Token(auth_id) is not a global owner')
+
+    return {
+        'persistence': data_store.get_persistence_stats(),
+        'token_cache': token_cache.get_stats()
+    }
+
+def admin_users_import_v1(auth_user_id, users):
+    '''
+    admin/users/import/v1
+    Registers a batch of users. Each row is checked like auth/register/v2,
+    the passwords of the valid rows are hashed in parallel, and then a
+    single mutation checks their emails again, generates their auth_ids and
+    handles in one pass and inserts them.
+
+    Method: POST
+
+    Arguments:
+        token           (str)  - unique user token
+        users           (list) - dicts of {email, password, name_first, name_last}
+
+    Exceptions:
+        InputError - Occurs when users is not a list, or has more than
+                     IMPORT_USERS_MAX rows
+
+        AccessError - Occurs when the authorised user is not a global owner
+
+    Return Value:
+        Returns {users} on success, with {row, auth_user_id} for each row that
+        was registered and {row, error} for each row that was not, in the order
+        of the rows
+    '''
+
+    if data_store.is_stream_owner(auth_user_id) == False:
+        raise AccessError('Token(auth_id) is not a global owner')
+    if not isinstance(users, list):
+        raise InputError ('users is not a list')
+    if len(users) > IMPORT_USERS_MAX:
+        raise InputError (f'users has more than {IMPORT_USERS_MAX} rows')
+
+    results = [None] * len(users)
+    valid_rows = []
+    emails = set()
+    for row, user in enumerate(users):
+        try:
+            if not isinstance(user, dict):
+                raise InputError ('row is not a user')
+
+            details = [user.get('email'), user.get('password'), user.get('name_first'), user.get('name_last')]
+            check_registration(*details)
+
+            # check if email is already being used, here or earlier in the batch
+            if details[0] in emails or data_store.is_duplicate_email(details[0]):
+                raise InputError ('email is already being used by another user')
+        except InputError as error:
+            results[row] = {'row': row, 'error': error.description}
+            continue
+        except TypeError:
+            results[row] = {'row': row, 'error': 'email, password, name_first and name_last must be strings'}
+            continue
+
+        emails.add(details[0])
+        valid_rows.append((row, *details))
+
+    # hash the passwords outside the datastore lock
+    encrypted_passwords = password_hasher.hash_many([password for _, _, password, _, _ in valid_rows])
+
+    # the emails are checked again, and the auth_ids and handles generated,
+    # as the users are inserted, since other registrations may have finished
+    # while the passwords were hashed
+    u_ids = data_store.insert_new_users([
+        [email, password, name_first, name_last, base_handle_str_generation(name_first, name_last)]
+        for (_, email, _, name_first, name_last), password in zip(valid_rows, encrypted_passwords)
+    ]) if valid_rows else []
+
+    for (row, *_), u_id in zip(valid_rows, u_ids):
+        if u_id is None:
+            results[row] = {'row': row, 'error': 'email is already being used by another user'}
+        else:
+            results[row] = {'row': row, 'auth_user_id': u_id}
+
+    return {'users': results}
@@ -1,12 +1,11 @@
 from src.data_store import data_store
+from src.token_cache import token_cache
 from src.error import InputError
 from src.other import check_type, check_email_valid
-from src.other import handle_str_generation
-from src.other import stream_owner, stream_member
-from src.other import hash_str
-from src.config import SECRET
+from src.other import base_handle_str_generation
+from src.passwords import password_hasher
+from src.other import new_token, token_to_session
 import re
-import jwt
 
 def auth_login_v1(email, password):
     '''
@@ -33,20 +32,17 @@ def auth_login_v1(email, password):
     
     login = data_store.get_login_from_email(email)
 
-    if hash_str(password) != login.get('password'):
+    matches, upgrade = password_hasher.verify(password, login.get('password'))
+    if not matches:
         raise InputError ('password is not correct')
 
-    auth_user_id = login.get("auth_id")
-
-    token = jwt.encode({
-                'auth_user_id': auth_user_id,
-                'token_count': len(data_store.get_u_ids_from_token_dict())
-                },
-                 SECRET, algorithm='HS256')
+    # rehash passwords stored as legacy sha256 or with an old work factor
+    if upgrade:
+        data_store.update_password(email, password_hasher.hash(password))
 
-    data_store.insert_token(token, auth_user_id)
+    auth_user_id = login.get("auth_id")
 
-    return { 'token': token,'auth_user_id': auth_user_id }
+    return { 'token': new_token(auth_user_id),'auth_user_id': auth_user_id }
 
 def auth_register_v1(email, password, name_first, name_last):
     '''
@@ -74,6 +70,41 @@ def auth_register_v1(email, password, name_first, name_last):
         Returns {auth_user_id} on success
     '''
 
+    check_registration(email, password, name_first, name_last)
+    
+    # check if email is already being used
+    if data_store.is_duplicate_email(email):
+        raise InputError ('email is already being used by another user')
+
+    # hash the password outside the datastore lock
+    encrypted_password = password_hasher.hash(password)
+
+    # the email is checked again, and the auth_id and handle generated, as
+    # the user is inserted, since another registration may have finished
+    # while the password was hashed
+    auth_user_id, = data_store.insert_new_users([
+        [email, encrypted_password, name_first, name_last, base_handle_str_generation(name_first, name_last)]
+    ])
+    if auth_user_id is None:
+        raise InputError ('email is already being used by another user')
+
+    return { 'auth_user_id': auth_user_id }
+
+
+# helper function with the checks of auth_register_v1 that do not depend on
+# the datastore, shared with admin/users/import/v1
+def check_registration(email, password, name_first, name_last):
+    '''
+    Checks the details of a new user
+
+    Exceptions:
+        TypeError   - occurs when email, password, name_first or name_last
+                    are not strings
+        InputError  - occurs when email is not a valid email, password is
+                    less than 6 characters, or name_first or name_last is
+                    less than 1 character or more than 50
+    '''
+
     # checking for valid input types
     check_type(email, str)
     check_type(password, str)
@@ -89,41 +120,45 @@ def auth_register_v1(email, password, name_first, name_last):
         raise InputError ('name_first is less than 1 character or more than 50')
     if len(name_last) < 1 or len(name_last) > 50:
         raise InputError ('name_last is less than 1 character or more than 50')
-    
-    # check if email is already being used
-    if data_store.is_duplicate_email(email):
-        raise InputError ('email is already being used by another user')
 
-    # generate a unique auth_id
-    auth_user_id = len(data_store.get_users_from_u_id_dict())
-    handle_str = handle_str_generation(name_first, name_last)
 
-    # hash the password
-    encrypted_password = hash_str(password)
+def auth_logout_v1(token):
+    '''
+    Given an active token, invalidates the token to log the user out.
+
+    Arguments:
+        token           (str) - unique user token
+
+    Exceptions:
+        AccessError     - occurs when token is invalid
+
+    Return value:
+        Returns {} on success
+    '''
 
-    # insert new data into dicts
-    perm = stream_owner if auth_user_id == 0 else stream_member
-    data_store.insert_user_perm(auth_user_id, perm)
-    data_store.insert_user(auth_user_id, email, name_first, name_last, handle_str)
-    data_store.insert_login(email, encrypted_password, auth_user_id)
+    data_store.invalidate_session(token_to_session(token)[1])
+    token_cache.discard(token)
 
-    return { 'auth_user_id': auth_user_id }
+    return {}
 
 
-def auth_logout_v1(token):
+def auth_logout_all_v1(token):
     '''
-    Given an active token, invalidates the token to log the user out.
+    Given an active token, invalidates every token of its user, logging them
+    out of all of their sessions.
 
     Arguments:
         token           (str) - unique user token
 
     Exceptions:
-        N/A
+        AccessError     - occurs when token is invalid
 
     Return value:
         Returns {} on success
     '''
 
-    data_store.invalidate_token(token)
+    auth_user_id = token_to_session(token)[0]
+    data_store.invalidate_user_sessions(auth_user_id)
+    token_cache.discard_user(auth_user_id)
 
-    return {}
\ No newline at end of file
+    return {}
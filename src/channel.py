@@ -1,7 +1,9 @@
+import math
+
 from src.data_store import data_store
 from src.error import InputError
 from src.error import AccessError
-from src.other import check_type
+from src.other import check_type, messages_page_with_cursors
 
 def channel_invite_v1(auth_user_id, channel_id, u_id):
     '''
@@ -45,9 +47,7 @@ def channel_invite_v1(auth_user_id, channel_id, u_id):
     if data_store.is_user_member_of_channel(channel_id, u_id):
         raise InputError ('u_id refers to a user who is already a member of the channel')
     
-    channel = data_store.get_channel_from_channel_id(channel_id)
-
-    channel.get('all_members').append(data_store.get_user_from_u_id(u_id))
+    data_store.insert_channel_member(channel_id, u_id)
 
     return {}
 
@@ -123,8 +123,7 @@ def channel_messages_v1(auth_user_id, channel_id, start):
     if start < 0:
         raise InputError('start is a negative integer')
 
-    messages = data_store.get_messages_from_channel_or_dm_id(channel_id)
-    num_messages = len(messages)
+    num_messages = data_store.get_num_messages_from_channel_or_dm_id(channel_id)
 
     if start > num_messages:
         raise InputError('start is greater than the total number of messages in the channel')
@@ -133,11 +132,129 @@ def channel_messages_v1(auth_user_id, channel_id, start):
     end = start + 50 if start + 50 < num_messages else -1
     
     return {
-        'messages' : messages[start: start + 50],
+        'messages' : data_store.get_messages_page_from_channel_or_dm_id(channel_id, start, 50),
         'start': start,
         'end' : end
         }
 
+def channel_messages_v3(auth_user_id, channel_id, start=None, before=None, after=None):
+    '''
+    Returns up to 50 messages from a given channel that the authorised user has
+    access to, from index 'start' like channel_messages_v1, or from either side
+    of a cursor returned by an earlier call. Additionally returns 'start', 'end',
+    and the 'before' and 'after' cursors of the pages either side of this one
+
+    Arguments:
+        auth_user_id    (int)   - authorised user id
+        channel_id      (int)   - unique channel id
+        start           (int)   - message index (most recent message has index 0),
+                                or None
+        before          (str)   - cursor, returns the messages older than it,
+                                or None
+        after           (str)   - cursor, returns the messages newer than it,
+                                or None
+
+    Exceptions:
+        TypeError   - occurs when auth_user_id, channel_id, start are not ints or
+                    before, after are not strs
+        InputError  - occurs when channel_id is invalid
+        AccessError - occurs when the authorised user is not a member of the channel
+        InputError  - occurs when more than one of start, before and after is given
+        InputError  - occurs when a cursor is invalid
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the total number of messages
+                    in the channel
+
+    Return value:
+        Returns { messages, start, end, before, after } on success
+        Returns { messages, start, -1, None, after } if the function has returned
+        the least recent message
+    '''
+
+    check_type(auth_user_id, int)
+    check_type(channel_id, int)
+    if start is not None:
+        check_type(start, int)
+    if before is not None:
+        check_type(before, str)
+    if after is not None:
+        check_type(after, str)
+
+    if data_store.is_invalid_channel_id(channel_id):
+        raise InputError('channel_id does not refer to a valid channel')
+
+    if not data_store.is_user_member_of_channel(channel_id, auth_user_id):
+        raise AccessError('the authorised user is not a member of the channel')
+
+    return messages_page_with_cursors(channel_id, start, before, after)
+
+def channel_messages_range_v1(auth_user_id, channel_id, time_start, time_end, start):
+    '''
+    Returns up to 50 of the messages of a given channel that the authorised user
+    has access to that were created from time_start to time_end, starting from
+    the 'start'-th most recent of them. Additionally returns 'start', and
+    'end' = 'start' + 50
+
+    Arguments:
+        auth_user_id    (int)   - authorised user id
+        channel_id      (int)   - unique channel id
+        time_start      (float) - unix timestamp of the oldest messages to return
+        time_end        (float) - unix timestamp of the newest messages to return,
+                                None for every message since time_start
+        start           (int)   - message index within the range (most recent
+                                message in the range has index 0)
+
+    Exceptions:
+        TypeError   - occurs when auth_user_id, channel_id, start are not ints or
+                    time_start, time_end are not floats
+        InputError  - occurs when channel_id is invalid
+        AccessError - occurs when the authorised user is not a member of the channel
+        InputError  - occurs when time_end is before time_start
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the number of messages in
+                    the range
+
+    Return value:
+        Returns { messages, start, end } on success
+        Returns { messages, start, -1 } if the function has returned the least
+        recent message in the range
+    '''
+
+    check_type(auth_user_id, int)
+    check_type(channel_id, int)
+    check_type(time_start, float)
+    if time_end is not None:
+        check_type(time_end, float)
+    check_type(start, int)
+
+    if data_store.is_invalid_channel_id(channel_id):
+        raise InputError('channel_id does not refer to a valid channel')
+
+    if not data_store.is_user_member_of_channel(channel_id, auth_user_id):
+        raise AccessError('the authorised user is not a member of the channel')
+
+    if time_end is None:
+        time_end = math.inf
+
+    if time_end < time_start:
+        raise InputError('time_end is before time_start')
+
+    if start < 0:
+        raise InputError('start is a negative integer')
+
+    num_messages = data_store.get_num_messages_from_channel_or_dm_id_in_time_range(channel_id, time_start, time_end)
+
+    if start > num_messages:
+        raise InputError('start is greater than the number of messages in the time range')
+
+    end = start + 50 if start + 50 < num_messages else -1
+
+    return {
+        'messages': data_store.get_messages_page_from_channel_or_dm_id_in_time_range(channel_id, time_start, time_end, start, 50),
+        'start': start,
+        'end': end
+    }
+
 def channel_join_v1(auth_user_id, channel_id):
     '''
     Adds an authorised user to a channel
@@ -166,14 +283,11 @@ def channel_join_v1(auth_user_id, channel_id):
     if data_store.is_user_member_of_channel(channel_id, auth_user_id):
         raise InputError ('user is already part of the channel')
 
-    channel = data_store.get_channel_from_channel_id(channel_id)
-
     # Checking if channel is public
-    if not channel.get('is_public') and not data_store.is_stream_owner(auth_user_id):
+    if not data_store.is_channel_public(channel_id) and not data_store.is_stream_owner(auth_user_id):
         raise AccessError ('channel is not public')
 
-    user = data_store.get_user_from_u_id(auth_user_id)
-    channel.get('all_members').append(user)
+    data_store.insert_channel_member(channel_id, auth_user_id)
 
     return {}
 
@@ -205,14 +319,8 @@ def channel_leave_v1(auth_user_id, channel_id):
     if not data_store.is_user_member_of_channel(channel_id, auth_user_id):
         raise AccessError('channel_id is valid and the authorised user is not a member of the channel')
 
-    channel = data_store.get_channel_from_channel_id(channel_id)
-
-    members = channel.get('all_members')
-
-    channel['all_members'] = [member for member in members if member.get('u_id') != auth_user_id]
+    data_store.remove_channel_member(channel_id, auth_user_id)
 
-    if data_store.is_channel_owner(channel_id, auth_user_id):
-        channel['owner_members'] = [owner for owner in members if owner.get('u_id') != auth_user_id]
     return {}
 
 def channel_addowner_v1(auth_user_id, channel_id, u_id):
@@ -19,14 +19,13 @@ def channels_list_v1(auth_user_id):
     
     check_type(auth_user_id, int)
     
-    channels_dict = data_store.get_channels_from_channel_id_dict()
+    channel_names = data_store.get_channel_names_from_u_id(auth_user_id)
 
     channels = [{
                     'channel_id': channel_id,
-                    'name': channels_dict.get(channel_id).get('name')
+                    'name': name
                 }
-                for channel_id in channels_dict
-                if data_store.is_user_member_of_channel(channel_id, auth_user_id)
+                for channel_id, name in channel_names.items()
                ]
             
     return { 'channels': channels }
@@ -47,14 +46,14 @@ def channels_listall_v1(auth_user_id):
     
     check_type(auth_user_id, int)
 
-    channels_dict = data_store.get_channels_from_channel_id_dict()
-    
-    # Returns a dictionary of dictionaries. Loop through each key and append
+    channel_names = data_store.get_channel_names()
+
     channels = [{
-                        'channel_id': channel_id,
-                        'name': channels_dict.get(channel_id).get('name')
-                    }
-                    for channel_id in channels_dict]
+                    'channel_id': channel_id,
+                    'name': name
+                }
+                for channel_id, name in channel_names.items()
+               ]
 
     return { 'channels': channels }
 
@@ -89,7 +88,7 @@ def channels_create_v1(auth_user_id, name, is_public):
     owner = data_store.get_user_from_u_id(auth_user_id)
 
     # ASSUMPTION: channel_id starts from 1
-    new_id = len(data_store.get_channels_from_channel_id_dict()) + 1
+    new_id = data_store.get_num_channels() + 1
     
     data_store.insert_channel(new_id, name, is_public, [], [owner], [owner])
 
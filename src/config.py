@@ -1,5 +1,46 @@
+import os
+
 port = 8080
 
 url = f"http://localhost:{port}/"
 
-SECRET = 'EAGLE'
\ No newline at end of file
+SECRET = 'EAGLE'
+
+# storage backend used by the datastore, either 'json' (in memory store with a
+# json snapshot and mutation log) or 'sqlite' (src/sqlite_data_store.py)
+DATASTORE_BACKEND = os.environ.get('STREAMS_DATASTORE_BACKEND', 'json')
+
+# seconds between datastore checkpoints
+CHECKPOINT_INTERVAL = 60
+
+# number of logged mutations that triggers an early checkpoint
+CHECKPOINT_LOG_RECORDS = 1000
+
+# when datastore mutations are made durable (see performance.md):
+#   'commit'   - fsync before each request's response is sent
+#   'interval' - fsync every DURABILITY_INTERVAL_MS milliseconds
+#   'os'       - leave writing to disk up to the OS
+DURABILITY = os.environ.get('STREAMS_DURABILITY', 'commit')
+
+DURABILITY_INTERVAL_MS = 100
+
+# mutations waiting for the datastore's log writer before requests block
+WRITE_QUEUE_SIZE = 10000
+
+# verified tokens whose auth_user_id token_to_auth_id remembers
+TOKEN_CACHE_SIZE = 10000
+
+# seconds a session (token) lasts after login or registration
+SESSION_TTL = 24 * 60 * 60
+
+# PBKDF2 iterations of a password hash, the work factor of logging in and
+# registering (see src/passwords.py)
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('STREAMS_PASSWORD_HASH_ITERATIONS', 200000))
+
+# processes that hash passwords (0 hashes on the request's own thread), and the
+# hashes that can wait for them before requests block
+PASSWORD_HASH_WORKERS = int(os.environ.get('STREAMS_PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+PASSWORD_HASH_QUEUE_SIZE = 64
+
+# users one admin/users/import/v1 request can register
+IMPORT_USERS_MAX = 10000
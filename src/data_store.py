@@ -1,4 +1,17 @@
-import json
+import os
+import shutil
+import sys
+import functools
+import threading
+import time
+
+from src.persistence import MutationLog, write_at, write_snapshot
+from src.snapshot import SNAPSHOT_PATH, encode_snapshot, read_snapshot, read_json_snapshot
+from src.message_log import MessageLog, MessageLocator, TOMBSTONE, read_array
+from src.handles import HandleSuffixes
+from src.records import User, stream_owner, stream_member
+from src.sessions import SessionStore
+from src.config import CHECKPOINT_INTERVAL, CHECKPOINT_LOG_RECORDS, DATASTORE_BACKEND, DURABILITY, DURABILITY_INTERVAL_MS, SESSION_TTL, WRITE_QUEUE_SIZE
 
 ######### DATASTORE STRUCTURE ##################################################
 #  
@@ -9,45 +22,40 @@ import json
 #           auth_user_id 
 #           } 
 #
-# tokens:
-#   key: token (str)
-#   value: u_id
-#
 # channels:
 #   key: channel_id:
 #   value: dict {
 #               name
 #               is_public
-#               owner_members
-#               all_members 
+#               owner_members   (u_ids, a dict with None values)
+#               all_members     (u_ids, a dict with None values)
 #               }
 #
 # dms:
 #   key: dm_id:
 #   value: dict {
-#               details : { name, members}
+#               details : { name, members (u_ids, a dict with None values) }
 #               creator 
 #               }
 #
 # message ids:
-#   key: message_id
-#   value: channel_id or dm_id
+#   MessageLocator, message_id -> (channel_id or dm_id, slot in its history)
 # 
 # messages:
 #   (dm_ids must be negative, channel_ids must be positive)
 #   key: channel_id or dm_id
-#   value: [message]
+#   value: MessageLog (see src/message_log.py)
 #               
 # users: 
-#   (matches ‘user’ type)
 #   key: u_id:
-#   value: dict {
+#   value: User (see src/records.py), turned into the ‘user’ type dict {
 #               u_id
 #               email
 #               name_first
 #               name_last
 #               handle_str
 #               }
+#           by the get methods
 #
 # permissions:
 #   key: u_id
@@ -55,11 +63,84 @@ import json
 #
 # message_count: num_messages
 #
+# Not stored, rebuilt from the channels and dms whenever the store is loaded:
+#
+# channels of each user:
+#   key: u_id
+#   value: set of the channel_ids the user is a member of
+#
+# dms of each user:
+#   key: u_id
+#   value: set of the dm_ids the user is a member of
+#
+# users by handle:
+#   key: handle_str
+#   value: u_id
+#
+# Sessions (the tokens of logged in users) are not part of the store, they
+# are kept by a SessionStore (see src/sessions.py) with its own file,
+# src/json_dump/sessions.log.
+#
+################################################################################
+#
+# Persistence:
+#   data_store.bin holds a binary snapshot of the store (see src/snapshot.py)
+#   and data_store.log holds every mutation made since that snapshot (see
+#   src/persistence.py). A store that only has the older json text dump,
+#   data_store.txt, is loaded from it until the first checkpoint. Methods
+#   that change the store are marked with @mutation, naming the sections of
+#   the store they change, which appends a record of the call to the log.
+#   Callers must go through these methods rather than editing the dicts
+#   returned by the get methods, otherwise the change is lost on restart.
+#
+#   Each Flask request runs as one transaction (see begin/commit), so all of
+#   its mutations are made durable together, before the response is sent when
+#   DURABILITY is 'commit'. Records are written by the log's own writer thread
+#   (write-behind), and flush waits for everything queued to be written.
+#
+#   A background thread checkpoints the store into a new snapshot, which keeps
+#   the log that has to be replayed on startup short.
+#
+# Sections:
+#   Each top level section of the store (login, users, channels, ...) is
+#   stored in its own file, src/json_dump/sections/<section>.<version>.bin,
+#   and data_store.bin only lists the version of each. A checkpoint rewrites
+#   just the sections changed since the last one, so a burst of profile
+#   changes rewrites the users section and nothing else. Logins and logouts
+#   only write to the sessions file.
+#
+#   The message_ids section (the MessageLocator) is an array instead, kept in
+#   src/json_dump/sections/message_ids.<version>.idx. Like a slot table, a
+#   checkpoint appends the entries of new messages to it, and data_store.bin
+#   lists its version and length ('locator').
+#
+# Message segments:
+#   The messages of each channel/dm are not part of the snapshot. Each history
+#   is a binary MessageLog in src/json_dump/messages: an append-only data file,
+#   <id>.dat, holding the text of its messages, and a slot table of typed
+#   columns (offset, message_id, u_id, time_created), <id>.<version>.slots,
+#   which is only loaded the first time the history is accessed. The snapshot
+#   lists the table version and length of every history ('slots'); a
+#   checkpoint flushes the histories changed since the last one and appends the
+#   rows of their new messages to their tables, or writes a table under a new
+#   version if one of its saved slots has changed, before switching the
+#   snapshot over to them. Snapshots from before the slot tables listed offset
+#   indexes, <id>.<version>.idx, instead ('segments'), which are converted to
+#   slot tables when the store is loaded.
+#
+#   Only the messages of the requested page are read from the data file, and
+#   messages of removed users are replaced with 'Removed user' as they are read,
+#   so admin_user_remove never has to rewrite a history.
+#
 ################################################################################
 
+LOG_PATH = 'src/json_dump/data_store.log'
+SECTIONS_PATH = 'src/json_dump/sections'
+SEGMENTS_PATH = 'src/json_dump/messages'
+SESSIONS_PATH = 'src/json_dump/sessions.log'
+
 initial_object = {
     'login' : {},
-    'token' : {},
     'channels' : {},
     'dms': {},
     'message_ids' : {},
@@ -69,37 +150,351 @@ initial_object = {
     'message_count': 0
 }
 
+# top level sections stored in their own file, messages are stored in segments
+SECTIONS = [section for section in initial_object if section != 'messages']
+
+def mutation(*sections):
+    '''
+    Marks a Datastore method as one that changes the given sections of the
+    store, so each call is applied under the store lock, recorded in the
+    mutation log and the sections are rewritten by the next checkpoint
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def logged_method(self, *args):
+            with self.lock:
+                result = method(self, *args)
+                self.log_mutation(method.__name__, args, sections)
+            return result
+
+        return logged_method
+
+    return decorator
+
 class Datastore:
 
     # Initialisation and Resetting Methods #####################################
     def __init__(self):
-        with open('src/json_dump/data_store.txt', 'r') as FILE:
-            self.__store = json.load(FILE)
+        self.lock = threading.RLock()
+        self.__log = MutationLog(LOG_PATH, DURABILITY, DURABILITY_INTERVAL_MS / 1000, WRITE_QUEUE_SIZE)
+        self.__replaying = False
+        self.__transaction = threading.local()
+
+        # segment version of each message history, and histories changed since
+        # the last checkpoint
+        self.__segments = {}
+        self.__dirty_segments = set()
+
+        # version of the file of each section, and sections changed since the
+        # last checkpoint
+        self.__sections = {}
+        self.__dirty_sections = set()
+
+        # (version, length) of the message locator's file
+        self.__locator = None
+
+        # u_id -> ids of the channels/dms the user is a member of
+        self.__channels_of_user = {}
+        self.__dms_of_user = {}
+
+        self.__users_by_handle = {}
+        self.__handle_suffixes = HandleSuffixes()
+
+        self.__checkpoint_lock = threading.RLock()
+        self.__checkpoint_requested = threading.Event()
+        self.__checkpointer = None
+        self.__last_checkpoint_seconds = None
+        self.__last_checkpoint_sections = None
+        self.__last_recovery_seconds = None
+
+        self.load()
+
+    def load(self):
+        start = time.perf_counter()
+
+        if os.path.exists(SNAPSHOT_PATH):
+            store = read_snapshot(SNAPSHOT_PATH)
+        else:
+            store = read_json_snapshot()
+
+        # seq of the last log record contained in the snapshot
+        self.__log.start_at(store.pop('log_seq', 0))
+        self.__log.num_records = 0
+
+        # sections kept inline (by snapshots from before sections had their own
+        # files) are written to their own files by the next checkpoint
+        self.__sections = store.pop('sections', {})
+        self.__dirty_sections = set(SECTIONS) - set(self.__sections)
+        for section, version in self.__sections.items():
+            store[section] = read_snapshot(section_path(section, version))
+
+        # the tokens of snapshots from before the session store are each their
+        # own session, the sessions file takes them over at the next checkpoint
+        self.__sessions = SessionStore(SESSIONS_PATH, SESSION_TTL, durable=DURABILITY == 'commit')
+        for token, u_id in store.pop('token', {}).items():
+            self.__sessions.restore(token, u_id)
+        self.__sections.pop('token', None)
+
+        store['users'] = load_users(store['users'])
+        store['login'] = load_logins(store['login'])
+
+        # the locator is kept in its own file, older snapshots kept it in the
+        # message_ids section
+        self.__locator = store.pop('locator', None)
+        if self.__locator is not None:
+            store['message_ids'] = MessageLocator.load(locator_path(self.__locator[0]), self.__locator[1])
+        else:
+            message_ids = store['message_ids']
+            store['message_ids'] = load_message_locator(message_ids)
+            self.__sections.pop('message_ids', None)
+
+        # only message histories kept inline (by snapshots from before segments)
+        # or as offset indexes (from before slot tables) are loaded up front.
+        # The oldest snapshots only listed the version of each index, which
+        # they covered all of.
+        self.__segments = store.pop('slots', {})
+        indexes = {
+            id: saved if isinstance(saved, tuple) else (saved, None)
+            for id, saved in store.pop('segments', {}).items()
+        }
+        histories = store.pop('messages', {})
+        self.__dirty_segments = set(histories) | set(indexes)
+
+        self.__store = {**store, 'messages': {}}
+        for id, messages in histories.items():
+            self.__store['messages'][id] = self.__new_history(id, messages)
+
+        for id, (version, length) in indexes.items():
+            index = read_array('Q', legacy_index_path(id, version), length)
+            self.__store['messages'][id] = MessageLog.from_index(data_path(id), index)
+
+        # message_ids from before the locator do not have slots
+        if self.__locator is None and 'slots' not in message_ids:
+            self.__locate_messages()
+
+        self.__index_members()
+        self.replay_log()
+
+        self.__last_recovery_seconds = time.perf_counter() - start
 
     def hard_reset(self):
-        # replace json dump with a fresh copy of datastore
-        with open('src/json_dump/data_store.txt', 'w') as FILE:
-            json.dump(
-            {
-                'login' : {},
-                'token' : {},
-                'channels' : {},
-                'dms': {},
-                'message_ids' : {},
-                'messages' : {},
-                'users': {},
-                'perms' : {},
-                'message_count': 0
-            }, 
-            FILE
-            )
-
-        # re initialise the datastore
-        self.__init__()
-
-    def update_json(self):
-        with open('src/json_dump/data_store.txt', 'w') as FILE:
-            json.dump(self.__store, FILE)
+        with self.__checkpoint_lock, self.lock:
+            # replace the snapshot with a fresh copy of datastore
+            write_snapshot(SNAPSHOT_PATH, encode_snapshot(initial_object))
+            self.__log.truncate()
+            self.__sessions.clear()
+            shutil.rmtree(SECTIONS_PATH, ignore_errors=True)
+            shutil.rmtree(SEGMENTS_PATH, ignore_errors=True)
+            self.__last_checkpoint_seconds = None
+            self.__last_checkpoint_sections = None
+
+            # re initialise the datastore
+            self.load()
+
+    def __locate_messages(self):
+        locator = self.__store['message_ids']
+        for id in set(self.__segments) | set(self.__store['messages']):
+            message_log = self.__get_message_log(id)
+            for slot, offset in enumerate(message_log.index):
+                if offset != TOMBSTONE:
+                    locator.set(message_log.message_id_at(slot), id, slot)
+
+        self.__dirty_sections.add('message_ids')
+
+    # rebuilds the indexes of users and memberships that are not stored, the
+    # mutations keep them up to date from then on
+    def __index_members(self):
+        self.__users_by_handle = {user.handle_str: u_id for u_id, user in self.__store['users'].items() if user.handle_str}
+        self.__handle_suffixes.clear()
+
+        self.__channels_of_user = {}
+        self.__dms_of_user = {}
+
+        for channel_id, channel in self.__store['channels'].items():
+            channel['owner_members'] = member_u_ids(channel['owner_members'])
+            channel['all_members'] = member_u_ids(channel['all_members'])
+            for u_id in channel['all_members']:
+                self.__channels_of_user.setdefault(u_id, set()).add(channel_id)
+
+        for dm_id, dm in self.__store['dms'].items():
+            dm['details']['members'] = member_u_ids(dm['details']['members'])
+            for u_id in dm['details']['members']:
+                self.__dms_of_user.setdefault(u_id, set()).add(dm_id)
+
+    def __free_handle(self, handle):
+        self.__users_by_handle.pop(handle, None)
+        self.__handle_suffixes.free(handle)
+
+    # Persistence ##############################################################
+
+    def replay_log(self):
+        self.__replaying = True
+        try:
+            for op, args in self.__log.replay():
+                getattr(self, op)(*args)
+        finally:
+            self.__replaying = False
+
+    def log_mutation(self, op, args, sections=()):
+        self.__dirty_sections.update(sections)
+        if self.__replaying:
+            return
+
+        seq = self.__log.append(op, args)
+
+        # inside a transaction the record is made durable by commit
+        if getattr(self.__transaction, 'active', False):
+            self.__transaction.seq = seq
+        else:
+            self.__log.sync(seq)
+
+        if self.__checkpointer is None:
+            self.start_checkpointer()
+        if self.__log.num_records >= CHECKPOINT_LOG_RECORDS:
+            self.__checkpoint_requested.set()
+
+    def begin(self):
+        '''
+        Starts a transaction for the current thread. Mutations made before the
+        matching commit are logged but only made durable together by commit.
+        '''
+        self.__transaction.active = True
+        self.__transaction.seq = 0
+
+    def commit(self):
+        '''
+        Ends the current thread's transaction, making all of its mutations
+        durable with (at most) one shared fsync
+        '''
+        seq = getattr(self.__transaction, 'seq', 0)
+        self.__transaction.active = False
+        self.__transaction.seq = 0
+
+        if seq:
+            self.__log.sync(seq)
+
+    def flush(self):
+        '''
+        Blocks until every mutation made so far has been written to the log
+        and fsynced, whatever the durability level
+        '''
+        self.__log.flush()
+
+    def checkpoint(self):
+        '''
+        Writes a fresh snapshot of the store and drops the log records it
+        contains, so recovery only has to replay records made after it
+        '''
+        with self.__checkpoint_lock:
+            start = time.perf_counter()
+
+            with self.lock:
+                if self.__log.num_records == 0 and not self.__dirty_segments and not self.__dirty_sections:
+                    return
+
+                version = self.__log.seq
+                sections = {
+                    section: encode_snapshot(self.__section_contents(section))
+                    for section in self.__dirty_sections if section != 'message_ids'
+                }
+
+                self.__sections = {**self.__sections, **{section: version for section in sections}}
+                referenced = {section_path(section, version) for section, version in self.__sections.items()}
+
+                # the locator and slot tables are arrays that mostly grow,
+                # only their new entries are written (see src/message_log.py)
+                locator_write = None
+                if 'message_ids' in self.__dirty_sections:
+                    self.__locator, locator_write = array_write(self.__locator, version, self.__store['message_ids'])
+                    sections['message_ids'] = None
+                if self.__locator is not None:
+                    referenced.add(locator_path(self.__locator[0]))
+                self.__dirty_sections = set()
+
+                segments = {id: self.__store['messages'][id] for id in self.__dirty_segments}
+                slots_writes = {}
+                for id, message_log in segments.items():
+                    self.__segments[id], slots_writes[id] = array_write(self.__segments.get(id), version, message_log)
+                self.__dirty_segments = set()
+
+                referenced |= {slots_path(id, slots_version) for id, (slots_version, _) in self.__segments.items()}
+
+                snapshot = encode_snapshot({
+                    'log_seq': version,
+                    'sections': self.__sections,
+                    'locator': self.__locator,
+                    'slots': self.__segments
+                })
+                self.__log.rotate()
+
+            # new mutations go to the fresh log while the snapshot is written, the
+            # records a slot table points at are flushed before the table is written
+            os.makedirs(SECTIONS_PATH, exist_ok=True)
+            for section, contents in sections.items():
+                if contents is not None:
+                    write_snapshot(section_path(section, version), contents)
+
+            if locator_write is not None:
+                write_array(locator_path(self.__locator[0]), *locator_write)
+
+            os.makedirs(SEGMENTS_PATH, exist_ok=True)
+            for id, message_log in segments.items():
+                message_log.flush()
+                write_array(slots_path(id, self.__segments[id][0]), *slots_writes[id])
+
+            # sessions only changed in memory (by the log records replayed on
+            # load) are saved before the log records are discarded
+            self.__sessions.save()
+
+            write_snapshot(SNAPSHOT_PATH, snapshot)
+            self.__log.discard_rotated()
+
+            # remove replaced sections and slot tables, and any left behind by a
+            # checkpoint that did not finish, along with the offset indexes of
+            # older snapshots, which have all been converted by now
+            for name in os.listdir(SECTIONS_PATH):
+                if f'{SECTIONS_PATH}/{name}' not in referenced:
+                    os.remove(f'{SECTIONS_PATH}/{name}')
+
+            for name in os.listdir(SEGMENTS_PATH):
+                path = segment_path_from_name(name)
+                if path.endswith(('.slots', '.idx')) and path not in referenced:
+                    os.remove(path)
+
+            self.__last_checkpoint_seconds = time.perf_counter() - start
+            self.__last_checkpoint_sections = sorted(sections)
+
+    def __section_contents(self, section):
+        if section == 'users':
+            return {u_id: user.dump() for u_id, user in self.__store['users'].items()}
+
+        return self.__store[section]
+
+    # checkpoints run in a background thread of the process that writes to the
+    # store, every CHECKPOINT_INTERVAL seconds or once CHECKPOINT_LOG_RECORDS
+    # records have been logged
+    def start_checkpointer(self):
+        self.__checkpointer = threading.Thread(target=self.__run_checkpointer, daemon=True)
+        self.__checkpointer.start()
+
+    def __run_checkpointer(self):
+        while True:
+            self.__checkpoint_requested.wait(CHECKPOINT_INTERVAL)
+            self.__checkpoint_requested.clear()
+            self.checkpoint()
+
+    def get_persistence_stats(self):
+        return {
+            'backend': 'json',
+            'durability': self.__log.durability,
+            'log_records': self.__log.num_records,
+            'log_syncs': self.__log.num_syncs,
+            'write_queue_depth': self.__log.queue_depth(),
+            'last_flush_lag_seconds': self.__log.last_flush_lag,
+            'last_checkpoint_seconds': self.__last_checkpoint_seconds,
+            'last_checkpoint_sections': self.__last_checkpoint_sections,
+            'last_recovery_seconds': self.__last_recovery_seconds
+        }
 
     # Get Methods ##############################################################
 
@@ -114,21 +509,47 @@ class Datastore:
     def get_login_from_email(self, email):
         return self.get_logins_from_email_dict().get(email)
     
-    # tokens
+    # sessions
 
-    def get_u_ids_from_token_dict(self):
-        return self.__store['token']
+    def get_u_id_from_session(self, session_id):
+        return self.__sessions.get_u_id(session_id)
 
-    def get_u_id_from_token(self, token):
-        return self.get_u_ids_from_token_dict().get(token)
+    def get_num_sessions(self):
+        return len(self.__sessions)
 
     # channels
 
+    # a copy, so it can be iterated while channels are created
     def get_channels_from_channel_id_dict(self):
-        return self.__store['channels']
+        with self.lock:
+            return dict(self.__store['channels'])
+
+    # channel_id -> name of every channel, oldest first
+    def get_channel_names(self):
+        with self.lock:
+            return {channel_id: channel['name'] for channel_id, channel in self.__store['channels'].items()}
 
+    def get_num_channels(self):
+        return len(self.__store['channels'])
+
+    # members are listed in the order they joined
     def get_channel_from_channel_id(self, channel_id):
-        return self.get_channels_from_channel_id_dict().get(channel_id)
+        channel = self.__store['channels'].get(channel_id)
+        if channel is None:
+            return None
+
+        # the members are copied under the lock, as mutations change them in
+        # place
+        with self.lock:
+            owner_members = list(channel['owner_members'])
+            all_members = list(channel['all_members'])
+
+        return {
+            'name': channel['name'],
+            'is_public': channel['is_public'],
+            'owner_members': self.get_users_from_u_ids(owner_members),
+            'all_members': self.get_users_from_u_ids(all_members)
+        }
     
     # dms
 
@@ -136,30 +557,145 @@ class Datastore:
         return self.__store['dms']
 
     def get_dm_from_dm_id(self, dm_id):
-        return self.get_dms_from_dm_id_dict().get(dm_id).get('details')
+        details = self.get_dms_from_dm_id_dict().get(dm_id).get('details')
+        with self.lock:
+            members = list(details['members'])
+
+        return {'name': details['name'], 'members': self.get_users_from_u_ids(members)}
 
     def get_dm_creator_from_dm_id(self, dm_id):
         return self.get_dms_from_dm_id_dict().get(dm_id).get('creator')
 
+    # members
+
+    # channel_id -> name of the channels u_id is a member of, oldest first
+    def get_channel_names_from_u_id(self, u_id):
+        channels = self.__store['channels']
+        with self.lock:
+            channel_ids = list(self.__channels_of_user.get(u_id, ()))
+
+        return {channel_id: channels[channel_id]['name'] for channel_id in sorted(channel_ids)}
+
+    # dm_id -> name of the dms u_id is a member of, oldest first
+    def get_dm_names_from_u_id(self, u_id):
+        dms = self.get_dms_from_dm_id_dict()
+        with self.lock:
+            dm_ids = list(self.__dms_of_user.get(u_id, ()))
+
+        return {dm_id: dms[dm_id]['details']['name'] for dm_id in sorted(dm_ids, reverse=True)}
+
     # messages
 
     def get_channels_or_dms_id_from_message_id_dict(self):
-        return self.__store['message_ids']
+        return dict(self.__store['message_ids'].items())
 
     def get_channel_or_dm_id_from_message_id(self, message_id):
-        return self.get_channels_or_dms_id_from_message_id_dict().get(message_id)
+        location = self.__store['message_ids'].locate(message_id)
+        return None if location is None else location[0]
 
     def get_messages_from_channel_or_dm_id_dict(self):
-        return self.__store['messages']
-  
+        ids = list(self.__store['channels']) + list(self.get_dms_from_dm_id_dict())
+        return {id: self.get_messages_from_channel_or_dm_id(id) for id in ids}
+
+    # every message of the history, most recent first
     def get_messages_from_channel_or_dm_id(self, id):
-        return self.get_messages_from_channel_or_dm_id_dict().get(id)
+        message_log = self.__get_message_log(id)
+        if message_log is None:
+            return None
+
+        return self.get_messages_page_from_channel_or_dm_id(id, 0, len(message_log))
+
+    def get_num_messages_from_channel_or_dm_id(self, id):
+        return len(self.__get_message_log(id))
+
+    # count messages of the history, starting from the start-th most recent
+    def get_messages_page_from_channel_or_dm_id(self, id, start, count):
+        records = self.__get_message_log(id).read_newest_first(start, count)
+        return [self.__message_from_record(record) for record in records]
+
+    def get_num_messages_from_channel_or_dm_id_in_time_range(self, id, time_start, time_end):
+        message_log = self.__get_message_log(id)
+        return message_log.count_between(*message_log.time_range(time_start, time_end))
+
+    # count messages created from time_start to time_end, starting from the
+    # start-th most recent of them
+    def get_messages_page_from_channel_or_dm_id_in_time_range(self, id, time_start, time_end, start, count):
+        message_log = self.__get_message_log(id)
+        first, stop = message_log.time_range(time_start, time_end)
+        records = message_log.read_newest_first(start, count, first, stop)
+        return [self.__message_from_record(record) for record in records]
+
+    # number of messages of the history with an id above message_id
+    def get_num_messages_from_channel_or_dm_id_after_message_id(self, id, message_id):
+        message_log = self.__get_message_log(id)
+        return message_log.count_between(message_log.slot_after(message_id), len(message_log.index))
+
+    # the count most recent messages of the history with an id below message_id
+    def get_messages_page_from_channel_or_dm_id_before_message_id(self, id, message_id, count):
+        message_log = self.__get_message_log(id)
+        records = message_log.read_newest_first(0, count, 0, message_log.slot_after(message_id - 1))
+        return [self.__message_from_record(record) for record in records]
+
+    # the count oldest messages of the history with an id above message_id,
+    # most recent first
+    def get_messages_page_from_channel_or_dm_id_after_message_id(self, id, message_id, count):
+        message_log = self.__get_message_log(id)
+        records = message_log.read_oldest_first(count, message_log.slot_after(message_id))
+        return [self.__message_from_record(record) for record in reversed(records)]
 
     def get_message_from_message_id(self, message_id):
-        channel_or_dm_id = self.get_channel_or_dm_id_from_message_id(message_id)
+        location = self.__store['message_ids'].locate(message_id)
+        if location is None:
+            return None
+
+        channel_or_dm_id, slot = location
+        return self.__message_from_record(self.__get_message_log(channel_or_dm_id).read(slot))
+
+    # loads the slot table of the history the first time it is accessed
+    def __get_message_log(self, id):
+        message_log = self.__store['messages'].get(id)
+        if message_log is not None:
+            return message_log
+
+        if self.is_invalid_channel_id(id) and self.is_invalid_dm_id(id):
+            return None
+
+        with self.lock:
+            if id not in self.__store['messages']:
+                if id in self.__segments:
+                    version, length = self.__segments[id]
+                    self.__store['messages'][id] = MessageLog.load(data_path(id), slots_path(id, version), length)
+                else:
+                    self.__store['messages'][id] = self.__new_history(id)
+
+        return self.__store['messages'][id]
+
+    # new history holding messages (most recent first)
+    def __new_history(self, id, messages=()):
+        message_log = MessageLog(data_path(id))
+        for message in reversed(messages):
+            slot = message_log.append(message['message_id'], message['u_id'], message['message'], message['time_created'])
+            self.__store['message_ids'].set(message['message_id'], id, slot)
+
+        return message_log
+
+    def __message_from_record(self, record):
+        message_id, u_id, text, time_created = record
+        if self.__store['users'][u_id].email == '':
+            text = 'Removed user'
+
+        return {
+            'message_id': message_id,
+            'u_id': u_id,
+            'message': text,
+            'time_created': time_created
+        }
 
-        messages = self.get_messages_from_channel_or_dm_id(channel_or_dm_id)
-        return next((message for message in messages if message['message_id'] == message_id), None)
+    # the message must be newer than every message already in the history
+    def __append_message(self, id, message_id, u_id, text, time_created):
+        slot = self.__get_message_log(id).append(message_id, u_id, text, time_created)
+        self.__store['message_ids'].set(message_id, id, slot)
+        self.__dirty_segments.add(id)
 
     def get_messages_count(self):
         return self.__store['message_count']
@@ -167,10 +703,22 @@ class Datastore:
     # users
 
     def get_users_from_u_id_dict(self):
-        return self.__store['users']
+        # the users are copied under the lock, as registrations add to them
+        with self.lock:
+            users = list(self.__store['users'].items())
+
+        return {u_id: user.to_dict() for u_id, user in users}
 
     def get_user_from_u_id(self, u_id):
-        return self.get_users_from_u_id_dict().get(u_id)
+        user = self.__store['users'].get(u_id)
+        return None if user is None else user.to_dict()
+
+    def get_users_from_u_ids(self, u_ids):
+        users = self.__store['users']
+        return [users[u_id].to_dict() for u_id in u_ids]
+
+    def get_num_users(self):
+        return len(self.__store['users'])
 
     def get_user_perms_from_u_id_dict(self):
         return self.__store['perms']
@@ -179,27 +727,27 @@ class Datastore:
         return self.get_user_perms_from_u_id_dict().get(u_id)
 
     def get_num_streams_owners(self):
-        perms = self.get_user_perms_from_u_id_dict().items()
-        return len([u_id for u_id, perm_id in perms if perm_id == 1])
+        with self.lock:
+            perm_ids = list(self.get_user_perms_from_u_id_dict().values())
+
+        return perm_ids.count(1)
 
     # Check Methods ############################################################
 
-    def is_token_invalid(self, token):
-        if token in self.get_u_ids_from_token_dict():
-            return False
-        return True
+    def is_session_invalid(self, session_id):
+        return self.__sessions.get_u_id(session_id) is None
 
     def is_user_member_of_channel(self, channel_id, u_id):
-        channels = self.get_channels_from_channel_id_dict().get(channel_id)
-        if not any (member['u_id'] == u_id for member in channels['all_members']):
+        channels = self.__store['channels'].get(channel_id)
+        if u_id not in channels['all_members']:
             return False
         
         return True
     
     def is_user_member_of_dm(self, dm_id, u_id):
-        members = self.get_dm_from_dm_id(dm_id).get('members')
+        members = self.get_dms_from_dm_id_dict().get(dm_id)['details']['members']
 
-        if not any (member['u_id'] == u_id for member in members):
+        if u_id not in members:
             return False
         
         return True
@@ -218,21 +766,23 @@ class Datastore:
         return False
 
     def is_invalid_message_id(self, message_id):
-        messages = self.get_channels_or_dms_id_from_message_id_dict()
-        if message_id not in messages:
+        if message_id not in self.__store['message_ids']:
             return True
         
         return False
         
     def is_channel_owner(self, channel_id, u_id):
-        owners = self.get_channels_from_channel_id_dict().get(channel_id).get('owner_members')
-        if not any (member.get('u_id') == u_id for member in owners):
+        owners = self.__store['channels'].get(channel_id).get('owner_members')
+        if u_id not in owners:
             return False
              
         return True   
 
+    def is_channel_public(self, channel_id):
+        return self.__store['channels'].get(channel_id).get('is_public')
+
     def is_channel_only_owner(self, channel_id):
-        channels = self.get_channels_from_channel_id_dict().get(channel_id)
+        channels = self.__store['channels'].get(channel_id)
         if len(channels.get('owner_members')) == 1:
             return True 
         
@@ -262,33 +812,32 @@ class Datastore:
         return False
 
     def is_duplicate_handle(self, handle):
-        users = self.get_users_from_u_id_dict()
-        if any (user.get('handle_str') == handle for user in users.values()):
+        if handle in self.__users_by_handle:
             return True
 
         return False
 
     def is_invalid_user_id(self, u_id):
-        users = self.get_users_from_u_id_dict()
+        users = self.__store['users']
 
         if u_id not in users:
             return True
 
-        if users.get(u_id).get('email') == '':
+        if users.get(u_id).email == '':
             return True
         
         return False
     
     # returns True even if user is removed
     def is_invalid_profile(self, u_id):
-        users = self.get_users_from_u_id_dict()
+        users = self.__store['users']
         if u_id not in users:
             return True
         
         return False
 
     def is_invalid_channel_id(self, channel_id):
-        channels = self.get_channels_from_channel_id_dict()
+        channels = self.__store['channels']
         if channel_id not in channels:
             return True
         
@@ -303,173 +852,374 @@ class Datastore:
 
     # Insertion functions ######################################################
 
+    @mutation('login')
     def insert_login(self, email, password, auth_id):
         self.get_logins_from_email_dict()[email] = {
             'password': password,
             'auth_id': auth_id
         }
-        self.update_json()
 
+    # sessions are written to the sessions file rather than the mutation log
+    def insert_session(self, auth_user_id):
+        '''
+        Starts a session for auth_user_id
+
+        Return value:
+            Returns the session_id of the new session
+        '''
+        return self.__sessions.create(auth_user_id)
+
+    # records of logs from before the session store
     def insert_token(self, token, auth_user_id):
-        self.get_u_ids_from_token_dict()[token] = auth_user_id
-        self.update_json()
+        self.__sessions.restore(token, auth_user_id)
 
+    @mutation('users')
     def insert_user(self, u_id, email, name_first, name_last, handle_str):
-        self.get_users_from_u_id_dict()[u_id] = {
-            'u_id': u_id,
-            'email': email,
-            'name_first': name_first,
-            'name_last': name_last,
-            'handle_str': handle_str
-        }
-        self.update_json()
+        self.__store['users'][u_id] = User(u_id, email, name_first, name_last, handle_str)
+        self.__users_by_handle[handle_str] = u_id
     
+    @mutation('perms')
     def insert_user_perm(self, u_id, global_id):
         self.get_user_perms_from_u_id_dict()[u_id] = global_id
-        self.update_json()
-    
+
+    @mutation('login', 'users', 'perms')
+    def insert_new_users(self, users):
+        '''
+        Registers new users, each given as
+        [email, password, name_first, name_last, base_handle]. Checks the email,
+        allocates the next u_id and a unique handle and inserts each user in
+        one step, so concurrent registrations never share an email or u_id.
+        The first user of the store is its global owner.
+
+        Return value:
+            Returns the u_id of each user, or None for a user whose email is
+            already being used
+        '''
+        logins = self.get_logins_from_email_dict()
+        u_ids = []
+        for email, password, name_first, name_last, base_handle in users:
+            if email in logins:
+                u_ids.append(None)
+                continue
+
+            u_id = len(self.__store['users'])
+            handle_str = self.__handle_suffixes.unique_handle(base_handle, self.is_duplicate_handle)
+
+            user = User(u_id, email, name_first, name_last, handle_str)
+            self.__store['users'][u_id] = user
+            self.__store['perms'][u_id] = stream_owner if u_id == 0 else stream_member
+            self.__users_by_handle[handle_str] = u_id
+            logins[user.email] = {
+                'password': password,
+                'auth_id': u_id
+            }
+            u_ids.append(u_id)
+
+        return u_ids
+
+    @mutation('channels')
     def insert_channel(self, channel_id, channel_name, is_public, messages, owner_members, all_members):
-        self.get_channels_from_channel_id_dict()[channel_id] = {
+        self.__store['channels'][channel_id] = {
             'name': channel_name,
             'is_public': is_public,
-            'owner_members': owner_members,
-            'all_members': all_members,
+            'owner_members': member_u_ids(owner_members),
+            'all_members': member_u_ids(all_members),
         }
+        for u_id in self.__store['channels'][channel_id]['all_members']:
+            self.__channels_of_user.setdefault(u_id, set()).add(channel_id)
 
-        self.get_messages_from_channel_or_dm_id_dict()[channel_id] = messages
-        self.update_json()
+        self.__store['messages'][channel_id] = self.__new_history(channel_id, messages)
+        self.__dirty_segments.add(channel_id)
 
+    @mutation('channels')
     def insert_channel_owner(self, channel_id, u_id):
-        self.get_channel_from_channel_id(channel_id).get('owner_members').append(data_store.get_user_from_u_id(u_id))
+        self.__store['channels'][channel_id]['owner_members'][u_id] = None
+
+    @mutation('channels')
+    def insert_channel_member(self, channel_id, u_id):
+        self.__store['channels'][channel_id]['all_members'][u_id] = None
+        self.__channels_of_user.setdefault(u_id, set()).add(channel_id)
 
+    @mutation('dms')
     def insert_dm(self, creator, dm_id, u_ids, name):
         self.get_dms_from_dm_id_dict()[dm_id] = {
-            'details' : {'name': name, 'members': u_ids},
+            'details' : {'name': name, 'members': member_u_ids(u_ids)},
             'creator' : creator
         }
-        self.get_messages_from_channel_or_dm_id_dict()[dm_id] = []
-        self.update_json()
+        for u_id in self.get_dms_from_dm_id_dict()[dm_id]['details']['members']:
+            self.__dms_of_user.setdefault(u_id, set()).add(dm_id)
+        self.__store['messages'][dm_id] = self.__new_history(dm_id)
+        self.__dirty_segments.add(dm_id)
 
+    @mutation('message_ids')
     def insert_message(self, id, message):
-        self.get_messages_from_channel_or_dm_id(id).insert(0, message)
-        self.get_channels_or_dms_id_from_message_id_dict()[message.get('message_id')] = id
-        self.update_json()
+        self.__append_message(id, message['message_id'], message['u_id'], message['message'], message['time_created'])
+
+    @mutation('message_ids', 'message_count')
+    def insert_new_message(self, id, u_id, text, time_created):
+        '''
+        Allocates the next message_id and appends the message to the history in
+        one step, so histories stay sorted by message_id under concurrent sends
+
+        Return value:
+            Returns the message_id of the new message
+        '''
+        message_id = self.__store['message_count']
+        self.__store['message_count'] += 1
+        self.__append_message(id, message_id, u_id, text, time_created)
+
+        return message_id
 
+    @mutation()
     def update_value(self, dict_key, key, value):
         self.__store[dict_key][key] = value
-        self.update_json()
+        self.__dirty_sections.add(dict_key)
 
     # Remove ###################################################################
 
+    @mutation('message_ids')
     def remove_message(self, message_id):
-        channel_or_dm_id = self.get_channel_or_dm_id_from_message_id(message_id)
-        self.get_messages_from_channel_or_dm_id(channel_or_dm_id).remove(self.get_message_from_message_id(message_id))
-        del self.get_channels_or_dms_id_from_message_id_dict()[message_id]
-        self.update_json()
+        channel_or_dm_id, slot = self.__store['message_ids'].locate(message_id)
+        self.__get_message_log(channel_or_dm_id).remove(slot)
+        self.__store['message_ids'].remove(message_id)
+        self.__dirty_segments.add(channel_or_dm_id)
+
+    @mutation('channels')
+    def remove_channel_member(self, channel_id, u_id):
+        channel = self.__store['channels'][channel_id]
+        channel['all_members'].pop(u_id, None)
+        channel['owner_members'].pop(u_id, None)
+        self.__channels_of_user.get(u_id, set()).discard(channel_id)
+
+    @mutation('dms')
+    def remove_dm_member(self, dm_id, u_id):
+        self.get_dms_from_dm_id_dict()[dm_id]['details']['members'].pop(u_id, None)
+        self.__dms_of_user.get(u_id, set()).discard(dm_id)
 
     # Other ####################################################################
 
+    @mutation()
+    def update_message(self, message_id, text):
+        channel_or_dm_id, slot = self.__store['message_ids'].locate(message_id)
+        self.__get_message_log(channel_or_dm_id).replace_text(slot, text)
+        self.__dirty_segments.add(channel_or_dm_id)
+
+    def invalidate_session(self, session_id):
+        self.__sessions.revoke(session_id)
+
+    def invalidate_user_sessions(self, auth_user_id):
+        self.__sessions.revoke_user(auth_user_id)
+
+    # records of logs from before the session store
     def invalidate_token(self, token):
-        tokens = self.get_u_ids_from_token_dict()
-        del tokens[token]
-        self.update_json()
+        self.__sessions.discard(token)
     
+    @mutation('users')
     def update_name(self, auth_user_id, name_first, name_last):
-        user = self.get_users_from_u_id_dict().get(auth_user_id)
-        user['name_first'] = name_first
-        user['name_last'] = name_last
+        self.__store['users'][auth_user_id].set_name(name_first, name_last)
 
-        self.update_json()
     
+    @mutation('login')
+    def update_password(self, email, password):
+        self.get_login_from_email(email)['password'] = password
+
+    @mutation('users', 'login')
     def update_email(self, auth_user_id, email):
-        user = self.get_users_from_u_id_dict().get(auth_user_id)
+        user = self.__store['users'][auth_user_id]
         login_info = self.get_logins_from_email_dict()
-        old_email = user['email']
 
-        login_info[email] = login_info.pop(old_email)
-        user['email'] = email
+        login_info[email] = login_info.pop(user.email)
+        user.set_email(email)
 
-        self.update_json()
     
+    @mutation('users')
     def update_handle(self, auth_user_id, handle):
-        user = self.get_users_from_u_id_dict().get(auth_user_id)
-        user['handle_str'] = handle
+        user = self.__store['users'][auth_user_id]
+        self.__free_handle(user.handle_str)
+        user.set_handle(handle)
+        self.__users_by_handle[handle] = auth_user_id
 
-        self.update_json()
 
+    @mutation('dms')
     def remove_dm(self, dm_id):
-        dm = self.get_dm_from_dm_id(dm_id)
-        dm['members'] = []
+        members = self.get_dms_from_dm_id_dict()[dm_id]['details']['members']
+        for u_id in members:
+            self.__dms_of_user[u_id].discard(dm_id)
+        members.clear()
 
-        self.update_json()
         
+    @mutation('message_count')
     def increment_message_count(self):
         self.__store['message_count'] += 1
 
     def set(self, store):
+        '''
+        Replaces the whole store. The store is not recorded in the mutation
+        log, it is written by a checkpoint before set returns, so it survives
+        a restart from then on
+
+        Exceptions:
+            TypeError - Occurs when store is not a dictionary
+        '''
         if not isinstance(store, dict):
             raise TypeError('store must be of type dictionary')
-        self.__store = store
+
+        with self.__checkpoint_lock, self.lock:
+            self.__set(store)
+            self.checkpoint()
+
+    def __set(self, store):
+        self.__store = {
+            **{section: contents for section, contents in store.items() if section != 'token'},
+            'users': load_users(store['users']),
+            'login': load_logins(store['login']),
+            'message_ids': MessageLocator(),
+            'messages': {}
+        }
+        for id, messages in store['messages'].items():
+            self.__store['messages'][id] = self.__new_history(id, messages)
+
+        for token, u_id in store.get('token', {}).items():
+            self.__sessions.restore(token, u_id)
+
+        self.__segments = {}
+        self.__dirty_segments = set(self.__store['messages'])
+        self.__index_members()
+
+        # every section, and the locator, are written afresh
+        self.__locator = None
+        self.__dirty_sections = set(SECTIONS)
+        self.__locate_messages()
     
+    @mutation('channels')
     def remove_channel_owner(self, channel_id, u_id):
-        channels = self.get_channels_from_channel_id_dict().get(channel_id)
-        members = channels['owner_members']
-    
-        for person in members:
-            if person['u_id'] == u_id:
-                members.remove(person)
+        self.__store['channels'][channel_id]['owner_members'].pop(u_id, None)
         
-        self.update_json()
 
+    @mutation('login', 'channels', 'dms', 'users', 'perms')
     def admin_user_remove(self, u_id):
-        user = self.get_user_from_u_id(u_id)
+        user = self.__store['users'][u_id]
+
+        # end all sessions, the sessions file already has the end of the
+        # sessions of a removal that is being replayed
+        if self.__replaying:
+            self.__sessions.discard_user(u_id)
+        else:
+            self.__sessions.revoke_user(u_id)
 
         # remove login info
         login = self.get_logins_from_email_dict()
-        email = user['email']
-        del login[email]
-
-        # invalidate all tokens
-        tokens = self.get_u_ids_from_token_dict().items()
-        self.__store['token'] = {token: user_id for token, user_id in tokens if user_id != u_id}
-
-        # loop through channel to delete user from all channels
-        channels = self.get_channels_from_channel_id_dict()
-        for c_id in channels:
-            for member in channels[c_id]['all_members']:
-                if member['u_id'] == u_id:
-                    channels[c_id]['all_members'].remove(member)
-
-            for member in channels[c_id]['owner_members']:
-                if member['u_id'] == u_id:
-                    channels[c_id]['owner_members'].remove(member)
+        del login[user.email]
+
+        # delete user from the channels they are a member of
+        channels = self.__store['channels']
+        for channel_id in self.__channels_of_user.pop(u_id, ()):
+            channels[channel_id]['all_members'].pop(u_id, None)
+            channels[channel_id]['owner_members'].pop(u_id, None)
         
-        # loop through dms to delete user from all dms
+        # delete user from the dms they are a member of
         dms = self.get_dms_from_dm_id_dict()
-        for dm_id in dms:
-            for member in dms[dm_id]['details']['members']:
-                if member['u_id'] == u_id:
-                    dms[dm_id]['details']['members'].remove(member)        
-
-        # replace the users messages
-        messages = data_store.get_messages_from_channel_or_dm_id_dict()
-        for dm_or_channel_id in messages:
-            for message in messages[dm_or_channel_id]:
-                if message['u_id'] == u_id:
-                    message['message'] = 'Removed user'
+        for dm_id in self.__dms_of_user.pop(u_id, ()):
+            dms[dm_id]['details']['members'].pop(u_id, None)
+
+        # the users messages are replaced with 'Removed user' as they are read
 
         # remove user permissions
         del self.get_user_perms_from_u_id_dict()[u_id]
 
         # Update user/profile
-        user['email'] = ''
-        user['name_first'] = 'Removed'
-        user['name_last'] = 'user'
-        user['handle_str'] = ''
+        user.set_email('')
+        user.set_name('Removed', 'user')
+        self.__free_handle(user.handle_str)
+        user.set_handle('')
+
+
+def section_path(section, version):
+    return f'{SECTIONS_PATH}/{section}.{version}.bin'
+
+def data_path(id):
+    return f'{SEGMENTS_PATH}/{id}.dat'
+
+def slots_path(id, version):
+    return f'{SEGMENTS_PATH}/{id}.{version}.slots'
+
+# offset index of a snapshot from before slot tables
+def legacy_index_path(id, version):
+    return f'{SEGMENTS_PATH}/{id}.{version}.idx'
+
+def segment_path_from_name(name):
+    return f'{SEGMENTS_PATH}/{name}'
+
+def locator_path(version):
+    return f'{SECTIONS_PATH}/message_ids.{version}.idx'
+
+def array_write(saved, version, entries):
+    '''
+    Works out how a checkpoint saves the entries of a MessageLog slot table or a
+    MessageLocator that are not in its file yet
+
+    Arguments:
+        saved   (tuple)     - (version, length) of the file holding the entries,
+                            None if there is no file yet
+        version (int)       - version of the checkpoint
+        entries (object)    - MessageLog or MessageLocator
+
+    Return value:
+        Returns ((version, length) of the file once it is written, (offset,
+        contents) to pass to write_array)
+    '''
+    if saved is None:
+        entries.saved.stale = True
+
+    offset, contents = entries.unsaved()
+    length = entries.saved.length
+
+    # the whole array goes to a new version of the file
+    if offset is None or saved is None:
+        return (version, length), (None, contents)
+
+    return (saved[0], length), (offset, contents)
+
+def write_array(path, offset, contents):
+    if offset is None:
+        write_snapshot(path, contents)
+    elif contents:
+        write_at(path, offset, contents)
+
+# users section as stored in the snapshot, u_id -> User tuple (or user dict,
+# in older snapshots)
+def load_users(users):
+    return {u_id: User.load(user) for u_id, user in users.items()}
+
+# shares each email with the User it belongs to
+def load_logins(logins):
+    return {sys.intern(email): login for email, login in logins.items()}
+
+# members of a channel or dm as they are stored, from a list of users (older
+# snapshots and the arguments of the mutations) or the u_ids of a stored one
+def member_u_ids(members):
+    if isinstance(members, dict):
+        return dict.fromkeys(members)
+
+    return dict.fromkeys(member['u_id'] for member in members)
+
+# message_ids section as stored in the snapshot, older snapshots kept a dict of
+# message_id -> channel_id or dm_id
+def load_message_locator(message_ids):
+    if 'slots' in message_ids:
+        return MessageLocator.from_columns(message_ids['conversations'], message_ids['slots'])
+
+    locator = MessageLocator()
+    for message_id, channel_or_dm_id in message_ids.items():
+        locator.set(message_id, channel_or_dm_id, -1)
 
-        self.update_json()
+    return locator
 
 print('Loading Datastore...')
 
 global data_store
-data_store = Datastore()
+if DATASTORE_BACKEND == 'sqlite':
+    from src.sqlite_data_store import SqliteDatastore
+    data_store = SqliteDatastore()
+else:
+    data_store = Datastore()
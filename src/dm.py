@@ -1,8 +1,10 @@
+import math
+
 from src.data_store import data_store
 
 from src.error import InputError
 from src.error import AccessError
-from src.other import check_type
+from src.other import check_type, messages_page_with_cursors
 
 from src.data_store import data_store
 
@@ -33,15 +35,13 @@ def dm_create_v1(auth_id, u_ids):
     check_type(auth_id, int)
     check_type(u_ids, list)
 
-    user_info = data_store.get_users_from_u_id_dict()
-
     if any (data_store.is_invalid_user_id(u_id) for u_id in u_ids):
         raise InputError ('an u_id in u_ids does not refer to a valid user')
 
     # Obtaining the handle_strs for all members in channel
     u_ids.append(auth_id)
-    handle_str_list = sorted([user_info.get(u_id).get('handle_str') for u_id in u_ids])
     user_list = [data_store.get_user_from_u_id(u_id) for u_id in u_ids]
+    handle_str_list = sorted([user.get('handle_str') for user in user_list])
 
     # Creating the channel name and dm_id (ALL DM_ID ARE NEGATIVE AND START AT -1)
     dm_name = ', '.join(handle_str_list)
@@ -98,14 +98,13 @@ def dm_list_v1(auth_id):
 
     check_type(auth_id, int)
 
-    dm_dict = data_store.get_dms_from_dm_id_dict().items()
+    dm_names = data_store.get_dm_names_from_u_id(auth_id).items()
 
     dms = [ {
                 'dm_id': dm_id,
-                'name': dm['details']['name']
+                'name': name
             }
-            for dm_id, dm in dm_dict
-            if data_store.is_user_member_of_dm(dm_id, auth_id)
+            for dm_id, name in dm_names
           ]
 
     return { 'dms': dms }
@@ -151,8 +150,7 @@ def dm_messages_v1(auth_id, dm_id, start):
     if start < 0:
         raise InputError('start is a negative integer')
 
-    messages = data_store.get_messages_from_channel_or_dm_id(dm_id)
-    num_messages = len(messages)
+    num_messages = data_store.get_num_messages_from_channel_or_dm_id(dm_id)
 
     if start > num_messages:
         raise InputError('start is greater than the total number of messages in the channel')
@@ -161,11 +159,127 @@ def dm_messages_v1(auth_id, dm_id, start):
     end = start + 50 if start + 50 < num_messages else -1
     
     return {
-        'messages' : messages[start: start + 50],
+        'messages' : data_store.get_messages_page_from_channel_or_dm_id(dm_id, start, 50),
         'start': start,
         'end' : end
         }
 
+def dm_messages_v2(auth_id, dm_id, start=None, before=None, after=None):
+    '''
+    Returns up to 50 messages from a given DM that the authorised user has
+    access to, from index 'start' like dm_messages_v1, or from either side of a
+    cursor returned by an earlier call. Additionally returns 'start', 'end', and
+    the 'before' and 'after' cursors of the pages either side of this one
+
+    Arguments:
+        auth_id         (int)   - authorized user id
+        dm_id           (int)   - unique dm id
+        start           (int)   - message index (most recent message has index 0),
+                                or None
+        before          (str)   - cursor, returns the messages older than it,
+                                or None
+        after           (str)   - cursor, returns the messages newer than it,
+                                or None
+
+    Exceptions:
+        TypeError   - occurs when auth_id, dm_id, start are not ints or before,
+                    after are not strs
+        InputError  - dm_id does not refer to a valid DM
+        AccessError - dm_id is valid and the authorised user is not a member of the DM
+        InputError  - occurs when more than one of start, before and after is given
+        InputError  - occurs when a cursor is invalid
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the total number of messages
+                    in the DM
+
+    Return value:
+        Returns { messages, start, end, before, after } on success
+        Returns { messages, start, -1, None, after } if the function has returned
+        the least recent message
+    '''
+    check_type(auth_id, int)
+    check_type(dm_id, int)
+    if start is not None:
+        check_type(start, int)
+    if before is not None:
+        check_type(before, str)
+    if after is not None:
+        check_type(after, str)
+
+    if data_store.is_invalid_dm_id(dm_id):
+        raise InputError ('dm_id does not refer to valid DM')
+
+    if not data_store.is_user_member_of_dm(dm_id, auth_id):
+        raise AccessError ('dm_id is valid and the authorised user is not a member of the DM')
+
+    return messages_page_with_cursors(dm_id, start, before, after)
+
+def dm_messages_range_v1(auth_id, dm_id, time_start, time_end, start):
+    '''
+    Returns up to 50 of the messages of a given DM that the authorised user has
+    access to that were created from time_start to time_end, starting from the
+    'start'-th most recent of them. Additionally returns 'start', and
+    'end' = 'start' + 50
+
+    Arguments:
+        auth_id         (int)   - authorized user id
+        dm_id           (int)   - unique dm id
+        time_start      (float) - unix timestamp of the oldest messages to return
+        time_end        (float) - unix timestamp of the newest messages to return,
+                                None for every message since time_start
+        start           (int)   - message index within the range (most recent
+                                message in the range has index 0)
+
+    Exceptions:
+        TypeError   - occurs when auth_id, dm_id, start are not ints or
+                    time_start, time_end are not floats
+        InputError  - dm_id does not refer to a valid DM
+        AccessError - dm_id is valid and the authorised user is not a member of the DM
+        InputError  - occurs when time_end is before time_start
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the number of messages in
+                    the range
+
+    Return value:
+        Returns { messages, start, end } on success
+        Returns { messages, start, -1 } if the function has returned the least
+        recent message in the range
+    '''
+    check_type(auth_id, int)
+    check_type(dm_id, int)
+    check_type(time_start, float)
+    if time_end is not None:
+        check_type(time_end, float)
+    check_type(start, int)
+
+    if data_store.is_invalid_dm_id(dm_id):
+        raise InputError ('dm_id does not refer to valid DM')
+
+    if not data_store.is_user_member_of_dm(dm_id, auth_id):
+        raise AccessError ('dm_id is valid and the authorised user is not a member of the DM')
+
+    if time_end is None:
+        time_end = math.inf
+
+    if time_end < time_start:
+        raise InputError('time_end is before time_start')
+
+    if start < 0:
+        raise InputError('start is a negative integer')
+
+    num_messages = data_store.get_num_messages_from_channel_or_dm_id_in_time_range(dm_id, time_start, time_end)
+
+    if start > num_messages:
+        raise InputError('start is greater than the number of messages in the time range')
+
+    end = start + 50 if start + 50 < num_messages else -1
+
+    return {
+        'messages': data_store.get_messages_page_from_channel_or_dm_id_in_time_range(dm_id, time_start, time_end, start, 50),
+        'start': start,
+        'end': end
+    }
+
 def dm_leave_v1(auth_id, dm_id):
     '''
     dm/leave/v1
@@ -195,9 +309,7 @@ def dm_leave_v1(auth_id, dm_id):
     if not data_store.is_user_member_of_dm(dm_id, auth_id):
         raise AccessError ('dm_id is valid and the authorised user is not a member of the DM')
 
-    dm = data_store.get_dm_from_dm_id(dm_id)
-    
-    dm['members'] = [user for user in dm.get('members') if user.get('u_id') != auth_id]
+    data_store.remove_dm_member(dm_id, auth_id)
 
     return {}
 
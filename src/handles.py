@@ -0,0 +1,64 @@
+######### HANDLE SUFFIXES ######################################################
+#
+# A handle that is already taken gets the lowest free numeric suffix, so the
+# registrations of three John Smiths get johnsmith, johnsmith0 and johnsmith1.
+#
+# HandleSuffixes remembers, for each base handle, a suffix below which every
+# suffix is known to be taken. Generating a handle starts from there instead
+# of trying every suffix again, and freeing a handle (by changing it or
+# removing its user) lowers the counter of any base it could have come from.
+# The counters are only a hint, so they are kept in memory and start from 0
+# again after a restart.
+#
+# Every suffix the counter proposes is still checked with is_taken, which the
+# datastores call under their write lock. With the sqlite backend several
+# processes can share a database, each with its own counters: one that is
+# behind only tries a few more suffixes, and two processes never hand out the
+# same handle, as the second checks after the first has committed. A suffix
+# freed by another process is not reused by this one until its next restart.
+#
+################################################################################
+
+class HandleSuffixes:
+
+    def __init__(self):
+        self.__next_suffix = {}
+
+    def unique_handle(self, base_handle, is_taken):
+        '''
+        Returns base_handle, or base_handle with the lowest suffix that makes it
+        unique
+
+        Arguments:
+            base_handle (str)       - handle to make unique
+            is_taken    (function)  - returns whether a handle is taken
+        '''
+        if not is_taken(base_handle):
+            return base_handle
+
+        suffix = self.__next_suffix.get(base_handle, 0)
+        while is_taken(base_handle + str(suffix)):
+            suffix += 1
+
+        self.__next_suffix[base_handle] = suffix
+        return base_handle + str(suffix)
+
+    def free(self, handle):
+        '''
+        Records that handle is no longer taken
+        '''
+        # every way of reading handle as a base followed by a suffix
+        for split in range(len(handle) - 1, 0, -1):
+            digits = handle[split:]
+            if not (digits.isascii() and digits.isdigit()):
+                break
+
+            if digits != '0' and digits.startswith('0'):
+                continue
+
+            base_handle = handle[:split]
+            if self.__next_suffix.get(base_handle, 0) > int(digits):
+                self.__next_suffix[base_handle] = int(digits)
+
+    def clear(self):
+        self.__next_suffix = {}
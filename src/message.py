@@ -40,17 +40,7 @@ def message_send_v1(auth_user_id, channel_id, message):
         raise InputError('message has invalid length')
 
     # message ids will start from 0
-    message_id = data_store.get_messages_count()
-    data_store.increment_message_count()
-
-    message_dict = {
-        'message_id': message_id,
-        'u_id': auth_user_id,
-        'message': message,
-        'time_created': datetime.utcnow().timestamp()
-    }
-
-    data_store.insert_message(channel_id, message_dict)
+    message_id = data_store.insert_new_message(channel_id, auth_user_id, message, datetime.utcnow().timestamp())
 
     return { 'message_id': message_id}
 
@@ -89,17 +79,7 @@ def message_senddm_v1(auth_user_id, dm_id, message):
         raise InputError('message has invalid length')
 
     # message ids will start from 0
-    message_id = data_store.get_messages_count()
-    data_store.increment_message_count()
-
-    message_dict = {
-        'message_id': message_id,
-        'u_id': auth_user_id,
-        'message': message,
-        'time_created': datetime.utcnow().timestamp()
-    }
-
-    data_store.insert_message(dm_id, message_dict)
+    message_id = data_store.insert_new_message(dm_id, auth_user_id, message, datetime.utcnow().timestamp())
 
     return { 'message_id' : message_id }
 
@@ -175,16 +155,12 @@ def message_edit_v1(auth_user_id, message_id, message):
         or data_store.is_stream_owner(auth_user_id)): 
         raise AccessError
 
-    messages = data_store.get_messages_from_channel_or_dm_id(id)
-
     if len(message) > 1000:
         raise InputError
 
     if message == '':
         data_store.remove_message(message_id)
-    
-    for original_message in messages:
-        if original_message.get('message_id') == message_id:
-            original_message['message'] = message
+    else:
+        data_store.update_message(message_id, message)
 
     return {}
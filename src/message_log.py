@@ -0,0 +1,415 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+######### MESSAGE LOG ##########################################################
+#
+# Binary storage for the message history of a single channel or dm.
+#
+# data file (<id>.dat):
+#   append-only message records, each a fixed size header
+#       message_id (int64), u_id (int64), time_created (float64), length (uint32)
+#   followed by `length` bytes of utf-8 message text. The data file is the text
+#   arena of the history, everything else about a message is in its columns.
+#
+# columns:
+#   every message of the history has a slot, oldest first, and each column is a
+#   typed array with one entry per slot
+#       index           offset of the record of the message (uint64)
+#       message_ids     message_id (int64)
+#       u_ids           u_id of the sender (int64)
+#       times_created   time_created (float64)
+#   A message keeps its slot for good: editing it appends a new record and
+#   points the slot at it, removing it replaces the offset with TOMBSTONE. The
+#   slot of every message is kept by the MessageLocator, so finding, editing or
+#   removing a message never searches the history. A message costs 32 bytes of
+#   columns, and questions about who sent what and when are answered from the
+#   columns alone, without reading a single record.
+#
+# slot table (<id>.<version>.slots):
+#   the columns side by side, one row of four 8 byte entries per slot, as they
+#   are saved by checkpoints.
+#
+# Records appended since the last flush (checkpoint) are kept in memory, so a
+# process that only reads the store never writes to the data file. Flushed
+# records are read by slicing the memory mapped data file, and only the
+# messages of the requested page are ever turned into dicts.
+#
+# A checkpoint appends the rows added since the last one to the end of the
+# slot table, so sending a message costs the same however long the history
+# is. The snapshot records how many rows of the file it covers. Only once an
+# already saved offset changes (an edit or removal) is the whole table written
+# again, to a new version.
+#
+################################################################################
+
+RECORD_HEADER = struct.Struct('<qqdI')
+
+# offset of the slot of a removed message
+TOMBSTONE = 2 ** 64 - 1
+
+# entries in a row of the slot table
+SLOT_WIDTH = 4
+
+class MessageLog:
+
+    def __init__(self, data_path, index=None, message_ids=None, u_ids=None, times_created=None):
+        self.data_path = data_path
+        self.index = index if index is not None else array('Q')
+        self.message_ids = message_ids if message_ids is not None else array('q')
+        self.u_ids = u_ids if u_ids is not None else array('q')
+        self.times_created = times_created if times_created is not None else array('d')
+        self.saved = SavedLength(len(self.index))
+
+        # slots of removed messages, sorted
+        self.__removed = removed_slots(self.index)
+
+        self.__flushed_size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        self.__pending = bytearray()
+        self.__map = None
+        self.__lock = threading.Lock()
+
+    # length is the number of rows of the slot table the snapshot covers, or
+    # None for all of them
+    @classmethod
+    def load(cls, data_path, slots_path, length=None):
+        rows = read_array('Q', slots_path, None if length is None else length * SLOT_WIDTH)
+        return cls(
+            data_path,
+            rows[0::SLOT_WIDTH],
+            array('q', rows[1::SLOT_WIDTH].tobytes()),
+            array('q', rows[2::SLOT_WIDTH].tobytes()),
+            array('d', rows[3::SLOT_WIDTH].tobytes())
+        )
+
+    # snapshots from before the slot table only saved the offset index, the
+    # other columns are read from the records once. The records of removed
+    # messages are no longer referenced, so their slots repeat the values of
+    # the slot before them, which keeps the columns sorted (see append).
+    @classmethod
+    def from_index(cls, data_path, index):
+        message_log = cls(data_path, index)
+        message_id, u_id, time_created = -1, -1, 0.0
+
+        for offset in index:
+            if offset != TOMBSTONE:
+                message_id, u_id, record_time_created, _ = message_log.__read_header(offset)
+                time_created = max(time_created, record_time_created)
+
+            message_log.message_ids.append(message_id)
+            message_log.u_ids.append(u_id)
+            message_log.times_created.append(time_created)
+
+        message_log.saved.stale = True
+        return message_log
+
+    # number of messages in the history
+    def __len__(self):
+        return len(self.index) - len(self.__removed)
+
+    # number of messages in slots first to stop (not included)
+    def count_between(self, first, stop):
+        removed = bisect.bisect_left(self.__removed, stop) - bisect.bisect_left(self.__removed, first)
+        return stop - first - removed
+
+    # Reading ##################################################################
+
+    def read(self, slot):
+        '''
+        Returns (message_id, u_id, text, time_created) of the message in slot
+        '''
+        with self.__lock:
+            offset = self.index[slot]
+            length = self.__read_header(offset)[3]
+            text = self.__read_bytes(offset + RECORD_HEADER.size, length).decode()
+
+        return self.message_ids[slot], self.u_ids[slot], text, self.times_created[slot]
+
+    def read_newest_first(self, start, count, first=0, stop=None):
+        '''
+        Returns the records of up to count messages, starting from the start-th
+        most recent message, of the messages in slots first to stop (not
+        included), all of them by default
+        '''
+        stop = len(self.index) if stop is None else stop
+        records = []
+        slot = self.__slot_of_newest(start, first, stop)
+
+        while slot >= first and len(records) < count:
+            if self.index[slot] != TOMBSTONE:
+                records.append(self.read(slot))
+            slot -= 1
+
+        return records
+
+    def read_oldest_first(self, count, first):
+        '''
+        Returns the records of up to count messages from slot first on, oldest
+        first
+        '''
+        records = []
+        slot = first
+
+        while slot < len(self.index) and len(records) < count:
+            if self.index[slot] != TOMBSTONE:
+                records.append(self.read(slot))
+            slot += 1
+
+        return records
+
+    def message_id_at(self, slot):
+        return self.message_ids[slot]
+
+    # slot of the first message with an id above message_id, whether or not
+    # message_id is still in the history, by binary search of message_ids
+    def slot_after(self, message_id):
+        return bisect.bisect_right(self.message_ids, message_id)
+
+    def time_range(self, time_start, time_end):
+        '''
+        Returns the slots (first, stop) of the messages created from time_start
+        to time_end, both included, by binary search of times_created
+        '''
+        return (
+            bisect.bisect_left(self.times_created, time_start),
+            bisect.bisect_right(self.times_created, time_end)
+        )
+
+    # slot of the start-th most recent message below stop, or first - 1 if
+    # there are not that many from first on
+    def __slot_of_newest(self, start, first, stop):
+        if start >= self.count_between(first, stop):
+            return first - 1
+
+        if not self.__removed:
+            return stop - 1 - start
+
+        # the highest slot with start + 1 messages from it up to stop
+        low, high = first, stop - 1
+        while low < high:
+            slot = (low + high + 1) // 2
+            if self.count_between(slot, stop) >= start + 1:
+                low = slot
+            else:
+                high = slot - 1
+
+        return low
+
+    # Writing ##################################################################
+
+    # returns the slot of the message. The times of a history never go back, so
+    # times_created stays sorted for time_range: a message stamped before the
+    # one appended ahead of it (by a concurrent send) takes that one's time.
+    def append(self, message_id, u_id, text, time_created):
+        if self.times_created:
+            time_created = max(time_created, self.times_created[-1])
+
+        self.index.append(self.__write_record(message_id, u_id, text, time_created))
+        self.message_ids.append(message_id)
+        self.u_ids.append(u_id)
+        self.times_created.append(time_created)
+        return len(self.index) - 1
+
+    def replace_text(self, slot, text):
+        self.index[slot] = self.__write_record(self.message_ids[slot], self.u_ids[slot], text, self.times_created[slot])
+        self.saved.changed(slot)
+
+    def remove(self, slot):
+        self.index[slot] = TOMBSTONE
+        bisect.insort(self.__removed, slot)
+        self.saved.changed(slot)
+
+    def flush(self):
+        '''
+        Durably writes the records appended since the last flush to the end of
+        the data file
+        '''
+        with self.__lock:
+            records = bytes(self.__pending)
+            offset = self.__flushed_size
+
+        if not records:
+            return
+
+        with open(self.data_path, 'ab') as FILE:
+            FILE.truncate(offset)
+            FILE.write(records)
+            FILE.flush()
+            os.fsync(FILE.fileno())
+
+        with self.__lock:
+            del self.__pending[:len(records)]
+            self.__flushed_size += len(records)
+
+    def unsaved(self):
+        '''
+        Returns (offset, contents) of the rows of the slot table a checkpoint
+        has to write, like SavedLength.unsaved
+        '''
+        start = self.saved.unsaved_start(len(self.index))
+        rows = self.__rows(start or 0)
+        return None if start is None else start * SLOT_WIDTH * rows.itemsize, rows.tobytes()
+
+    # rows of the slot table from slot start on, the columns are interleaved
+    # by reinterpreting each as uint64
+    def __rows(self, start):
+        rows = array('Q', bytes((len(self.index) - start) * SLOT_WIDTH * 8))
+        rows[0::SLOT_WIDTH] = self.index[start:]
+        rows[1::SLOT_WIDTH] = array('Q', self.message_ids[start:].tobytes())
+        rows[2::SLOT_WIDTH] = array('Q', self.u_ids[start:].tobytes())
+        rows[3::SLOT_WIDTH] = array('Q', self.times_created[start:].tobytes())
+        return rows
+
+    # returns the offset the record will have in the data file
+    def __write_record(self, message_id, u_id, text, time_created):
+        encoded = text.encode()
+
+        with self.__lock:
+            offset = self.__flushed_size + len(self.__pending)
+            self.__pending += RECORD_HEADER.pack(message_id, u_id, time_created, len(encoded))
+            self.__pending += encoded
+
+        return offset
+
+    def __read_header(self, offset):
+        return RECORD_HEADER.unpack(self.__read_bytes(offset, RECORD_HEADER.size))
+
+    def __read_bytes(self, offset, size):
+        if offset >= self.__flushed_size:
+            start = offset - self.__flushed_size
+            return bytes(self.__pending[start:start + size])
+
+        if self.__map is None or offset + size > len(self.__map):
+            self.__remap()
+
+        return self.__map[offset:offset + size]
+
+    def __remap(self):
+        with open(self.data_path, 'rb') as FILE:
+            self.__map = mmap.mmap(FILE.fileno(), 0, access=mmap.ACCESS_READ)
+
+def read_array(typecode, path, length=None):
+    entries = array(typecode)
+    with open(path, 'rb') as FILE:
+        entries.frombytes(FILE.read() if length is None else FILE.read(length * entries.itemsize))
+
+    return entries
+
+class SavedLength:
+    '''
+    Number of entries at the start of an array that are already in its file.
+    A checkpoint only has to append the entries added since, unless one of the
+    saved entries has changed, in which case the whole array is written again.
+    '''
+
+    def __init__(self, length=0):
+        self.length = length
+        self.stale = False
+
+    def changed(self, position):
+        if position < self.length:
+            self.stale = True
+
+    def unsaved(self, entries):
+        '''
+        Returns (offset, contents) of the bytes a checkpoint has to write to the
+        file of entries, offset is None when contents is the whole array and
+        has to go to a new file
+        '''
+        start = self.unsaved_start(len(entries))
+        if start is None:
+            return None, entries.tobytes()
+
+        return start * entries.itemsize, entries[start:].tobytes()
+
+    def unsaved_start(self, length):
+        '''
+        Returns the position of the first entry a checkpoint has to write, None
+        when the whole array has to be written again, and records that the
+        first length entries are saved
+        '''
+        start = None if self.stale or self.length == 0 else self.length
+        self.length = length
+        self.stale = False
+        return start
+
+def removed_slots(index):
+    tombstone = TOMBSTONE.to_bytes(8, 'little')
+    contents = index.tobytes()
+
+    removed = []
+    position = contents.find(tombstone)
+    while position != -1:
+        if position % 8 == 0:
+            removed.append(position // 8)
+        position = contents.find(tombstone, position + 1)
+
+    return removed
+
+class MessageLocator:
+    '''
+    Array backed map of message_id -> (channel_or_dm_id, slot). Message ids are
+    handed out densely from message_count, so the message_id is the position
+    in the array and a lookup is a single array access. The array holds the
+    channel_or_dm_id and slot of each message_id side by side, and is saved
+    like a message index: new messages are appended to its file.
+    '''
+
+    # conversation of a message_id that is not in any history
+    NONE = 0
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else array('q')
+        self.saved = SavedLength(len(self.entries))
+
+    # length is the number of entries of the file the snapshot covers
+    @classmethod
+    def load(cls, path, length=None):
+        return cls(read_array('q', path, length))
+
+    # snapshots from before the locator had its own file kept a column of
+    # conversations and a column of slots in the message_ids section
+    @classmethod
+    def from_columns(cls, conversations, slots):
+        entries = array('q', bytes(len(conversations) * 2))
+        entries[0::2] = array('q', conversations)
+        entries[1::2] = array('q', slots)
+        return cls(entries)
+
+    def __contains__(self, message_id):
+        return 0 <= message_id < len(self.entries) // 2 and self.entries[2 * message_id] != self.NONE
+
+    def locate(self, message_id):
+        '''
+        Returns (channel_or_dm_id, slot) of message_id, or None if it is not in
+        any history
+        '''
+        if message_id not in self:
+            return None
+
+        return self.entries[2 * message_id], self.entries[2 * message_id + 1]
+
+    def set(self, message_id, channel_or_dm_id, slot):
+        missing = message_id + 1 - len(self.entries) // 2
+        if missing > 0:
+            self.entries.extend(array('q', [self.NONE, -1]) * missing)
+
+        self.entries[2 * message_id] = channel_or_dm_id
+        self.entries[2 * message_id + 1] = slot
+        self.saved.changed(2 * message_id)
+
+    def remove(self, message_id):
+        self.entries[2 * message_id] = self.NONE
+        self.entries[2 * message_id + 1] = -1
+        self.saved.changed(2 * message_id)
+
+    def items(self):
+        for message_id, channel_or_dm_id in enumerate(self.entries[0::2]):
+            if channel_or_dm_id != self.NONE:
+                yield message_id, channel_or_dm_id
+
+    def unsaved(self):
+        return self.saved.unsaved(self.entries)
@@ -1,9 +1,15 @@
 from src.data_store import data_store
+from src.token_cache import token_cache
 import re
 from src.error import AccessError, InputError
 from src.config import SECRET
+from src.records import stream_owner, stream_member
 import jwt
-import hashlib
+import base64
+
+# patterns checked on every registration, compiled once
+EMAIL_PATTERN = re.compile(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$')
+NON_WORD_PATTERN = re.compile(r'\W+')
 
 def clear_v1():
     '''
@@ -16,66 +22,14 @@ def clear_v1():
     Return value:
     Returns nothing on success
     '''
+    data_store.flush()
     data_store.hard_reset()
+    token_cache.clear()
     
     return {}
 
-# helper function to generate handles for auth_register
-def handle_str_generation(firstname, lastname):
-    '''
-    Generates a handle string given a first name and last name
-
-    Arguments:
-        firstname (str), lastname (str)
-    
-    Exceptions:
-        none
-
-    Return value:
-        Returns an unique handle string
-    '''
-
-    check_type(firstname, str)
-    check_type(lastname, str)
-
-    base_handle_str = base_handle_str_generation(firstname, lastname)
-    handle_str = handle_prevent_duplicates(base_handle_str)
-    return handle_str
-
-# Returns a nonduplicate handle_str
-def handle_prevent_duplicates(base_handle_str):
-    '''
-    Given a handle string adds a number at the end to guarantee uniqueness
-
-    Arguments:
-        base_handle_str (str)
-
-    Exceptions:
-        none
-
-    Return value:
-        Returns an unique handle string
-    '''
-    duplicate_count = -1
-    duplicate_exists = True
-    handle_str = base_handle_str
-
-    while duplicate_exists:
-        duplicate_exists = False
-        for user_info in data_store.get_users_from_u_id_dict().values():
-            if handle_str == user_info.get('handle_str'):
-                duplicate_count += 1
-                duplicate_exists = True
-                break
-        
-        handle_str = base_handle_str + str(duplicate_count)
-
-    if duplicate_count > -1:
-        base_handle_str += str(duplicate_count)
-    
-    return base_handle_str
-
-# handle_str_generation helper function
+# helper function to generate handles for auth_register and the import, the
+# datastore makes them unique
 def base_handle_str_generation(firstname, lastname):
     '''
     Given a first and last name returns a nonunique handle_str
@@ -90,7 +44,7 @@ def base_handle_str_generation(firstname, lastname):
         A nonunique handle string (str)
     '''
     base_handle = (firstname + lastname).lower()
-    base_handle = re.sub(r'\W+', '', base_handle)
+    base_handle = NON_WORD_PATTERN.sub('', base_handle)
 
     if len(base_handle) > 20:
         base_handle = base_handle[0:20]
@@ -117,6 +71,61 @@ def check_type(var, var_type):
     if type(var) != var_type:
         raise TypeError 
 
+# helper function to create the token of a new session for auth_user_id
+def new_token(auth_user_id):
+    '''
+    Starts a session for a user and returns its token. The token carries the
+    session_id, so it stops working once the session expires or is ended.
+
+    Argument:
+        auth_user_id (int)
+
+    Return value:
+        Returns the token on success
+    '''
+
+    session_id = data_store.insert_session(auth_user_id)
+
+    return jwt.encode({
+                'auth_user_id': auth_user_id,
+                'session_id': session_id
+                },
+                 SECRET, algorithm='HS256')
+
+# helper function to handle token to session conversion
+# raises an AccessError if token is invalid
+def token_to_session(token):
+    '''
+    Returns the auth_user_id and session_id of a token. Tokens from before
+    sessions had ids are their own session_id.
+
+    Argument:
+        token (str)
+
+    Exceptions:
+        AccessError     - occurs when token is invalid, or its session has
+                          expired or been ended
+
+    Return value:
+        Returns (auth_user_id, session_id) on success
+    '''
+
+    # only tokens that are not in the cache have their signature verified
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            token_dict = jwt.decode(token, SECRET, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            raise AccessError ('Token is invalid')
+
+        claims = (token_dict['auth_user_id'], token_dict.get('session_id', token))
+        token_cache.put(token, claims)
+
+    if data_store.is_session_invalid(claims[1]):
+        raise AccessError ('Token is invalid')
+
+    return claims
+
 # helper function to handle token to auth_id conversion
 # raises an AccessError if token is invalid
 def token_to_auth_id(token):
@@ -124,7 +133,7 @@ def token_to_auth_id(token):
     Returns the corresponding auth_user_id of a token.
 
     Argument: 
-        var (arbitrary type), var_type (type)
+        token (str)
 
     Exceptions:
         AccessError     - occurs when token is invalid
@@ -133,19 +142,110 @@ def token_to_auth_id(token):
         Returns auth_user_id on success
     '''
 
-    if data_store.is_token_invalid(token):
-        raise AccessError ('Token is invalid')
-    # data_store.get_u_id_from_token(token)
-    token_dict = jwt.decode(token, SECRET, algorithms=['HS256'])
-
-    return token_dict['auth_user_id']
-
-def hash_str(string):
-    return hashlib.sha256(string.encode()).hexdigest()
+    return token_to_session(token)[0]
 
 def check_email_valid(email):
-    if not re.fullmatch(r'^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}$', email):
+    if not EMAIL_PATTERN.fullmatch(email):
         raise InputError ('incorrect email format')
 
-stream_owner = 1
-stream_member = 2
+# helper functions for the cursor paginated messages endpoints. A cursor is the
+# message_id a page is anchored on, encoded so that clients treat it as opaque
+def encode_message_cursor(message_id):
+    return base64.urlsafe_b64encode(f'message:{message_id}'.encode()).decode()
+
+def decode_message_cursor(cursor):
+    '''
+    Returns the message_id a cursor is anchored on
+
+    Arguments:
+        cursor (str)
+
+    Exceptions:
+        InputError  - occurs when cursor is not a valid cursor
+
+    Return value:
+        Returns message_id on success
+    '''
+    try:
+        prefix, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        if prefix != 'message':
+            raise ValueError
+
+        # message_ids start from 0, and the sqlite datastore can only bind
+        # ids that fit in 64 bits
+        message_id = int(message_id)
+        if not 0 <= message_id < 2 ** 63:
+            raise ValueError
+        return message_id
+    except ValueError:
+        raise InputError('cursor is invalid') from None
+
+def messages_page_with_cursors(channel_or_dm_id, start, before, after):
+    '''
+    Returns up to 50 messages of a channel or dm, most recent first. The page
+    holds the most recent messages older than the before cursor, the oldest
+    messages newer than the after cursor, or the messages from index start
+    (0 by default). Cursor pages are anchored on a message_id rather than an
+    index, so they neither repeat nor skip messages when messages are sent or
+    removed between requests.
+
+    Arguments:
+        channel_or_dm_id    (int)   - channel_id or dm_id
+        start               (int)   - message index, or None
+        before              (str)   - cursor, or None
+        after               (str)   - cursor, or None
+
+    Exceptions:
+        InputError  - occurs when more than one of start, before and after is given
+        InputError  - occurs when a cursor is invalid
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the total number of messages
+
+    Return value:
+        Returns { messages, start, end, before, after } on success, where start
+        is the index of the first message returned, end is the index after the
+        last one or -1 if it is the least recent message, before is the cursor
+        of the page of older messages (None with end -1) and after is the cursor
+        of the page of newer messages
+    '''
+    if [start, before, after].count(None) < 2:
+        raise InputError('only one of start, before and after can be given')
+
+    num_messages = data_store.get_num_messages_from_channel_or_dm_id(channel_or_dm_id)
+
+    # (newest, oldest) are the message_ids the cursors of an empty page are
+    # anchored on
+    if before is not None:
+        anchor = decode_message_cursor(before)
+        messages = data_store.get_messages_page_from_channel_or_dm_id_before_message_id(channel_or_dm_id, anchor, 50)
+        newest, oldest = anchor - 1, anchor
+    elif after is not None:
+        anchor = decode_message_cursor(after)
+        messages = data_store.get_messages_page_from_channel_or_dm_id_after_message_id(channel_or_dm_id, anchor, 50)
+        newest, oldest = anchor, anchor + 1
+    else:
+        start = 0 if start is None else start
+        if start < 0:
+            raise InputError('start is a negative integer')
+
+        if start > num_messages:
+            raise InputError('start is greater than the total number of messages')
+
+        messages = data_store.get_messages_page_from_channel_or_dm_id(channel_or_dm_id, start, 50)
+        newest, oldest = -1, 0
+
+    if messages:
+        newest, oldest = messages[0]['message_id'], messages[-1]['message_id']
+
+    if start is None:
+        start = data_store.get_num_messages_from_channel_or_dm_id_after_message_id(channel_or_dm_id, newest)
+
+    end = start + len(messages) if start + len(messages) < num_messages else -1
+
+    return {
+        'messages': messages,
+        'start': start,
+        'end': end,
+        'before': None if end == -1 else encode_message_cursor(oldest),
+        'after': encode_message_cursor(newest)
+    }
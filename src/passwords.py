@@ -0,0 +1,122 @@
+import hashlib
+import hmac
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from src.config import PASSWORD_HASH_ITERATIONS, PASSWORD_HASH_QUEUE_SIZE, PASSWORD_HASH_WORKERS
+
+######### PASSWORD HASHING #####################################################
+#
+# Passwords are stored as salted PBKDF2-HMAC-SHA256 hashes:
+#
+#       pbkdf2_sha256$<iterations>$<salt, hex>$<hash, hex>
+#
+# The number of iterations is the work factor (PASSWORD_HASH_ITERATIONS). It
+# is kept in every hash, so it can be raised without breaking the hashes made
+# before, which are upgraded the next time their user logs in. So are the
+# unsalted sha256 hex digests stored before this format.
+#
+# A hash takes tens of milliseconds of CPU, so it runs in a pool of
+# PASSWORD_HASH_WORKERS processes rather than on the thread of the request,
+# which keeps that CPU time out of the server process. The pool is started
+# with the server (see start). At most
+# PASSWORD_HASH_QUEUE_SIZE hashes wait for the pool, any more block their
+# request until one finishes. With no workers, hashes run on the calling
+# thread.
+#
+################################################################################
+
+ALGORITHM = 'pbkdf2_sha256'
+
+SALT_BYTES = 16
+
+def pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), iterations).hex()
+
+# unsalted hashes stored before pbkdf2
+def legacy_hash(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+class PasswordHasher:
+
+    def __init__(self, iterations, workers, queue_size):
+        self.iterations = iterations
+        self.workers = workers
+        self.__pool = None
+        self.__pool_lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(queue_size)
+
+    def hash(self, password):
+        '''
+        Returns the stored form of password, with a new salt
+        '''
+        salt = secrets.token_hex(SALT_BYTES)
+        return f'{ALGORITHM}${self.iterations}${salt}${self.__run(password, salt, self.iterations)}'
+
+    def hash_many(self, passwords):
+        '''
+        Returns the stored forms of a list of passwords, each with a new salt.
+        The pool hashes them in parallel, in chunks so that each worker gets a
+        few chunks
+        '''
+        salts = [secrets.token_hex(SALT_BYTES) for _ in passwords]
+        iterations = [self.iterations] * len(passwords)
+
+        if self.workers == 0 or not passwords:
+            hashes = map(pbkdf2, passwords, salts, iterations)
+        else:
+            chunksize = max(1, len(passwords) // (4 * self.workers))
+            with self.__slots:
+                hashes = list(self.__get_pool().map(pbkdf2, passwords, salts, iterations, chunksize=chunksize))
+
+        return [f'{ALGORITHM}${self.iterations}${salt}${hash}' for salt, hash in zip(salts, hashes)]
+
+    def verify(self, password, stored):
+        '''
+        Checks password against its stored form
+
+        Return value:
+            Returns (matches, upgrade), where upgrade is True when the stored
+            form is a legacy hash or was made with a different work factor
+        '''
+        if '$' not in stored:
+            return hmac.compare_digest(legacy_hash(password), stored), True
+
+        algorithm, iterations, salt, expected = stored.split('$')
+        if algorithm != ALGORITHM:
+            return False, False
+
+        matches = hmac.compare_digest(self.__run(password, salt, int(iterations)), expected)
+        return matches, int(iterations) != self.iterations
+
+    def start(self):
+        '''
+        Starts the pool's processes, which are forked with every open file of
+        the server. Starting them before the server opens its socket keeps
+        them from holding on to it, and to its port, if the server dies.
+        '''
+        if self.workers > 0:
+            self.__get_pool().submit(pbkdf2, '', '', 1).result()
+
+    def shutdown(self):
+        with self.__pool_lock:
+            if self.__pool is not None:
+                self.__pool.shutdown()
+                self.__pool = None
+
+    def __run(self, password, salt, iterations):
+        if self.workers == 0:
+            return pbkdf2(password, salt, iterations)
+
+        with self.__slots:
+            return self.__get_pool().submit(pbkdf2, password, salt, iterations).result()
+
+    # the pool is started by start, or else by the first hash
+    def __get_pool(self):
+        with self.__pool_lock:
+            if self.__pool is None:
+                self.__pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self.__pool
+
+password_hasher = PasswordHasher(PASSWORD_HASH_ITERATIONS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
@@ -0,0 +1,350 @@
+import json
+import os
+import queue
+import threading
+import time
+
+######### MUTATION LOG #########################################################
+#
+# Append-only log of every Datastore mutation made since the last snapshot.
+# Each record is a single json line:
+#   { "seq": sequence number, "op": name of the Datastore method, "args": [ arguments ] }
+#
+# On startup the Datastore loads the snapshot and replays the log on top of it,
+# so a mutation only ever costs one small append instead of a full rewrite of
+# the store.
+#
+# Write-behind:
+#   Appending a record only serialises it and puts it on a bounded queue. A
+#   writer thread takes everything queued, writes it to the log in one go and
+#   fsyncs when asked to, so threads handling requests never touch the disk
+#   themselves. Once queue_size records are waiting, append blocks until the
+#   writer catches up (backpressure).
+#
+# Group commit:
+#   sync(seq) queues a sync request and waits for the writer to fsync every
+#   record up to seq. All the sync requests the writer finds in one batch
+#   share a single fsync, so many concurrent commits cost a handful of fsyncs
+#   between them.
+#
+# Durability levels (see DURABILITY in src/config.py):
+#   'commit'   - sync(seq) blocks until seq is fsynced
+#   'interval' - sync(seq) returns straight away and the writer fsyncs the log
+#                every sync_interval seconds
+#   'os'       - sync(seq) returns straight away and the log is only fsynced
+#                by checkpoints and flush, leaving the rest to the OS
+#   Snapshots are always written to a temporary file, fsynced and renamed
+#   over the old one, whatever the level.
+#
+# Checkpoints:
+#   A checkpoint rotates the log to data_store.log.old, writes a new snapshot
+#   recording the seq of the last record it contains, then deletes the rotated
+#   log. Replay skips records already contained in the snapshot, so a crash at
+#   any point of a checkpoint never applies a record twice or loses one.
+#
+################################################################################
+
+DURABILITY_LEVELS = ['commit', 'interval', 'os']
+
+# queued in place of a record to ask the writer for an fsync
+SYNC = None
+
+class MutationLog:
+
+    def __init__(self, path, durability='commit', sync_interval=0.1, queue_size=10000):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'durability must be one of {DURABILITY_LEVELS}')
+
+        self.path = path
+        self.durability = durability
+        self.sync_interval = sync_interval
+        self.rotated_path = path + '.old'
+        self.seq = 0
+        self.num_records = 0
+        self.num_syncs = 0
+        self.last_flush_lag = None
+
+        # __lock orders appends, __file_lock guards the file the writer writes to
+        self.__lock = threading.Lock()
+        self.__file_lock = threading.Lock()
+        self.__file = None
+
+        # (seq, record or SYNC, time queued)
+        self.__queue = queue.Queue(queue_size)
+        self.__writer = None
+
+        self.__written_seq = 0
+        self.__synced_seq = 0
+        self.__error = None
+        self.__progress = threading.Condition()
+
+    def append(self, op, args):
+        '''
+        Queues a single mutation record to be appended to the end of the log.
+        The record is not durable until sync has been called with its seq.
+
+        Arguments:
+            op      (str)   - name of the Datastore method that was applied
+            args    (tuple) - arguments the method was called with
+
+        Return value:
+            Returns the seq of the record
+        '''
+        with self.__lock:
+            if self.__writer is None:
+                self.__writer = threading.Thread(target=self.__run_writer, daemon=True)
+                self.__writer.start()
+
+            self.seq += 1
+            record = json.dumps({'seq': self.seq, 'op': op, 'args': list(args)}) + '\n'
+
+            # records must be queued in seq order
+            self.__queue.put((self.seq, record, time.perf_counter()))
+            self.num_records += 1
+            return self.seq
+
+    def sync(self, seq):
+        '''
+        Makes every record up to seq durable as required by the durability
+        level. With 'commit' this blocks until the writer has fsynced them.
+
+        Arguments:
+            seq     (int)   - seq of the last record that must be durable
+
+        Exceptions:
+            OSError - occurs when the writer failed to write the log
+
+        Return value:
+            Returns nothing on success
+        '''
+        if self.durability == 'commit':
+            self.__request_sync(seq)
+
+    def flush(self):
+        '''
+        Blocks until every record appended so far has been written and fsynced,
+        whatever the durability level
+        '''
+        if self.__writer is not None:
+            self.__request_sync(self.seq)
+
+    def queue_depth(self):
+        return self.__queue.qsize()
+
+    def start_at(self, seq):
+        '''
+        Starts numbering new records after seq, the seq of the last record
+        already on disk (in a snapshot)
+        '''
+        with self.__progress:
+            self.seq = seq
+            self.__written_seq = seq
+            self.__synced_seq = seq
+
+    def replay(self):
+        '''
+        Yields (op, args) for every complete record newer than self.seq, first
+        from a rotated log left behind by an unfinished checkpoint and then from
+        the log itself. A partially written final record (from a crash
+        mid-append) is ignored.
+        '''
+        for path in [self.rotated_path, self.path]:
+            if not os.path.exists(path):
+                continue
+
+            with open(path, 'r') as FILE:
+                for line in FILE:
+                    if not line.endswith('\n'):
+                        break
+                    record = json.loads(line)
+                    if record['seq'] > self.seq:
+                        self.seq = record['seq']
+                        self.num_records += 1
+                        yield record['op'], record['args']
+
+        # the replayed records are already on disk, so rotate and truncate
+        # must not wait for a writer to write them
+        with self.__progress:
+            self.__written_seq = max(self.__written_seq, self.seq)
+            self.__synced_seq = max(self.__synced_seq, self.seq)
+
+    def rotate(self):
+        '''
+        Moves the current records aside so a checkpoint can snapshot them while
+        new records go to a fresh log. Records rotated by a checkpoint that did
+        not finish are kept. The caller must stop new appends until it returns.
+        '''
+        self.__wait_until_written(self.seq)
+
+        with self.__file_lock:
+            self.__close()
+            rotated_seq = self.__written_seq
+
+            if os.path.exists(self.path) and os.path.exists(self.rotated_path):
+                with open(self.path, 'r') as LOG, open(self.rotated_path, 'a') as ROTATED:
+                    ROTATED.write(LOG.read())
+                os.remove(self.path)
+            elif os.path.exists(self.path):
+                os.replace(self.path, self.rotated_path)
+
+            self.num_records = 0
+
+        # closing the log fsynced everything that was rotated
+        with self.__progress:
+            self.__synced_seq = max(self.__synced_seq, rotated_seq)
+            self.__progress.notify_all()
+
+    def discard_rotated(self):
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def truncate(self):
+        '''
+        Empties the log. The caller must stop new appends until it returns.
+        '''
+        # records queued before the truncate must not end up in the new log
+        self.__wait_until_written(self.seq)
+
+        with self.__file_lock:
+            self.__close()
+            self.discard_rotated()
+            with open(self.path, 'w'):
+                pass
+            self.seq = 0
+            self.num_records = 0
+
+        with self.__progress:
+            self.__written_seq = 0
+            self.__synced_seq = 0
+
+    def __request_sync(self, seq):
+        self.__queue.put((seq, SYNC, time.perf_counter()))
+
+        with self.__progress:
+            # records from before a truncate no longer need syncing
+            while self.__synced_seq < min(seq, self.seq):
+                if self.__error is not None:
+                    raise self.__error
+                self.__progress.wait()
+
+    def __wait_until_written(self, seq):
+        with self.__progress:
+            while self.__written_seq < seq and self.__error is None:
+                self.__progress.wait()
+
+    def __run_writer(self):
+        last_sync = time.perf_counter()
+
+        while True:
+            batch = self.__take_batch()
+            records = [item for item in batch if item[1] is not SYNC]
+
+            needs_sync = any(item[1] is SYNC for item in batch)
+            if (self.durability == 'interval' and time.perf_counter() - last_sync >= self.sync_interval
+                and (records or self.__synced_seq < self.__written_seq)):
+                needs_sync = True
+
+            try:
+                with self.__file_lock:
+                    if records:
+                        if self.__file is None:
+                            self.__open()
+                        self.__file.write(''.join(record for _, record, _ in records))
+                        self.__file.flush()
+
+                    if needs_sync and self.__file is not None:
+                        os.fsync(self.__file.fileno())
+                        self.num_syncs += 1
+                    written_seq = records[-1][0] if records else self.__written_seq
+            except OSError as error:
+                with self.__progress:
+                    self.__error = error
+                    self.__progress.notify_all()
+                continue
+
+            with self.__progress:
+                self.__written_seq = max(self.__written_seq, written_seq)
+                if needs_sync:
+                    self.__synced_seq = max(self.__synced_seq, self.__written_seq)
+                    last_sync = time.perf_counter()
+                if records:
+                    self.last_flush_lag = time.perf_counter() - records[0][2]
+                self.__progress.notify_all()
+
+    # blocks for the next queued item, then takes everything else queued with it
+    def __take_batch(self):
+        timeout = self.sync_interval if self.durability == 'interval' else None
+        try:
+            batch = [self.__queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < self.__queue.maxsize:
+            try:
+                batch.append(self.__queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    # only the process that writes to the log opens it, so that other processes
+    # reading the datastore never modify the files
+    def __open(self):
+        self.__discard_torn_tail()
+        self.__file = open(self.path, 'a')
+
+    def __close(self):
+        if self.__file is not None:
+            os.fsync(self.__file.fileno())
+            self.__file.close()
+            self.__file = None
+
+    def __discard_torn_tail(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'rb+') as FILE:
+            contents = FILE.read()
+            if contents and not contents.endswith(b'\n'):
+                FILE.truncate(contents.rfind(b'\n') + 1)
+
+def write_snapshot(path, contents):
+    '''
+    Atomically replaces the file at path with contents, so a crash part way
+    through never leaves a truncated snapshot behind
+
+    Arguments:
+        path        (str)           - snapshot file to replace
+        contents    (str or bytes)  - serialised store
+
+    Return value:
+        Returns nothing on success
+    '''
+    temp_path = path + '.tmp'
+
+    with open(temp_path, 'wb' if isinstance(contents, bytes) else 'w') as FILE:
+        FILE.write(contents)
+        FILE.flush()
+        os.fsync(FILE.fileno())
+
+    os.replace(temp_path, path)
+
+def write_at(path, offset, contents):
+    '''
+    Durably writes contents into the file at path from offset on, dropping
+    anything after offset that a write which did not finish left behind
+
+    Arguments:
+        path        (str)   - existing file
+        offset      (int)   - position of the first byte to write
+        contents    (bytes) - bytes to write
+
+    Return value:
+        Returns nothing on success
+    '''
+    with open(path, 'rb+') as FILE:
+        FILE.truncate(offset)
+        FILE.seek(offset)
+        FILE.write(contents)
+        FILE.flush()
+        os.fsync(FILE.fileno())
@@ -0,0 +1,58 @@
+import sys
+
+######### RECORDS ##############################################################
+#
+# Compact in-memory records of the Datastore. A record keeps its fields in
+# __slots__ rather than a per-instance dict, and interns its strings, so the
+# many users called John share one 'John' and a user's email is the same
+# string as its login key. Records never leave the Datastore: the get methods
+# turn them into the dicts of the API, and snapshots store them as tuples,
+# which the snapshot format can load without running any code.
+#
+################################################################################
+
+# global permission ids, the first user registered is the stream owner
+stream_owner = 1
+stream_member = 2
+
+class User:
+
+    __slots__ = ('u_id', 'email', 'name_first', 'name_last', 'handle_str')
+
+    def __init__(self, u_id, email, name_first, name_last, handle_str):
+        self.u_id = u_id
+        self.email = sys.intern(email)
+        self.name_first = sys.intern(name_first)
+        self.name_last = sys.intern(name_last)
+        self.handle_str = sys.intern(handle_str)
+
+    # from a stored tuple, or a user dict of an older snapshot
+    @classmethod
+    def load(cls, user):
+        if isinstance(user, dict):
+            return cls(user['u_id'], user['email'], user['name_first'], user['name_last'], user['handle_str'])
+
+        return cls(*user)
+
+    def dump(self):
+        return (self.u_id, self.email, self.name_first, self.name_last, self.handle_str)
+
+    # matches 'user' type
+    def to_dict(self):
+        return {
+            'u_id': self.u_id,
+            'email': self.email,
+            'name_first': self.name_first,
+            'name_last': self.name_last,
+            'handle_str': self.handle_str
+        }
+
+    def set_name(self, name_first, name_last):
+        self.name_first = sys.intern(name_first)
+        self.name_last = sys.intern(name_last)
+
+    def set_email(self, email):
+        self.email = sys.intern(email)
+
+    def set_handle(self, handle_str):
+        self.handle_str = sys.intern(handle_str)
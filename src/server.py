@@ -1,31 +1,35 @@
 from re import T
 import sys
 import signal
-from json import dumps
+from json import dumps, loads
 from flask import Flask, request
 from flask_cors import CORS
 from src import config
 
 from src.user import user_profile_v1, users_all_v1, user_setname_v1, user_setemail_v1, user_sethandle_v1
 from src.channels import channels_listall_v1, channels_list_v1, channels_create_v1
-from src.auth import auth_login_v1, auth_register_v1, auth_logout_v1
-from src.dm import dm_create_v1, dm_details_v1, dm_leave_v1, dm_list_v1, dm_remove_v1, dm_details_v1, dm_create_v1, dm_messages_v1
-from src.channel import channel_invite_v1, channel_messages_v1, channel_details_v1, channel_leave_v1, channel_addowner_v1, channel_removeowner_v1, channel_join_v1
+from src.auth import auth_login_v1, auth_register_v1, auth_logout_v1, auth_logout_all_v1
+from src.dm import dm_create_v1, dm_details_v1, dm_leave_v1, dm_list_v1, dm_remove_v1, dm_details_v1, dm_create_v1, dm_messages_v1, dm_messages_v2, dm_messages_range_v1
+from src.channel import channel_invite_v1, channel_messages_v1, channel_messages_v3, channel_messages_range_v1, channel_details_v1, channel_leave_v1, channel_addowner_v1, channel_removeowner_v1, channel_join_v1
 from src.message import message_send_v1, message_senddm_v1, message_remove_v1, message_edit_v1
 
 from src.data_store import data_store
 from src.error import InputError
 from src.other import clear_v1
-from src.other import token_to_auth_id
-from src.config import SECRET
+from src.other import token_to_auth_id, new_token
+from src.config import IMPORT_USERS_MAX
 
 from src.admin import admin_userpermission_change_v1
 from src.admin import admin_user_remove_v1
+from src.admin import admin_stats_v1
+from src.admin import admin_users_import_v1
+from src.passwords import password_hasher
 
-import jwt 
 
 def quit_gracefully(*args):
     '''For coverage'''
+    # mutations still waiting for the log writer would otherwise be lost
+    data_store.flush()
     exit(0)
 
 def defaultHandler(err):
@@ -45,6 +49,19 @@ CORS(APP)
 APP.config['TRAP_HTTP_EXCEPTIONS'] = True
 APP.register_error_handler(Exception, defaultHandler)
 
+# the password hashing processes are forked before APP.run opens the socket
+password_hasher.start()
+
+# every request is one datastore transaction, committed before responding
+@APP.before_request
+def begin_transaction():
+    data_store.begin()
+
+@APP.after_request
+def commit_transaction(response):
+    data_store.commit()
+    return response
+
 #### NO NEED TO MODIFY ABOVE THIS POINT, EXCEPT IMPORTS
 
 ###################### Auth ######################
@@ -85,15 +102,7 @@ def register_ep():
     auth_id_dict = auth_register_v1(email, password, name_first, name_last)
     auth_id = auth_id_dict.get('auth_user_id')
     
-    token = jwt.encode({
-                'auth_user_id': auth_id,
-                'token_count': len(data_store.get_u_ids_from_token_dict())
-                },
-                 SECRET, algorithm='HS256')
-
-    data_store.insert_token(token, auth_id)
-
-    return {'token': token, 'auth_user_id': auth_id}
+    return {'token': new_token(auth_id), 'auth_user_id': auth_id}
 
 # Auth login
 @APP.route('/auth/login/v2', methods = ['POST'])
@@ -141,6 +150,24 @@ def logout_endpt():
     token_to_auth_id(token)
     return auth_logout_v1(token)
 
+# Auth logout of every session
+@APP.route('/auth/logout/all/v1', methods = ['POST'])
+def logout_all_endpt():
+    '''
+    Given a valid token, invalidates every token of its user for future use
+    
+    Arguments:
+        token           (str) - unique user token
+        
+    Exceptions:
+        AccessError - Token is invalid
+        
+    Returns {} when successful
+    '''
+
+    token = request.get_json(force = True).get('token')
+    return auth_logout_all_v1(token)
+
 
 ###################### Channels ######################
 # Channel create
@@ -247,6 +274,97 @@ def channel_messages_ep():
 
     return channel_messages_v1(auth_user_id, int(channel_id), int(start))
 
+@APP.route('/channel/messages/v3', methods = ['GET'])
+def channel_messages_v3_ep():
+    '''
+    Returns up to 50 messages from a given channel that the authorised user has
+    access to, from index 'start' like channel/messages/v2, or from either side
+    of a cursor returned by an earlier call. Additionally returns 'start', 'end',
+    and the 'before' and 'after' cursors of the pages either side of this one
+
+    Arguments:
+        token           (str)   - unique user token
+        channel_id      (int)   - unique channel id
+        start           (int)   - message index, optional
+        before          (str)   - cursor, returns the messages older than it,
+                                optional
+        after           (str)   - cursor, returns the messages newer than it,
+                                optional
+
+    Exceptions:
+        InputError  - occurs when channel_id is invalid
+        AccessError - occurs when the authorised user is not a member of the channel
+        InputError  - occurs when more than one of start, before and after is given
+        InputError  - occurs when a cursor is invalid
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the total number of messages
+                    in the channel
+
+    Return value:
+        Returns { messages, start, end, before, after } on success
+        Returns { messages, start, -1, None, after } if the function has returned
+        the least recent message
+    '''
+
+    token = request.args.get('token')
+    auth_user_id = token_to_auth_id(token)
+    channel_id = request.args.get('channel_id')
+    start = request.args.get('start')
+
+    return channel_messages_v3(
+        auth_user_id,
+        int(channel_id),
+        None if start is None else int(start),
+        request.args.get('before'),
+        request.args.get('after')
+    )
+
+@APP.route('/channel/messages/range/v1', methods = ['GET'])
+def channel_messages_range_ep():
+    '''
+    Returns up to 50 of the messages of a given channel that the authorised user
+    has access to that were created from time_start to time_end, starting from
+    the 'start'-th most recent of them. Additionally returns 'start', and
+    'end' = 'start' + 50
+
+    Arguments:
+        token           (str)   - unique user token
+        channel_id      (int)   - unique channel id
+        time_start      (float) - unix timestamp of the oldest messages to return
+        time_end        (float) - unix timestamp of the newest messages to return,
+                                optional, every message since time_start if missing
+        start           (int)   - message index within the range, optional,
+                                defaults to 0
+
+    Exceptions:
+        InputError  - occurs when channel_id is invalid
+        AccessError - occurs when the authorised user is not a member of the channel
+        InputError  - occurs when time_end is before time_start
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the number of messages in
+                    the range
+
+    Return value:
+        Returns { messages, start, end } on success
+        Returns { messages, start, -1 } if the function has returned the least
+        recent message in the range
+    '''
+
+    token = request.args.get('token')
+    auth_user_id = token_to_auth_id(token)
+    channel_id = request.args.get('channel_id')
+    time_start = request.args.get('time_start')
+    time_end = request.args.get('time_end')
+    start = request.args.get('start', 0)
+
+    return channel_messages_range_v1(
+        auth_user_id,
+        int(channel_id),
+        float(time_start),
+        None if time_end is None else float(time_end),
+        int(start)
+    )
+
 @APP.route('/channel/leave/v1', methods = ['POST'])
 def channel_leave_endpt():
     '''
@@ -789,6 +907,97 @@ def dm_messages_endpt():
 
     return dm_messages_v1(auth_id, int(dm_id), int(start))
 
+@APP.route("/dm/messages/v2", methods=['GET'])
+def dm_messages_v2_endpt():
+    '''
+    Returns up to 50 messages from a given DM that the authorised user has
+    access to, from index 'start' like dm/messages/v1, or from either side of a
+    cursor returned by an earlier call. Additionally returns 'start', 'end', and
+    the 'before' and 'after' cursors of the pages either side of this one
+
+    Arguments:
+        token           (str)   - unique user token
+        dm_id           (int)   - unique dm id
+        start           (int)   - message index, optional
+        before          (str)   - cursor, returns the messages older than it,
+                                optional
+        after           (str)   - cursor, returns the messages newer than it,
+                                optional
+
+    Exceptions:
+        InputError  - dm_id does not refer to a valid DM
+        AccessError - dm_id is valid and the authorised user is not a member of the DM
+        InputError  - occurs when more than one of start, before and after is given
+        InputError  - occurs when a cursor is invalid
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the total number of messages
+                    in the DM
+
+    Return value:
+        Returns { messages, start, end, before, after } on success
+        Returns { messages, start, -1, None, after } if the function has returned
+        the least recent message
+    '''
+
+    token = request.args.get('token')
+    auth_id = token_to_auth_id(token)
+    dm_id = request.args.get('dm_id')
+    start = request.args.get('start')
+
+    return dm_messages_v2(
+        auth_id,
+        int(dm_id),
+        None if start is None else int(start),
+        request.args.get('before'),
+        request.args.get('after')
+    )
+
+@APP.route("/dm/messages/range/v1", methods=['GET'])
+def dm_messages_range_endpt():
+    '''
+    Returns up to 50 of the messages of a given DM that the authorised user has
+    access to that were created from time_start to time_end, starting from the
+    'start'-th most recent of them. Additionally returns 'start', and
+    'end' = 'start' + 50
+
+    Arguments:
+        token           (str)   - unique user token
+        dm_id           (int)   - unique dm id
+        time_start      (float) - unix timestamp of the oldest messages to return
+        time_end        (float) - unix timestamp of the newest messages to return,
+                                optional, every message since time_start if missing
+        start           (int)   - message index within the range, optional,
+                                defaults to 0
+
+    Exceptions:
+        InputError  - dm_id does not refer to a valid DM
+        AccessError - dm_id is valid and the authorised user is not a member of the DM
+        InputError  - occurs when time_end is before time_start
+        InputError  - occurs when start is negative
+        InputError  - occurs when start is greater than the number of messages in
+                    the range
+
+    Return value:
+        Returns { messages, start, end } on success
+        Returns { messages, start, -1 } if the function has returned the least
+        recent message in the range
+    '''
+
+    token = request.args.get('token')
+    auth_id = token_to_auth_id(token)
+    dm_id = request.args.get('dm_id')
+    time_start = request.args.get('time_start')
+    time_end = request.args.get('time_end')
+    start = request.args.get('start', 0)
+
+    return dm_messages_range_v1(
+        auth_id,
+        int(dm_id),
+        float(time_start),
+        None if time_end is None else float(time_end),
+        int(start)
+    )
+
 @APP.route("/message/senddm/v1", methods=['POST'])
 def message_senddm_endpt():
     '''
@@ -937,11 +1146,75 @@ def admin_user_remove_v1_endpt():
 
     return {}
 
+@APP.route("/admin/stats/v1", methods=['GET'])
+def admin_stats_v1_endpt():
+    '''
+    Returns internal statistics about the Streams server.
+
+    Arguments:
+        token           (str) - unique user token
+
+    Exceptions:
+        AccessError - Occurs when token is invalid
+        AccessError - Occurs when the authorised user is not a global owner
+
+    Return Value:
+        Returns {persistence, token_cache} on success
+    '''
+    token = request.args.get('token')
+    auth_id = token_to_auth_id(token)
+
+    return admin_stats_v1(auth_id)
+
+@APP.route("/admin/users/import/v1", methods=['POST'])
+def admin_users_import_v1_endpt():
+    '''
+    Registers a batch of users, sent either as JSON {token, users} or as an
+    NDJSON stream (Content-Type application/x-ndjson) of one user per line,
+    with the token in the query string.
+
+    Arguments:
+        token           (str)  - unique user token
+        users           (list) - dicts of {email, password, name_first, name_last}
+
+    Exceptions:
+        AccessError - Occurs when token is invalid
+        AccessError - Occurs when the authorised user is not a global owner
+        InputError  - Occurs when users is not a list, or has too many rows
+
+    Return Value:
+        Returns {users} on success, with the result of each row
+    '''
+    if request.mimetype != 'application/x-ndjson':
+        import_details = request.get_json(force = True)
+        auth_id = token_to_auth_id(import_details.get('token'))
+        return admin_users_import_v1(auth_id, import_details.get('users'))
+
+    # the token is checked before the stream is read
+    auth_id = token_to_auth_id(request.args.get('token'))
+
+    # rows past IMPORT_USERS_MAX are never read
+    users = []
+    for line in request.stream:
+        if not line.strip():
+            continue
+        if len(users) == IMPORT_USERS_MAX:
+            raise InputError (f'users has more than {IMPORT_USERS_MAX} rows')
+
+        # a line that is not JSON is a row that is not a user
+        try:
+            users.append(loads(line))
+        except ValueError:
+            users.append(None)
+
+    return admin_users_import_v1(auth_id, users)
+
 
 
 #### NO NEED TO MODIFY BELOW THIS POINT
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, quit_gracefully) # For coverage
+    signal.signal(signal.SIGTERM, quit_gracefully)
     APP.run(port=config.port) # Do not edit this port
     
\ No newline at end of file
@@ -0,0 +1,240 @@
+import heapq
+import os
+import secrets
+import threading
+import time
+
+from src.persistence import write_snapshot
+
+######### SESSION STORE ########################################################
+#
+# Sessions of logged in users, kept apart from the rest of the Datastore so
+# that logins and logouts never touch the mutation log or a snapshot section.
+#
+# A session has a short random id (16 url-safe characters), the u_id of its
+# user and the time it expires, ttl seconds after it was created. Tokens carry
+# the session id (see src/other.py), and a session that has expired or been
+# revoked no longer lets its token through. Expiry times are kept in a
+# min-heap, so each new session drops the ones that have expired since the
+# last without looking at the others. The session ids of each user are
+# indexed by u_id, so ending all of a user's sessions only touches theirs.
+#
+# sessions file (sessions.log):
+#   one line per change, written and flushed as it is made
+#       + <session_id> <u_id> <expires_at>      created
+#       - <session_id>                          revoked
+#   Expired sessions are dropped when the file is loaded, and once the file
+#   holds many more lines than live sessions it is rewritten with just the
+#   live ones. A line cut short by a crash is ignored.
+#
+# Changes made with restore and discard (while loading or replaying the
+# Datastore) are only made in memory, and written by the next save or the
+# next change that is written.
+#
+################################################################################
+
+SESSION_ID_BYTES = 12
+
+# lines the sessions file can hold before it is rewritten, at least
+COMPACT_LINES = 1024
+
+class SessionStore:
+
+    def __init__(self, path, ttl, durable=True, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.durable = durable
+        self.clock = clock
+
+        # session_id -> (u_id, expires_at)
+        self.__sessions = {}
+        # u_id -> set of session_ids
+        self.__user_sessions = {}
+        # (expires_at, session_id) of every session created
+        self.__expiry = []
+
+        self.__lines = 0
+        self.unsaved = False
+        self.__lock = threading.Lock()
+
+        self.load()
+
+    def load(self):
+        with self.__lock:
+            self.__sessions = {}
+            self.__lines = 0
+            self.unsaved = False
+
+            if os.path.exists(self.path):
+                with open(self.path) as FILE:
+                    for line in FILE:
+                        self.__lines += 1
+                        self.__apply(line)
+
+            now = self.clock()
+            self.__sessions = {
+                session_id: (u_id, expires_at)
+                for session_id, (u_id, expires_at) in self.__sessions.items()
+                if expires_at > now
+            }
+            self.__expiry = [(expires_at, session_id) for session_id, (_, expires_at) in self.__sessions.items()]
+            heapq.heapify(self.__expiry)
+
+            self.__user_sessions = {}
+            for session_id, (u_id, _) in self.__sessions.items():
+                self.__user_sessions.setdefault(u_id, set()).add(session_id)
+
+    def __apply(self, line):
+        if not line.endswith('\n'):
+            return
+
+        fields = line.split()
+        if fields[:1] == ['+'] and len(fields) == 4:
+            self.__sessions[fields[1]] = (int(fields[2]), float(fields[3]))
+        elif fields[:1] == ['-'] and len(fields) == 2:
+            self.__sessions.pop(fields[1], None)
+
+    # Reading ##################################################################
+
+    def get_u_id(self, session_id):
+        '''
+        Returns the u_id of the user of a live session, or None if session_id
+        has expired, been revoked or never existed
+        '''
+        session = self.__sessions.get(session_id)
+        if session is None or session[1] <= self.clock():
+            return None
+
+        return session[0]
+
+    def __len__(self):
+        now = self.clock()
+        return sum(1 for _, expires_at in self.__sessions.values() if expires_at > now)
+
+    # Writing ##################################################################
+
+    def create(self, u_id):
+        '''
+        Starts a session for u_id
+
+        Return value:
+            Returns the session_id of the new session
+        '''
+        with self.__lock:
+            self.__expire()
+
+            session_id = secrets.token_urlsafe(SESSION_ID_BYTES)
+            while session_id in self.__sessions:
+                session_id = secrets.token_urlsafe(SESSION_ID_BYTES)
+
+            expires_at = self.clock() + self.ttl
+            self.__add(session_id, u_id, expires_at)
+            self.__write(f'+ {session_id} {u_id} {expires_at!r}\n')
+
+        return session_id
+
+    def revoke(self, session_id):
+        with self.__lock:
+            if self.__remove(session_id):
+                self.__write(f'- {session_id}\n')
+
+    def revoke_user(self, u_id):
+        '''
+        Ends every session of u_id
+
+        Return value:
+            Returns the number of sessions ended
+        '''
+        with self.__lock:
+            session_ids = self.__remove_user(u_id)
+            if session_ids:
+                self.__write(''.join(f'- {session_id}\n' for session_id in session_ids))
+
+        return len(session_ids)
+
+    # the session of a token from before the session store, which is its own
+    # session_id
+    def restore(self, session_id, u_id):
+        with self.__lock:
+            if session_id not in self.__sessions:
+                self.__add(session_id, u_id, self.clock() + self.ttl)
+                self.unsaved = True
+
+    def discard(self, session_id):
+        with self.__lock:
+            if self.__remove(session_id):
+                self.unsaved = True
+
+    def discard_user(self, u_id):
+        with self.__lock:
+            if self.__remove_user(u_id):
+                self.unsaved = True
+
+    def save(self):
+        '''
+        Writes the changes only made in memory to the sessions file
+        '''
+        with self.__lock:
+            if self.unsaved:
+                self.__compact()
+
+    def clear(self):
+        with self.__lock:
+            self.__sessions = {}
+            self.__user_sessions = {}
+            self.__expiry = []
+            self.__compact()
+
+    def __add(self, session_id, u_id, expires_at):
+        self.__sessions[session_id] = (u_id, expires_at)
+        self.__user_sessions.setdefault(u_id, set()).add(session_id)
+        heapq.heappush(self.__expiry, (expires_at, session_id))
+
+    def __remove(self, session_id):
+        session = self.__sessions.pop(session_id, None)
+        if session is None:
+            return False
+
+        user_sessions = self.__user_sessions[session[0]]
+        user_sessions.discard(session_id)
+        if not user_sessions:
+            del self.__user_sessions[session[0]]
+        return True
+
+    def __remove_user(self, u_id):
+        session_ids = self.__user_sessions.pop(u_id, set())
+        for session_id in session_ids:
+            del self.__sessions[session_id]
+        return session_ids
+
+    # drops the sessions that have expired from memory, they are left out of
+    # the file by the next compaction
+    def __expire(self):
+        now = self.clock()
+        while self.__expiry and self.__expiry[0][0] <= now:
+            expires_at, session_id = heapq.heappop(self.__expiry)
+            session = self.__sessions.get(session_id)
+            if session is not None and session[1] == expires_at:
+                self.__remove(session_id)
+
+    def __write(self, lines):
+        if self.unsaved or self.__lines >= max(COMPACT_LINES, 2 * len(self.__sessions)):
+            self.__compact()
+            return
+
+        with open(self.path, 'a') as FILE:
+            FILE.write(lines)
+            FILE.flush()
+            if self.durable:
+                os.fsync(FILE.fileno())
+
+        self.__lines += lines.count('\n')
+
+    def __compact(self):
+        lines = [
+            f'+ {session_id} {u_id} {expires_at!r}\n'
+            for session_id, (u_id, expires_at) in self.__sessions.items()
+        ]
+        write_snapshot(self.path, ''.join(lines))
+        self.__lines = len(lines)
+        self.unsaved = False
@@ -0,0 +1,122 @@
+import io
+import json
+import pickle
+import struct
+import sys
+import zlib
+
+from src.persistence import write_snapshot
+
+######### SNAPSHOT FORMAT ######################################################
+#
+# Binary snapshot of the Datastore (data_store.bin):
+#   header:  magic (8 bytes), format version (uint16), crc32 of the payload
+#            (uint32), length of the payload (uint64)
+#   payload: pickle of the store dict
+#
+# Unlike the json text dump the payload keeps the type of every key and value,
+# so int keyed sections come back with int keys, and it loads several times
+# faster. Only plain containers and scalars can be unpickled, so a snapshot
+# can never run code when it is loaded.
+#
+# Older stores kept in data_store.txt are converted with:
+#   python3 -m src.snapshot [json path] [snapshot path]
+#
+################################################################################
+
+MAGIC = b'STREAMS\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHIQ')
+
+PICKLE_PROTOCOL = 5
+
+JSON_SNAPSHOT_PATH = 'src/json_dump/data_store.txt'
+SNAPSHOT_PATH = 'src/json_dump/data_store.bin'
+
+# sections whose keys are ints, json turns these into strings
+INT_KEYED_SECTIONS = ['channels', 'dms', 'message_ids', 'messages', 'users', 'perms', 'segments', 'slots']
+
+class SnapshotError(Exception):
+    pass
+
+class PlainUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        raise SnapshotError(f'snapshot contains a {module}.{name} object')
+
+def encode_snapshot(store):
+    '''
+    Serialises the store into the binary snapshot format
+
+    Arguments:
+        store   (dict)  - store made of dicts, lists, strs, ints, floats, bools and None
+
+    Return value:
+        Returns the snapshot as bytes
+    '''
+    payload = pickle.dumps(store, protocol=PICKLE_PROTOCOL)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, zlib.crc32(payload), len(payload)) + payload
+
+def decode_snapshot(contents):
+    '''
+    Loads a store from the binary snapshot format
+
+    Arguments:
+        contents    (bytes) - snapshot written by encode_snapshot
+
+    Exceptions:
+        SnapshotError   - occurs when contents is not a snapshot, is from an
+                        unknown format version, or is truncated or corrupt
+
+    Return value:
+        Returns the store dict
+    '''
+    if len(contents) < HEADER.size:
+        raise SnapshotError('snapshot is truncated')
+
+    magic, version, checksum, length = HEADER.unpack_from(contents)
+    if magic != MAGIC:
+        raise SnapshotError('not a datastore snapshot')
+
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f'unsupported snapshot format version {version}')
+
+    payload = memoryview(contents)[HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        raise SnapshotError('snapshot is truncated or corrupt')
+
+    return PlainUnpickler(io.BytesIO(payload)).load()
+
+def read_snapshot(path=SNAPSHOT_PATH):
+    with open(path, 'rb') as FILE:
+        return decode_snapshot(FILE.read())
+
+def read_json_snapshot(path=JSON_SNAPSHOT_PATH):
+    '''
+    Loads a store from a json text dump, restoring its int keys
+    '''
+    with open(path, 'r') as FILE:
+        store = json.load(FILE)
+
+    for section in INT_KEYED_SECTIONS:
+        if section in store:
+            store[section] = {int(key): value for key, value in store[section].items()}
+
+    return store
+
+def convert_json_snapshot(json_path=JSON_SNAPSHOT_PATH, path=SNAPSHOT_PATH):
+    '''
+    Converts a json text dump into a binary snapshot
+
+    Arguments:
+        json_path   (str)   - existing data_store.txt
+        path        (str)   - binary snapshot to write
+
+    Return value:
+        Returns nothing on success
+    '''
+    write_snapshot(path, encode_snapshot(read_json_snapshot(json_path)))
+
+if __name__ == '__main__':
+    convert_json_snapshot(*sys.argv[1:3])
+    print('Converted snapshot')
@@ -0,0 +1,795 @@
+import sqlite3
+import functools
+import secrets
+import threading
+import time
+
+from src.config import DURABILITY, SESSION_TTL
+from src.handles import HandleSuffixes
+from src.records import stream_owner, stream_member
+from src.sessions import SESSION_ID_BYTES
+
+######### SQLITE DATASTORE #####################################################
+#
+# Drop in replacement for Datastore that keeps the store in an sqlite database
+# instead of one in memory dict. Every method of Datastore is implemented with
+# the same arguments and return values, so the rest of the application does not
+# know which backend it is using (see DATASTORE_BACKEND in src/config.py).
+#
+# Each thread has its own connection. Inside a transaction (see begin/commit)
+# mutations are committed together at the end of the request, otherwise every
+# mutation is committed as soon as it is made.
+#
+# Dicts returned by the get methods are built from the database on every call,
+# so changing them does not change the store.
+#
+# Sessions are kept in their own table, which expired sessions are deleted from
+# through its expires_at index whenever a session is started. The tokens table
+# of databases from before sessions is moved into it on load.
+#
+################################################################################
+
+DATABASE_PATH = 'src/json_dump/data_store.db'
+
+# sqlite's nearest equivalent of each DURABILITY level, in WAL mode NORMAL only
+# syncs when the WAL is checkpointed
+SYNCHRONOUS = {
+    'commit': 'FULL',
+    'interval': 'NORMAL',
+    'os': 'OFF'
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    u_id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    name_first TEXT NOT NULL,
+    name_last TEXT NOT NULL,
+    handle_str TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_handle_str ON users (handle_str);
+
+CREATE TABLE IF NOT EXISTS logins (
+    email TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    auth_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT PRIMARY KEY,
+    u_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    u_id INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_u_id ON sessions (u_id);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+
+CREATE TABLE IF NOT EXISTS perms (
+    u_id INTEGER PRIMARY KEY,
+    perm INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS perms_perm ON perms (perm);
+
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    is_public INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS channel_members (
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    UNIQUE (channel_id, u_id)
+);
+CREATE INDEX IF NOT EXISTS channel_members_u_id ON channel_members (u_id);
+
+CREATE TABLE IF NOT EXISTS channel_owners (
+    channel_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    UNIQUE (channel_id, u_id)
+);
+CREATE INDEX IF NOT EXISTS channel_owners_u_id ON channel_owners (u_id);
+
+CREATE TABLE IF NOT EXISTS dms (
+    dm_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    creator INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dm_members (
+    dm_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    UNIQUE (dm_id, u_id)
+);
+CREATE INDEX IF NOT EXISTS dm_members_u_id ON dm_members (u_id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    channel_or_dm_id INTEGER NOT NULL,
+    u_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    time_created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel_or_dm_id ON messages (channel_or_dm_id, message_id);
+CREATE INDEX IF NOT EXISTS messages_u_id ON messages (u_id);
+CREATE INDEX IF NOT EXISTS messages_time_created ON messages (channel_or_dm_id, time_created);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('message_count', 0);
+'''
+
+TABLES = ['users', 'logins', 'sessions', 'perms', 'channels', 'channel_members',
+          'channel_owners', 'dms', 'dm_members', 'messages']
+
+USER_COLUMNS = 'users.u_id, users.email, users.name_first, users.name_last, users.handle_str'
+
+def mutation(method):
+    '''
+    Marks a SqliteDatastore method as one that changes the store, committing it
+    straight away unless the calling thread is inside a transaction
+    '''
+    @functools.wraps(method)
+    def committed_method(self, *args):
+        result = method(self, *args)
+        if not self.in_transaction():
+            self.connection().commit()
+        return result
+
+    return committed_method
+
+def user_from_row(row):
+    return {
+        'u_id': row['u_id'],
+        'email': row['email'],
+        'name_first': row['name_first'],
+        'name_last': row['name_last'],
+        'handle_str': row['handle_str']
+    }
+
+def message_from_row(row):
+    return {
+        'message_id': row['message_id'],
+        'u_id': row['u_id'],
+        'message': row['message'],
+        'time_created': row['time_created']
+    }
+
+class SqliteDatastore:
+
+    # Initialisation and Resetting Methods #####################################
+    def __init__(self, path=DATABASE_PATH):
+        if DURABILITY not in SYNCHRONOUS:
+            raise ValueError(f'durability must be one of {list(SYNCHRONOUS)}')
+
+        self.path = path
+        self.__local = threading.local()
+        self.__last_checkpoint_seconds = None
+        self.__last_recovery_seconds = None
+        self.__handle_suffixes = HandleSuffixes()
+
+        self.load()
+
+    def load(self):
+        start = time.perf_counter()
+
+        connection = self.connection()
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.executescript(SCHEMA)
+
+        # each token of a database from before sessions is its own session
+        connection.execute(
+            'INSERT OR IGNORE INTO sessions SELECT token, u_id, ? FROM tokens',
+            (time.time() + SESSION_TTL,)
+        )
+        connection.execute('DELETE FROM tokens')
+        connection.commit()
+
+        self.__last_recovery_seconds = time.perf_counter() - start
+
+    def hard_reset(self):
+        connection = self.connection()
+        for table in TABLES:
+            connection.execute(f'DELETE FROM {table}')
+        connection.execute("UPDATE counters SET value = 0 WHERE name = 'message_count'")
+        connection.commit()
+
+        self.__last_checkpoint_seconds = None
+        self.__handle_suffixes.clear()
+        self.load()
+
+    # Persistence ##############################################################
+
+    def connection(self):
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute(f'PRAGMA synchronous = {SYNCHRONOUS[DURABILITY]}')
+            self.__local.connection = connection
+
+        return connection
+
+    def query(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters).fetchall()
+
+    def query_one(self, sql, parameters=()):
+        return self.connection().execute(sql, parameters).fetchone()
+
+    def execute(self, sql, parameters=()):
+        self.connection().execute(sql, parameters)
+
+    def in_transaction(self):
+        return getattr(self.__local, 'active', False)
+
+    def begin(self):
+        '''
+        Starts a transaction for the current thread. Mutations made before the
+        matching commit are committed together.
+        '''
+        self.__local.active = True
+
+    def commit(self):
+        self.__local.active = False
+        self.connection().commit()
+
+    # every commit is written by sqlite straight away
+    def flush(self):
+        pass
+
+    def checkpoint(self):
+        '''
+        Copies the sqlite write ahead log into the database file and truncates
+        it
+        '''
+        start = time.perf_counter()
+        self.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.__last_checkpoint_seconds = time.perf_counter() - start
+
+    def get_persistence_stats(self):
+        return {
+            'backend': 'sqlite',
+            'durability': DURABILITY,
+            'last_checkpoint_seconds': self.__last_checkpoint_seconds,
+            'last_recovery_seconds': self.__last_recovery_seconds
+        }
+
+    # Get Methods ##############################################################
+
+    def get(self):
+        return {
+            'login' : self.get_logins_from_email_dict(),
+            'channels' : self.get_channels_from_channel_id_dict(),
+            'dms': self.get_dms_from_dm_id_dict(),
+            'message_ids' : self.get_channels_or_dms_id_from_message_id_dict(),
+            'messages' : self.get_messages_from_channel_or_dm_id_dict(),
+            'users': self.get_users_from_u_id_dict(),
+            'perms' : self.get_user_perms_from_u_id_dict(),
+            'message_count': self.get_messages_count()
+        }
+
+    # login
+
+    def get_logins_from_email_dict(self):
+        return {
+            row['email']: {'password': row['password'], 'auth_id': row['auth_id']}
+            for row in self.query('SELECT * FROM logins')
+        }
+
+    def get_login_from_email(self, email):
+        row = self.query_one('SELECT * FROM logins WHERE email = ?', (email,))
+        if row is None:
+            return None
+
+        return {'password': row['password'], 'auth_id': row['auth_id']}
+
+    # sessions
+
+    def get_u_id_from_session(self, session_id):
+        row = self.query_one(
+            'SELECT u_id FROM sessions WHERE session_id = ? AND expires_at > ?',
+            (session_id, time.time())
+        )
+        return None if row is None else row['u_id']
+
+    def get_num_sessions(self):
+        return self.query_one('SELECT COUNT(*) AS num FROM sessions WHERE expires_at > ?', (time.time(),))['num']
+
+    # channels
+
+    def get_channel_names(self):
+        rows = self.query('SELECT channel_id, name FROM channels ORDER BY channel_id')
+        return {row['channel_id']: row['name'] for row in rows}
+
+    def get_num_channels(self):
+        return self.query_one('SELECT COUNT(*) AS count FROM channels')['count']
+
+    def get_channels_from_channel_id_dict(self):
+        rows = self.query('SELECT channel_id FROM channels ORDER BY channel_id')
+        return {row['channel_id']: self.get_channel_from_channel_id(row['channel_id']) for row in rows}
+
+    def get_channel_from_channel_id(self, channel_id):
+        row = self.query_one('SELECT * FROM channels WHERE channel_id = ?', (channel_id,))
+        if row is None:
+            return None
+
+        return {
+            'name': row['name'],
+            'is_public': bool(row['is_public']),
+            'owner_members': self.__get_members('channel_owners', 'channel_id', channel_id),
+            'all_members': self.__get_members('channel_members', 'channel_id', channel_id),
+        }
+
+    # dms
+
+    def get_dms_from_dm_id_dict(self):
+        return {
+            row['dm_id']: {
+                'details': self.get_dm_from_dm_id(row['dm_id']),
+                'creator': row['creator']
+            }
+            for row in self.query('SELECT * FROM dms ORDER BY dm_id DESC')
+        }
+
+    def get_dm_from_dm_id(self, dm_id):
+        row = self.query_one('SELECT name FROM dms WHERE dm_id = ?', (dm_id,))
+        if row is None:
+            return None
+
+        return {'name': row['name'], 'members': self.__get_members('dm_members', 'dm_id', dm_id)}
+
+    # members
+
+    def get_channel_names_from_u_id(self, u_id):
+        rows = self.query(
+            'SELECT channels.channel_id, name FROM channel_members JOIN channels USING (channel_id) '
+            'WHERE u_id = ? ORDER BY channels.channel_id',
+            (u_id,)
+        )
+        return {row['channel_id']: row['name'] for row in rows}
+
+    def get_dm_names_from_u_id(self, u_id):
+        rows = self.query(
+            'SELECT dms.dm_id, name FROM dm_members JOIN dms USING (dm_id) '
+            'WHERE u_id = ? ORDER BY dms.dm_id DESC',
+            (u_id,)
+        )
+        return {row['dm_id']: row['name'] for row in rows}
+
+    def get_dm_creator_from_dm_id(self, dm_id):
+        row = self.query_one('SELECT creator FROM dms WHERE dm_id = ?', (dm_id,))
+        return None if row is None else row['creator']
+
+    def __get_members(self, table, id_column, id):
+        rows = self.query(
+            f'SELECT {USER_COLUMNS} FROM {table} JOIN users ON users.u_id = {table}.u_id '
+            f'WHERE {table}.{id_column} = ? ORDER BY {table}.rowid',
+            (id,)
+        )
+        return [user_from_row(row) for row in rows]
+
+    # messages
+
+    def get_channels_or_dms_id_from_message_id_dict(self):
+        rows = self.query('SELECT message_id, channel_or_dm_id FROM messages')
+        return {row['message_id']: row['channel_or_dm_id'] for row in rows}
+
+    def get_channel_or_dm_id_from_message_id(self, message_id):
+        row = self.query_one('SELECT channel_or_dm_id FROM messages WHERE message_id = ?', (message_id,))
+        return None if row is None else row['channel_or_dm_id']
+
+    def get_messages_from_channel_or_dm_id_dict(self):
+        ids = [row['channel_id'] for row in self.query('SELECT channel_id FROM channels')]
+        ids += [row['dm_id'] for row in self.query('SELECT dm_id FROM dms')]
+        return {id: self.get_messages_from_channel_or_dm_id(id) for id in ids}
+
+    # newest message first
+    def get_messages_from_channel_or_dm_id(self, id):
+        if self.is_invalid_channel_id(id) and self.is_invalid_dm_id(id):
+            return None
+
+        rows = self.query(
+            'SELECT * FROM messages WHERE channel_or_dm_id = ? ORDER BY message_id DESC',
+            (id,)
+        )
+        return [message_from_row(row) for row in rows]
+
+    def get_num_messages_from_channel_or_dm_id(self, id):
+        return self.query_one('SELECT COUNT(*) AS num FROM messages WHERE channel_or_dm_id = ?', (id,))['num']
+
+    # count messages of the history, starting from the start-th most recent
+    def get_messages_page_from_channel_or_dm_id(self, id, start, count):
+        rows = self.query(
+            'SELECT * FROM messages WHERE channel_or_dm_id = ? ORDER BY message_id DESC LIMIT ? OFFSET ?',
+            (id, count, start)
+        )
+        return [message_from_row(row) for row in rows]
+
+    def get_num_messages_from_channel_or_dm_id_in_time_range(self, id, time_start, time_end):
+        return self.query_one(
+            'SELECT COUNT(*) AS num FROM messages WHERE channel_or_dm_id = ? AND time_created BETWEEN ? AND ?',
+            (id, time_start, time_end)
+        )['num']
+
+    # count messages created from time_start to time_end, starting from the
+    # start-th most recent of them
+    def get_messages_page_from_channel_or_dm_id_in_time_range(self, id, time_start, time_end, start, count):
+        rows = self.query(
+            'SELECT * FROM messages WHERE channel_or_dm_id = ? AND time_created BETWEEN ? AND ? '
+            'ORDER BY message_id DESC LIMIT ? OFFSET ?',
+            (id, time_start, time_end, count, start)
+        )
+        return [message_from_row(row) for row in rows]
+
+    # number of messages of the history with an id above message_id
+    def get_num_messages_from_channel_or_dm_id_after_message_id(self, id, message_id):
+        return self.query_one(
+            'SELECT COUNT(*) AS num FROM messages WHERE channel_or_dm_id = ? AND message_id > ?',
+            (id, message_id)
+        )['num']
+
+    # the count most recent messages of the history with an id below message_id
+    def get_messages_page_from_channel_or_dm_id_before_message_id(self, id, message_id, count):
+        rows = self.query(
+            'SELECT * FROM messages WHERE channel_or_dm_id = ? AND message_id < ? ORDER BY message_id DESC LIMIT ?',
+            (id, message_id, count)
+        )
+        return [message_from_row(row) for row in rows]
+
+    # the count oldest messages of the history with an id above message_id,
+    # most recent first
+    def get_messages_page_from_channel_or_dm_id_after_message_id(self, id, message_id, count):
+        rows = self.query(
+            'SELECT * FROM messages WHERE channel_or_dm_id = ? AND message_id > ? ORDER BY message_id ASC LIMIT ?',
+            (id, message_id, count)
+        )
+        return [message_from_row(row) for row in reversed(rows)]
+
+    def get_message_from_message_id(self, message_id):
+        row = self.query_one('SELECT * FROM messages WHERE message_id = ?', (message_id,))
+        return None if row is None else message_from_row(row)
+
+    def get_messages_count(self):
+        return self.query_one("SELECT value FROM counters WHERE name = 'message_count'")['value']
+
+    # users
+
+    def get_users_from_u_id_dict(self):
+        return {row['u_id']: user_from_row(row) for row in self.query('SELECT * FROM users ORDER BY u_id')}
+
+    def get_user_from_u_id(self, u_id):
+        row = self.query_one('SELECT * FROM users WHERE u_id = ?', (u_id,))
+        return None if row is None else user_from_row(row)
+
+    def get_num_users(self):
+        return self.query_one('SELECT COUNT(*) AS count FROM users')['count']
+
+    def get_user_perms_from_u_id_dict(self):
+        return {row['u_id']: row['perm'] for row in self.query('SELECT * FROM perms')}
+
+    def get_user_perms_from_u_id(self, u_id):
+        row = self.query_one('SELECT perm FROM perms WHERE u_id = ?', (u_id,))
+        return None if row is None else row['perm']
+
+    def get_num_streams_owners(self):
+        return self.query_one('SELECT COUNT(*) AS count FROM perms WHERE perm = 1')['count']
+
+    # Check Methods ############################################################
+
+    def __exists(self, sql, parameters):
+        return self.query_one(f'SELECT EXISTS ({sql}) AS found', parameters)['found'] == 1
+
+    def is_session_invalid(self, session_id):
+        return self.get_u_id_from_session(session_id) is None
+
+    def is_user_member_of_channel(self, channel_id, u_id):
+        return self.__exists('SELECT 1 FROM channel_members WHERE channel_id = ? AND u_id = ?', (channel_id, u_id))
+
+    def is_user_member_of_dm(self, dm_id, u_id):
+        return self.__exists('SELECT 1 FROM dm_members WHERE dm_id = ? AND u_id = ?', (dm_id, u_id))
+
+    def is_user_member_of_channel_or_dm(self, channel_or_dm_id, u_id):
+        if channel_or_dm_id <= -1:
+            return self.is_user_member_of_dm(channel_or_dm_id, u_id)
+
+        return self.is_user_member_of_channel(channel_or_dm_id, u_id)
+
+    def is_user_sender_of_message(self, auth_user_id, message_id):
+        return self.__exists('SELECT 1 FROM messages WHERE message_id = ? AND u_id = ?', (message_id, auth_user_id))
+
+    def is_invalid_message_id(self, message_id):
+        return not self.__exists('SELECT 1 FROM messages WHERE message_id = ?', (message_id,))
+
+    def is_channel_owner(self, channel_id, u_id):
+        return self.__exists('SELECT 1 FROM channel_owners WHERE channel_id = ? AND u_id = ?', (channel_id, u_id))
+
+    def is_channel_public(self, channel_id):
+        return self.__exists('SELECT 1 FROM channels WHERE channel_id = ? AND is_public', (channel_id,))
+
+    def is_channel_only_owner(self, channel_id):
+        row = self.query_one('SELECT COUNT(*) AS count FROM channel_owners WHERE channel_id = ?', (channel_id,))
+        return row['count'] == 1
+
+    def is_user_owner_of_channel_or_dm(self, channel_or_dm_id, u_id):
+        if channel_or_dm_id < 0:
+            return self.get_dm_creator_from_dm_id(channel_or_dm_id) == u_id
+
+        return self.is_channel_owner(channel_or_dm_id, u_id)
+
+    def is_stream_owner(self, u_id):
+        return self.get_user_perms_from_u_id(u_id) == 1
+
+    def is_invalid_email(self, email):
+        return not self.is_duplicate_email(email)
+
+    def is_duplicate_email(self, email):
+        return self.__exists('SELECT 1 FROM logins WHERE email = ?', (email,))
+
+    def is_duplicate_handle(self, handle):
+        return self.__exists('SELECT 1 FROM users WHERE handle_str = ?', (handle,))
+
+    def is_invalid_user_id(self, u_id):
+        return not self.__exists("SELECT 1 FROM users WHERE u_id = ? AND email != ''", (u_id,))
+
+    # returns True even if user is removed
+    def is_invalid_profile(self, u_id):
+        return not self.__exists('SELECT 1 FROM users WHERE u_id = ?', (u_id,))
+
+    def is_invalid_channel_id(self, channel_id):
+        return not self.__exists('SELECT 1 FROM channels WHERE channel_id = ?', (channel_id,))
+
+    def is_invalid_dm_id(self, dm_id):
+        return not self.__exists('SELECT 1 FROM dms WHERE dm_id = ?', (dm_id,))
+
+    # Insertion functions ######################################################
+
+    @mutation
+    def insert_login(self, email, password, auth_id):
+        self.execute('INSERT OR REPLACE INTO logins VALUES (?, ?, ?)', (email, password, auth_id))
+
+    @mutation
+    def insert_session(self, auth_user_id):
+        now = time.time()
+        self.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+        session_id = secrets.token_urlsafe(SESSION_ID_BYTES)
+        self.execute('INSERT INTO sessions VALUES (?, ?, ?)', (session_id, auth_user_id, now + SESSION_TTL))
+        return session_id
+
+    @mutation
+    def insert_user(self, u_id, email, name_first, name_last, handle_str):
+        self.execute(
+            'INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)',
+            (u_id, email, name_first, name_last, handle_str)
+        )
+
+    @mutation
+    def insert_user_perm(self, u_id, global_id):
+        self.execute('INSERT OR REPLACE INTO perms VALUES (?, ?)', (u_id, global_id))
+
+    @mutation
+    def insert_new_users(self, users):
+        # the write lock is taken before the emails and handles are checked, so
+        # no other connection, in this process or another, can register the
+        # same email, u_id or handle before this one commits
+        connection = self.connection()
+        if not connection.in_transaction:
+            connection.execute('BEGIN IMMEDIATE')
+
+        # u_ids are never reused, removed users keep theirs
+        next_u_id = self.query_one('SELECT COALESCE(MAX(u_id), -1) + 1 AS u_id FROM users')['u_id']
+
+        u_ids = []
+        for email, password, name_first, name_last, base_handle in users:
+            if self.is_duplicate_email(email):
+                u_ids.append(None)
+                continue
+
+            u_id = next_u_id
+            next_u_id += 1
+            handle_str = self.__handle_suffixes.unique_handle(base_handle, self.is_duplicate_handle)
+
+            self.execute('INSERT INTO users VALUES (?, ?, ?, ?, ?)', (u_id, email, name_first, name_last, handle_str))
+            self.execute('INSERT INTO logins VALUES (?, ?, ?)', (email, password, u_id))
+            self.execute('INSERT INTO perms VALUES (?, ?)', (u_id, stream_owner if u_id == 0 else stream_member))
+            u_ids.append(u_id)
+
+        return u_ids
+
+    @mutation
+    def insert_channel(self, channel_id, channel_name, is_public, messages, owner_members, all_members):
+        self.execute('INSERT OR REPLACE INTO channels VALUES (?, ?, ?)', (channel_id, channel_name, is_public))
+
+        for owner in owner_members:
+            self.execute('INSERT OR IGNORE INTO channel_owners VALUES (?, ?)', (channel_id, owner['u_id']))
+        for member in all_members:
+            self.execute('INSERT OR IGNORE INTO channel_members VALUES (?, ?)', (channel_id, member['u_id']))
+
+        # messages are given newest first
+        for message in reversed(messages):
+            self.__insert_message_row(channel_id, message)
+
+    @mutation
+    def insert_channel_owner(self, channel_id, u_id):
+        self.execute('INSERT OR IGNORE INTO channel_owners VALUES (?, ?)', (channel_id, u_id))
+
+    @mutation
+    def insert_channel_member(self, channel_id, u_id):
+        self.execute('INSERT OR IGNORE INTO channel_members VALUES (?, ?)', (channel_id, u_id))
+
+    @mutation
+    def insert_dm(self, creator, dm_id, u_ids, name):
+        self.execute('INSERT OR REPLACE INTO dms VALUES (?, ?, ?)', (dm_id, name, creator))
+
+        for member in u_ids:
+            self.execute('INSERT OR IGNORE INTO dm_members VALUES (?, ?)', (dm_id, member['u_id']))
+
+    @mutation
+    def insert_message(self, id, message):
+        self.__insert_message_row(id, message)
+
+    @mutation
+    def insert_new_message(self, id, u_id, text, time_created):
+        # the counter update takes the write lock, so no other connection can
+        # allocate the same message_id before this one commits
+        self.execute("UPDATE counters SET value = value + 1 WHERE name = 'message_count'")
+        message_id = self.get_messages_count() - 1
+
+        # the times of a history never go back, like the json Datastore's
+        last_time_created = self.query_one(
+            'SELECT MAX(time_created) AS time_created FROM messages WHERE channel_or_dm_id = ?', (id,)
+        )['time_created']
+        if last_time_created is not None:
+            time_created = max(time_created, last_time_created)
+
+        self.__insert_message_row(id, {
+            'message_id': message_id,
+            'u_id': u_id,
+            'message': text,
+            'time_created': time_created
+        })
+
+        return message_id
+
+    def __insert_message_row(self, id, message):
+        self.execute(
+            'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)',
+            (message['message_id'], id, message['u_id'], message['message'], message['time_created'])
+        )
+
+    @mutation
+    def update_value(self, dict_key, key, value):
+        if dict_key == 'perms':
+            self.execute('INSERT OR REPLACE INTO perms VALUES (?, ?)', (key, value))
+        elif dict_key == 'login':
+            self.execute('INSERT OR REPLACE INTO logins VALUES (?, ?, ?)', (key, value['password'], value['auth_id']))
+        elif dict_key == 'users':
+            self.execute(
+                'INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)',
+                (key, value['email'], value['name_first'], value['name_last'], value['handle_str'])
+            )
+        else:
+            raise KeyError(dict_key)
+
+    # Remove ###################################################################
+
+    @mutation
+    def remove_message(self, message_id):
+        self.execute('DELETE FROM messages WHERE message_id = ?', (message_id,))
+
+    @mutation
+    def remove_channel_member(self, channel_id, u_id):
+        self.execute('DELETE FROM channel_members WHERE channel_id = ? AND u_id = ?', (channel_id, u_id))
+        self.execute('DELETE FROM channel_owners WHERE channel_id = ? AND u_id = ?', (channel_id, u_id))
+
+    @mutation
+    def remove_dm_member(self, dm_id, u_id):
+        self.execute('DELETE FROM dm_members WHERE dm_id = ? AND u_id = ?', (dm_id, u_id))
+
+    # Other ####################################################################
+
+    @mutation
+    def update_message(self, message_id, text):
+        self.execute('UPDATE messages SET message = ? WHERE message_id = ?', (text, message_id))
+
+    @mutation
+    def invalidate_session(self, session_id):
+        self.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    @mutation
+    def invalidate_user_sessions(self, auth_user_id):
+        self.execute('DELETE FROM sessions WHERE u_id = ?', (auth_user_id,))
+
+    @mutation
+    def update_name(self, auth_user_id, name_first, name_last):
+        self.execute(
+            'UPDATE users SET name_first = ?, name_last = ? WHERE u_id = ?',
+            (name_first, name_last, auth_user_id)
+        )
+
+    @mutation
+    def update_password(self, email, password):
+        self.execute('UPDATE logins SET password = ? WHERE email = ?', (password, email))
+
+    @mutation
+    def update_email(self, auth_user_id, email):
+        old_email = self.get_user_from_u_id(auth_user_id)['email']
+
+        self.execute('UPDATE logins SET email = ? WHERE email = ?', (email, old_email))
+        self.execute('UPDATE users SET email = ? WHERE u_id = ?', (email, auth_user_id))
+
+    @mutation
+    def update_handle(self, auth_user_id, handle):
+        self.__handle_suffixes.free(self.get_user_from_u_id(auth_user_id)['handle_str'])
+        self.execute('UPDATE users SET handle_str = ? WHERE u_id = ?', (handle, auth_user_id))
+
+    @mutation
+    def remove_dm(self, dm_id):
+        self.execute('DELETE FROM dm_members WHERE dm_id = ?', (dm_id,))
+
+    @mutation
+    def increment_message_count(self):
+        self.execute("UPDATE counters SET value = value + 1 WHERE name = 'message_count'")
+
+    @mutation
+    def set(self, store):
+        if not isinstance(store, dict):
+            raise TypeError('store must be of type dictionary')
+
+        for table in TABLES:
+            self.execute(f'DELETE FROM {table}')
+
+        for email, login in store['login'].items():
+            self.insert_login(email, login['password'], login['auth_id'])
+        for token, u_id in store.get('token', {}).items():
+            self.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)', (token, u_id, time.time() + SESSION_TTL))
+        for user in store['users'].values():
+            self.insert_user(user['u_id'], user['email'], user['name_first'], user['name_last'], user['handle_str'])
+        for u_id, perm in store['perms'].items():
+            self.insert_user_perm(int(u_id), perm)
+        for channel_id, channel in store['channels'].items():
+            self.insert_channel(int(channel_id), channel['name'], channel['is_public'],
+                                store['messages'].get(channel_id, []),
+                                channel['owner_members'], channel['all_members'])
+        for dm_id, dm in store['dms'].items():
+            self.insert_dm(dm['creator'], int(dm_id), dm['details']['members'], dm['details']['name'])
+            for message in reversed(store['messages'].get(dm_id, [])):
+                self.insert_message(int(dm_id), message)
+
+        self.execute("UPDATE counters SET value = ? WHERE name = 'message_count'", (store['message_count'],))
+
+    @mutation
+    def remove_channel_owner(self, channel_id, u_id):
+        self.execute('DELETE FROM channel_owners WHERE channel_id = ? AND u_id = ?', (channel_id, u_id))
+
+    @mutation
+    def admin_user_remove(self, u_id):
+        user = self.get_user_from_u_id(u_id)
+        self.__handle_suffixes.free(user['handle_str'])
+
+        # remove login info and end all sessions
+        self.execute('DELETE FROM logins WHERE email = ?', (user['email'],))
+        self.execute('DELETE FROM sessions WHERE u_id = ?', (u_id,))
+
+        # delete user from all channels and dms
+        self.execute('DELETE FROM channel_members WHERE u_id = ?', (u_id,))
+        self.execute('DELETE FROM channel_owners WHERE u_id = ?', (u_id,))
+        self.execute('DELETE FROM dm_members WHERE u_id = ?', (u_id,))
+
+        # replace the users messages
+        self.execute("UPDATE messages SET message = 'Removed user' WHERE u_id = ?", (u_id,))
+
+        # remove user permissions
+        self.execute('DELETE FROM perms WHERE u_id = ?', (u_id,))
+
+        # Update user/profile
+        self.execute(
+            "UPDATE users SET email = '', name_first = 'Removed', name_last = 'user', handle_str = '' WHERE u_id = ?",
+            (u_id,)
+        )
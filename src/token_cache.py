@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+from src.config import TOKEN_CACHE_SIZE
+
+######### TOKEN CACHE ##########################################################
+#
+# Every authenticated request passes its token through token_to_auth_id, which
+# used to verify the token's HS256 signature each time. The TokenCache keeps
+# the claims (auth_user_id, session_id) of the most recently verified tokens,
+# so only the first request with a token pays for the verification.
+#
+# The cache never decides whether a token is still valid: token_to_session
+# checks the token's session in the datastore on every request, and the
+# datastore is shared by every server process with the sqlite backend. Logging
+# out and removing a user also drop their tokens from the cache, so it does
+# not hold on to tokens that can no longer be used.
+#
+################################################################################
+
+class TokenCache:
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.__claims = OrderedDict()
+        # auth_user_id -> set of tokens
+        self.__user_tokens = {}
+        self.__lock = threading.Lock()
+
+    def get(self, token):
+        '''
+        Returns the (auth_user_id, session_id) of a verified token, or None if
+        token has not been verified (recently)
+        '''
+        with self.__lock:
+            claims = self.__claims.get(token)
+            if claims is None:
+                self.misses += 1
+                return None
+
+            self.__claims.move_to_end(token)
+            self.hits += 1
+            return claims
+
+    def put(self, token, claims):
+        with self.__lock:
+            self.__claims[token] = claims
+            self.__claims.move_to_end(token)
+            self.__user_tokens.setdefault(claims[0], set()).add(token)
+
+            while len(self.__claims) > self.capacity:
+                self.__remove(next(iter(self.__claims)))
+
+    def discard(self, token):
+        with self.__lock:
+            self.__remove(token)
+
+    def discard_user(self, u_id):
+        with self.__lock:
+            for token in self.__user_tokens.pop(u_id, set()):
+                del self.__claims[token]
+
+    def clear(self):
+        with self.__lock:
+            self.__claims.clear()
+            self.__user_tokens.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __remove(self, token):
+        claims = self.__claims.pop(token, None)
+        if claims is None:
+            return
+
+        user_tokens = self.__user_tokens[claims[0]]
+        user_tokens.discard(token)
+        if not user_tokens:
+            del self.__user_tokens[claims[0]]
+
+    def get_stats(self):
+        with self.__lock:
+            return {
+                'size': len(self.__claims),
+                'capacity': self.capacity,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
@@ -0,0 +1,94 @@
+import pytest
+import requests
+
+from src.config import url, DATASTORE_BACKEND, DURABILITY
+
+@pytest.fixture
+def clear():
+    requests.delete(url + "clear/v1")
+
+@pytest.fixture
+def register(clear):
+    owner_info = requests.post(url + 'auth/register/v2', json={
+        'email': 'owner@email.com',
+        'password': 'password',
+        'name_first': 'owner',
+        'name_last': 'one'
+    }).json()
+
+    user_info = requests.post(url + 'auth/register/v2', json={
+        'email': 'user@email.com',
+        'password': 'password',
+        'name_first': 'user',
+        'name_last': 'one'
+    }).json()
+
+    return [owner_info, user_info]
+
+def test_standard(register):
+    '''
+    A global owner can read the server statistics
+
+    Expects:
+        The persistence statistics, with the recovery time of the last clear
+    '''
+    response = requests.get(url + 'admin/stats/v1', params={'token': register[0]['token']})
+    assert response.status_code == 200
+
+    persistence = response.json()['persistence']
+    assert persistence['backend'] == DATASTORE_BACKEND
+    assert persistence['durability'] == DURABILITY
+    assert persistence['last_recovery_seconds'] >= 0
+
+def test_not_global_owner(register):
+    '''
+    A regular user can not read the server statistics
+
+    Expects:
+        AccessError (403 error)
+    '''
+    response = requests.get(url + 'admin/stats/v1', params={'token': register[1]['token']})
+    assert response.status_code == 403
+
+def test_invalid_token(register):
+    '''
+    Statistics require a valid token
+
+    Expects:
+        AccessError (403 error)
+    '''
+    requests.post(url + 'auth/logout/v1', json={'token': register[0]['token']})
+
+    response = requests.get(url + 'admin/stats/v1', params={'token': register[0]['token']})
+    assert response.status_code == 403
+
+def test_token_cache(register):
+    '''
+    Tokens are verified once and then found in the token cache, until their
+    user logs out or is removed
+
+    Expects:
+        A hit for each repeated request, and the tokens of the user who logged
+        out and the removed user to leave the cache and stop working
+    '''
+    owner_token = register[0]['token']
+    stats = requests.get(url + 'admin/stats/v1', params={'token': owner_token}).json()['token_cache']
+    repeated = requests.get(url + 'admin/stats/v1', params={'token': owner_token}).json()['token_cache']
+
+    assert repeated['hits'] == stats['hits'] + 1
+    assert repeated['misses'] == stats['misses']
+
+    user_token = register[1]['token']
+    requests.get(url + 'user/profile/v1', params={'token': user_token, 'u_id': register[1]['auth_user_id']})
+    cached = requests.get(url + 'admin/stats/v1', params={'token': owner_token}).json()['token_cache']['size']
+
+    requests.post(url + 'auth/logout/v1', json={'token': user_token})
+    assert requests.get(url + 'admin/stats/v1', params={'token': owner_token}).json()['token_cache']['size'] == cached - 1
+    assert requests.get(url + 'user/profile/v1', params={'token': user_token, 'u_id': register[1]['auth_user_id']}).status_code == 403
+
+    login = requests.post(url + 'auth/login/v2', json={'email': 'user@email.com', 'password': 'password'}).json()
+    requests.get(url + 'user/profile/v1', params={'token': login['token'], 'u_id': login['auth_user_id']})
+    requests.delete(url + 'admin/user/remove/v1', json={'token': owner_token, 'u_id': login['auth_user_id']})
+
+    assert requests.get(url + 'admin/stats/v1', params={'token': owner_token}).json()['token_cache']['size'] == cached - 1
+    assert requests.get(url + 'user/profile/v1', params={'token': login['token'], 'u_id': login['auth_user_id']}).status_code == 403
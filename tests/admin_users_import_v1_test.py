@@ -0,0 +1,176 @@
+'''
+
+admin/users/import/v1
+
+Registers a batch of users, given as JSON {token, users} or as an NDJSON
+stream with the token in the query string.
+
+POST
+
+Parameters:{ token, users }
+
+Return Type:{ users }
+
+'''
+
+import json
+import pytest
+import requests
+from src import config
+
+@pytest.fixture
+def clear_server():
+    requests.delete(config.url + "clear/v1")
+
+# Fixture to register the global owner and returns a dictionary of {token, auth_user_id}
+@pytest.fixture
+def get_owner(clear_server):
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'owner@test.com',
+        'password': 'spotato',
+        'name_first': 'John',
+        'name_last' : 'smith'
+        })
+    return response.json()
+
+def new_user(email, name_first='John', name_last='smith', password='password'):
+    return {'email': email, 'password': password, 'name_first': name_first, 'name_last': name_last}
+
+def profile(token, u_id):
+    return requests.get(config.url + 'user/profile/v1', params={'token': token, 'u_id': u_id}).json()['user']
+
+def test_import(get_owner):
+    '''
+    Importing a batch with valid rows and rows that cannot be registered
+
+    Expects:
+        The valid rows to be registered with unique handles and able to log
+        in, and an error for every other row
+    '''
+    users = [
+        new_user('one@test.com'),
+        new_user('owner@test.com'),
+        new_user('two@test.com'),
+        new_user('one@test.com'),
+        new_user('not an email'),
+        new_user('three@test.com', password='short'),
+        new_user('four@test.com', name_first=''),
+        new_user('five@test.com', name_last=5),
+        'not a user',
+        new_user('six@test.com', 'Jane', 'Doe'),
+    ]
+    resp = requests.post(config.url + 'admin/users/import/v1', json={'token': get_owner['token'], 'users': users})
+    assert resp.status_code == 200
+
+    results = resp.json()['users']
+    assert [result['row'] for result in results] == list(range(len(users)))
+    assert [('auth_user_id' in result) for result in results] == [True, False, True] + [False] * 6 + [True]
+    assert results[1]['error'] == 'email is already being used by another user'
+    assert results[3]['error'] == 'email is already being used by another user'
+
+    u_ids = [results[0]['auth_user_id'], results[2]['auth_user_id'], results[9]['auth_user_id']]
+    assert len(set(u_ids)) == 3 and get_owner['auth_user_id'] not in u_ids
+
+    handles = [profile(get_owner['token'], u_id)['handle_str'] for u_id in u_ids]
+    assert handles == ['johnsmith0', 'johnsmith1', 'janedoe']
+
+    login = requests.post(config.url + 'auth/login/v2', json={'email': 'two@test.com', 'password': 'password'}).json()
+    assert login['auth_user_id'] == u_ids[1]
+
+    # the imported users are global members
+    resp = requests.post(config.url + 'admin/users/import/v1', json={'token': login['token'], 'users': []})
+    assert resp.status_code == 403
+
+def test_import_ndjson(get_owner):
+    '''
+    Importing a batch sent as an NDJSON stream, with a line that is not JSON
+
+    Expects:
+        A result for each line, and the users of the valid lines registered
+    '''
+    lines = [json.dumps(new_user('one@test.com')), '{not json', '', json.dumps(new_user('two@test.com', 'Jane', 'Doe'))]
+    resp = requests.post(
+        config.url + 'admin/users/import/v1',
+        params={'token': get_owner['token']},
+        data='\n'.join(lines) + '\n',
+        headers={'Content-Type': 'application/x-ndjson'}
+    )
+    assert resp.status_code == 200
+
+    results = resp.json()['users']
+    assert len(results) == 3
+    assert 'error' in results[1]
+    assert profile(get_owner['token'], results[2]['auth_user_id'])['handle_str'] == 'janedoe'
+
+    login = requests.post(config.url + 'auth/login/v2', json={'email': 'one@test.com', 'password': 'password'})
+    assert login.json()['auth_user_id'] == results[0]['auth_user_id']
+
+def test_not_global_owner(get_owner):
+    '''
+    The authorised user is not a global owner
+
+    Expects:
+        AccessError (403 error)
+    '''
+    member = requests.post(config.url + 'auth/register/v2', json=new_user('member@test.com')).json()
+
+    resp = requests.post(config.url + 'admin/users/import/v1', json={'token': member['token'], 'users': [new_user('one@test.com')]})
+    assert resp.status_code == 403
+
+def test_users_not_list(get_owner):
+    '''
+    users is not a list
+
+    Expects:
+        InputError (400 error)
+    '''
+    resp = requests.post(config.url + 'admin/users/import/v1', json={'token': get_owner['token'], 'users': new_user('one@test.com')})
+    assert resp.status_code == 400
+
+def test_concurrent_imports(get_owner):
+    '''
+    Two imports of the same emails, and registrations of some of them, sent
+    at the same time
+
+    Expects:
+        Each email registered exactly once, with a different auth_user_id, and
+        an error for every other row with that email
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    emails = [f'user{index}@test.com' for index in range(20)]
+
+    def send(index):
+        if index < 2:
+            return requests.post(config.url + 'admin/users/import/v1', json={
+                'token': get_owner['token'],
+                'users': [new_user(email) for email in emails]
+            }).json()['users']
+        return [requests.post(config.url + 'auth/register/v2', json=new_user(emails[index])).json()]
+
+    with ThreadPoolExecutor(6) as executor:
+        results = [result for results in executor.map(send, range(6)) for result in results]
+
+    u_ids = [result['auth_user_id'] for result in results if 'auth_user_id' in result]
+    assert len(u_ids) == len(set(u_ids)) == 20
+
+    users = requests.get(config.url + 'users/all/v1', params={'token': get_owner['token']}).json()['users']
+    assert sorted(user['email'] for user in users) == sorted(emails + ['owner@test.com'])
+
+def test_too_many_ndjson_rows(get_owner):
+    '''
+    An NDJSON stream with more rows than one import can register
+
+    Expects:
+        InputError (400 error), and no users registered
+    '''
+    resp = requests.post(
+        config.url + 'admin/users/import/v1',
+        params={'token': get_owner['token']},
+        data=''.join(json.dumps(new_user(f'user{index}@test.com')) + '\n' for index in range(config.IMPORT_USERS_MAX + 1)),
+        headers={'Content-Type': 'application/x-ndjson'}
+    )
+    assert resp.status_code == 400
+
+    users = requests.get(config.url + 'users/all/v1', params={'token': get_owner['token']}).json()['users']
+    assert len(users) == 1
@@ -0,0 +1,85 @@
+'''
+
+auth/logout/all/v1
+
+Given an active token, invalidates every token of its user to log them out of
+all of their sessions.
+
+POST
+
+Parameters:{ token }
+
+Return Type:{}
+
+'''
+
+import pytest
+import requests
+from src import config
+
+@pytest.fixture
+def clear_server():
+    requests.delete(config.url + "clear/v1")
+
+# Fixture to register someone and returns a dictionary of {token, auth_user_id}
+@pytest.fixture
+def get_user_1():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'owner@test.com',
+        'password': 'spotato',
+        'name_first': 'owner',
+        'name_last' : 'one'
+        })
+    return response.json()
+
+# Fixture to register someone and returns a dictionary of {token, auth_user_id}
+@pytest.fixture
+def get_user_2():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'example@email.com',
+        'password': 'potato',
+        'name_first': 'John',
+        'name_last' : 'smith'
+        })
+    return response.json()
+
+def login(email, password):
+    return requests.post(config.url + 'auth/login/v2', json={'email': email, 'password': password}).json()['token']
+
+def listall(token):
+    return requests.get(config.url + 'channels/listall/v2', params={'token': token})
+
+def test_all_sessions_end(clear_server, get_user_1, get_user_2):
+    '''
+    Logging out of every session of a user who has logged in more than once
+
+    Expects:
+        AccessError (403 error) for every token of the user, success for the
+        tokens of other users
+    '''
+    tokens = [get_user_1['token']] + [login('owner@test.com', 'spotato') for _ in range(3)]
+    for token in tokens:
+        assert listall(token).status_code == 200
+
+    resp = requests.post(config.url + 'auth/logout/all/v1', json={'token': tokens[1]})
+    assert resp.status_code == 200
+    assert resp.json() == {}
+
+    for token in tokens:
+        assert listall(token).status_code == 403
+    assert listall(get_user_2['token']).status_code == 200
+
+    # logging in again starts a new session
+    assert listall(login('owner@test.com', 'spotato')).status_code == 200
+
+def test_invalid_token(clear_server, get_user_1):
+    '''
+    Logging out of every session with a token that has already been logged out
+
+    Expects:
+        AccessError (403 error)
+    '''
+    requests.post(config.url + 'auth/logout/v1', json={'token': get_user_1['token']})
+
+    resp = requests.post(config.url + 'auth/logout/all/v1', json={'token': get_user_1['token']})
+    assert resp.status_code == 403
@@ -226,3 +226,63 @@ def test_concatenated_length(clear_server):
 
     assert len(user_2_dict['user']['handle_str']) <= 20
 
+
+def test_freed_handle_number_is_reused(clear_server, get_user_1):
+    '''
+    A test that checks a handle number freed by a handle change is given to
+    the next user with the same name.
+
+    Expects: 
+        Correct output from user/profile/v1
+    '''
+    def register(email):
+        return requests.post(config.url + 'auth/register/v2', json={
+            'email': email, 
+            'password': 'spotato', 
+            'name_first': 'owner', 
+            'name_last' : 'one'
+            }).json()
+
+    def handle(user):
+        return requests.get(config.url + 'user/profile/v1', params={'token': user['token'], 'u_id': user['auth_user_id']}).json()['user']['handle_str']
+
+    users = [register(f'owner{index}@test.com') for index in range(3)]
+    assert [handle(user) for user in users] == ['ownerone0', 'ownerone1', 'ownerone2']
+
+    requests.put(config.url + 'user/profile/sethandle/v1', json={'token': users[1]['token'], 'handle_str': 'somethingelse'})
+
+    assert handle(register('owner3@test.com')) == 'ownerone1'
+    assert handle(register('owner4@test.com')) == 'ownerone3'
+
+def test_concurrent_registrations(clear_server, get_user_1):
+    '''
+    Registrations sent at the same time, with different emails and with the
+    same email, whose passwords are hashed at the same time
+
+    Expects:
+        A different auth_user_id for each email, and only one registration of
+        the shared email to succeed
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+
+    def register(email):
+        return requests.post(config.url + 'auth/register/v2', json={
+            'email': email,
+            'password': 'password',
+            'name_first': 'John',
+            'name_last' : 'smith'
+            })
+
+    emails = [f'user{index}@test.com' for index in range(6)] + ['shared@test.com'] * 4
+    with ThreadPoolExecutor(len(emails)) as executor:
+        responses = list(executor.map(register, emails))
+
+    u_ids = [response.json()['auth_user_id'] for response in responses[:6]]
+    assert len(set(u_ids + [get_user_1['auth_user_id']])) == 7
+
+    shared = [response.status_code for response in responses[6:]]
+    assert sorted(shared) == [200, 400, 400, 400]
+
+    users = requests.get(config.url + 'users/all/v1', params={'token': get_user_1['token']}).json()['users']
+    assert len(users) == 8
+    assert len({user['handle_str'] for user in users}) == 8
@@ -176,6 +176,30 @@ def test_channel_list_after_newjoin_test(clear, first_register, register_user):
         ]
     }
 
+def test_channel_list_after_leave_test(clear, first_register, register_user, register_channel):
+    '''
+    Tests the case that a user leaves one of their channels.
+
+    Expects: 
+        Correct output from channel/list
+    '''
+
+    token = first_register.get('token')
+    channel_id1 = first_register.get('channel_id')
+    channel_id2 = register_channel(token, 'channel2', True)
+
+    requests.post(url + 'channel/leave/v1', json = {'token': token, 'channel_id': channel_id1})
+
+    channel_list = requests.get(url + 'channels/list/v2', params = {'token': token}).json()
+    assert channel_list == { 
+        'channels': [
+            {
+                'channel_id': channel_id2, 
+                'name': 'channel2'
+            }
+        ]
+    }
+
 def test_invalid_auth_id(clear):
     '''
     Tests whether the auth id is invalid.
@@ -0,0 +1,166 @@
+import pytest
+import requests
+
+from src import config
+
+@pytest.fixture
+def clear_server():
+    requests.delete(config.url + 'clear/v1')
+
+@pytest.fixture
+def get_user_1():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'owner@test.com',
+        'password': 'spotato',
+        'name_first': 'owner',
+        'name_last' : 'one'
+    })
+    return response.json()
+
+@pytest.fixture
+def get_user_2():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'example@email.com',
+        'password': 'potato',
+        'name_first': 'John',
+        'name_last' : 'smith'
+    })
+    return response.json()
+
+@pytest.fixture
+def channel_id(get_user_1):
+    return requests.post(config.url + 'channels/create/v2', json={
+        'token': get_user_1['token'],
+        'name': 'test channel',
+        'is_public': True
+    }).json()['channel_id']
+
+# sends count messages and returns them, oldest first
+def send_messages(token, channel_id, count):
+    message_ids = [
+        requests.post(config.url + 'message/send/v1', json={
+            'token': token,
+            'channel_id': channel_id,
+            'message': f'message {index}'
+        }).json()['message_id']
+        for index in range(count)
+    ]
+
+    by_id = {}
+    for start in range(0, count, 50):
+        messages = requests.get(config.url + 'channel/messages/v2', params={
+            'token': token,
+            'channel_id': channel_id,
+            'start': start
+        }).json()['messages']
+        by_id.update({message['message_id']: message for message in messages})
+
+    return [by_id[message_id] for message_id in message_ids]
+
+def get_range(token, channel_id, **params):
+    return requests.get(config.url + 'channel/messages/range/v1', params={
+        'token': token,
+        'channel_id': channel_id,
+        **params
+    })
+
+def test_empty_channel(clear_server, get_user_1, channel_id):
+    '''
+    Case where no messages are sent
+
+    Expects:
+        No messages and end = -1
+    '''
+    response = get_range(get_user_1['token'], channel_id, time_start=0)
+
+    assert response.json() == {'messages': [], 'start': 0, 'end': -1}
+
+def test_messages_in_range(clear_server, get_user_1, channel_id):
+    '''
+    Only the messages created from time_start to time_end are returned, most
+    recent first
+
+    Expects:
+        The messages between the times of the third and seventh message, both
+        included
+    '''
+    messages = send_messages(get_user_1['token'], channel_id, 10)
+
+    response = get_range(
+        get_user_1['token'],
+        channel_id,
+        time_start=messages[2]['time_created'],
+        time_end=messages[6]['time_created']
+    )
+
+    assert response.status_code == 200
+    assert response.json()['messages'] == list(reversed(messages[2:7]))
+    assert response.json()['end'] == -1
+
+def test_messages_since(clear_server, get_user_1, channel_id):
+    '''
+    Without time_end, every message since time_start is returned
+
+    Expects:
+        The messages from the fourth on, and none after the newest
+    '''
+    messages = send_messages(get_user_1['token'], channel_id, 6)
+
+    since = get_range(get_user_1['token'], channel_id, time_start=messages[3]['time_created'])
+    assert since.json()['messages'] == list(reversed(messages[3:]))
+
+    after = get_range(get_user_1['token'], channel_id, time_start=messages[-1]['time_created'] + 1)
+    assert after.json()['messages'] == []
+
+def test_range_is_paged(clear_server, get_user_1, channel_id):
+    '''
+    Ranges holding more than 50 messages are paged with start, and removed
+    messages are skipped
+
+    Expects:
+        Two pages which together hold every remaining message in the range
+    '''
+    messages = send_messages(get_user_1['token'], channel_id, 70)
+
+    for message in messages[10:15]:
+        requests.delete(config.url + 'message/remove/v1', json={'token': get_user_1['token'], 'message_id': message['message_id']})
+    remaining = [message for message in messages[5:] if message not in messages[10:15]]
+
+    first_page = get_range(get_user_1['token'], channel_id, time_start=messages[5]['time_created'])
+    assert first_page.json()['messages'] == list(reversed(remaining))[:50]
+    assert first_page.json()['end'] == 50
+
+    second_page = get_range(get_user_1['token'], channel_id, time_start=messages[5]['time_created'], start=50)
+    assert second_page.json()['messages'] == list(reversed(remaining))[50:]
+    assert second_page.json()['end'] == -1
+
+def test_invalid_range(clear_server, get_user_1, channel_id):
+    '''
+    time_end before time_start, or start past the end of the range
+
+    Expects:
+        InputError (400 error)
+    '''
+    messages = send_messages(get_user_1['token'], channel_id, 3)
+
+    assert get_range(get_user_1['token'], channel_id, time_start=messages[2]['time_created'], time_end=messages[0]['time_created']).status_code == 400
+    assert get_range(get_user_1['token'], channel_id, time_start=messages[0]['time_created'], start=4).status_code == 400
+    assert get_range(get_user_1['token'], channel_id, time_start=messages[0]['time_created'], start=-1).status_code == 400
+
+def test_invalid_channel_id(clear_server, get_user_1):
+    '''
+    Tests case where channel_id is invalid
+
+    Expects:
+        InputError (400 error)
+    '''
+    assert get_range(get_user_1['token'], 9912901, time_start=0).status_code == 400
+
+def test_not_member(clear_server, get_user_1, get_user_2, channel_id):
+    '''
+    Tests case where the authorised user is not a member of the channel
+
+    Expects:
+        AccessError (403 error)
+    '''
+    assert get_range(get_user_2['token'], channel_id, time_start=0).status_code == 403
@@ -0,0 +1,195 @@
+import base64
+import pytest
+import requests
+
+from src import config
+
+@pytest.fixture
+def clear_server():
+    requests.delete(config.url + 'clear/v1')
+
+@pytest.fixture
+def get_user_1():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'owner@test.com',
+        'password': 'spotato',
+        'name_first': 'owner',
+        'name_last' : 'one'
+    })
+    return response.json()
+
+@pytest.fixture
+def get_user_2():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'example@email.com',
+        'password': 'potato',
+        'name_first': 'John',
+        'name_last' : 'smith'
+    })
+    return response.json()
+
+@pytest.fixture
+def channel_id(get_user_1):
+    return requests.post(config.url + 'channels/create/v2', json={
+        'token': get_user_1['token'],
+        'name': 'test channel',
+        'is_public': True
+    }).json()['channel_id']
+
+# a cursor in the format the endpoint returns, anchored on any message_id
+def cursor(message_id):
+    return base64.urlsafe_b64encode(f'message:{message_id}'.encode()).decode()
+
+def send_message(token, channel_id, message):
+    return requests.post(config.url + 'message/send/v1', json={
+        'token': token,
+        'channel_id': channel_id,
+        'message': message
+    }).json()['message_id']
+
+def remove_message(token, message_id):
+    requests.delete(config.url + 'message/remove/v1', json={'token': token, 'message_id': message_id})
+
+def get_page(token, channel_id, **params):
+    return requests.get(config.url + 'channel/messages/v3', params={
+        'token': token,
+        'channel_id': channel_id,
+        **params
+    })
+
+def test_empty_channel(clear_server, get_user_1, channel_id):
+    '''
+    Case where no messages are sent
+
+    Expects:
+        No messages, end = -1 and no cursor to older messages
+    '''
+    page = get_page(get_user_1['token'], channel_id).json()
+
+    assert page['messages'] == []
+    assert page['start'] == 0
+    assert page['end'] == -1
+    assert page['before'] is None
+
+def test_start_matches_v2(clear_server, get_user_1, channel_id):
+    '''
+    Without a cursor, pages are read from start like channel/messages/v2
+
+    Expects:
+        The same messages, start and end as channel/messages/v2
+    '''
+    for index in range(60):
+        send_message(get_user_1['token'], channel_id, f'message {index}')
+
+    for start in [0, 50, 60]:
+        page = get_page(get_user_1['token'], channel_id, start=start).json()
+        v2_page = requests.get(config.url + 'channel/messages/v2', params={
+            'token': get_user_1['token'],
+            'channel_id': channel_id,
+            'start': start
+        }).json()
+
+        assert {key: page[key] for key in v2_page} == v2_page
+
+def test_before_cursor_is_stable(clear_server, get_user_1, channel_id):
+    '''
+    Walking back through the history with before cursors while messages are
+    sent and removed between requests
+
+    Expects:
+        Every message that was never removed exactly once, most recent first
+    '''
+    message_ids = [send_message(get_user_1['token'], channel_id, f'message {index}') for index in range(120)]
+    removed = set(message_ids[60:65]) | {message_ids[49]}
+
+    page = get_page(get_user_1['token'], channel_id).json()
+    seen = [message['message_id'] for message in page['messages']]
+
+    # a send and some removals between pages would shift a start index
+    send_message(get_user_1['token'], channel_id, 'newer')
+    for message_id in removed:
+        remove_message(get_user_1['token'], message_id)
+
+    while page['before'] is not None:
+        page = get_page(get_user_1['token'], channel_id, before=page['before']).json()
+        seen += [message['message_id'] for message in page['messages']]
+
+    assert page['end'] == -1
+    assert len(seen) == len(set(seen))
+    assert seen[:50] == list(reversed(message_ids))[:50]
+    assert seen[50:] == [message_id for message_id in reversed(message_ids[:70]) if message_id not in removed]
+
+def test_after_cursor_returns_new_messages(clear_server, get_user_1, channel_id):
+    '''
+    The after cursor of a page returns the messages sent since, oldest first
+    when there are more than a page of them
+
+    Expects:
+        No messages before anything is sent, then the new messages, most recent
+        first
+    '''
+    message_ids = [send_message(get_user_1['token'], channel_id, f'message {index}') for index in range(3)]
+
+    page = get_page(get_user_1['token'], channel_id).json()
+    polled = get_page(get_user_1['token'], channel_id, after=page['after']).json()
+    assert polled['messages'] == []
+    assert polled['start'] == 0
+
+    new_ids = [send_message(get_user_1['token'], channel_id, f'new {index}') for index in range(55)]
+
+    polled = get_page(get_user_1['token'], channel_id, after=polled['after']).json()
+    assert [message['message_id'] for message in polled['messages']] == list(reversed(new_ids[:50]))
+    assert polled['start'] == 5
+    assert polled['end'] == 55
+
+    polled = get_page(get_user_1['token'], channel_id, after=polled['after']).json()
+    assert [message['message_id'] for message in polled['messages']] == list(reversed(new_ids[50:]))
+    assert polled['start'] == 0
+
+    older = get_page(get_user_1['token'], channel_id, before=polled['before']).json()
+    assert [message['message_id'] for message in older['messages']] == list(reversed(message_ids + new_ids[:50]))[:50]
+
+def test_invalid_cursor(clear_server, get_user_1, channel_id):
+    '''
+    Cursors that were not returned by the endpoint, cursors of message_ids
+    out of range, and a cursor given along with start
+
+    Expects:
+        InputError (400 error)
+    '''
+    send_message(get_user_1['token'], channel_id, 'message')
+    page = get_page(get_user_1['token'], channel_id).json()
+
+    assert get_page(get_user_1['token'], channel_id, before='not a cursor').status_code == 400
+    assert get_page(get_user_1['token'], channel_id, after='bWVzc2FnZTp4').status_code == 400
+    assert get_page(get_user_1['token'], channel_id, before=cursor(2 ** 63)).status_code == 400
+    assert get_page(get_user_1['token'], channel_id, after=cursor(-1)).status_code == 400
+    assert get_page(get_user_1['token'], channel_id, start=0, after=page['after']).status_code == 400
+
+def test_invalid_start(clear_server, get_user_1, channel_id):
+    '''
+    Negative start, or start greater than the number of messages
+
+    Expects:
+        InputError (400 error)
+    '''
+    assert get_page(get_user_1['token'], channel_id, start=-1).status_code == 400
+    assert get_page(get_user_1['token'], channel_id, start=1).status_code == 400
+
+def test_invalid_channel_id(clear_server, get_user_1):
+    '''
+    Tests case where channel_id is invalid
+
+    Expects:
+        InputError (400 error)
+    '''
+    assert get_page(get_user_1['token'], 9912901).status_code == 400
+
+def test_not_member(clear_server, get_user_1, get_user_2, channel_id):
+    '''
+    Tests case where the authorised user is not a member of the channel
+
+    Expects:
+        AccessError (403 error)
+    '''
+    assert get_page(get_user_2['token'], channel_id).status_code == 403
@@ -0,0 +1,473 @@
+'''
+
+Datastore persistence
+
+The server records every mutation in src/json_dump so that a freshly loaded
+Datastore sees exactly the same state as the running server.
+
+'''
+
+import json
+import os
+import shutil
+import threading
+import time
+import jwt
+import pytest
+import requests
+from src import config
+
+from src.config import CHECKPOINT_LOG_RECORDS, DATASTORE_BACKEND, DURABILITY, SECRET
+from src.data_store import Datastore
+from src.snapshot import JSON_SNAPSHOT_PATH, SnapshotError, convert_json_snapshot, encode_snapshot, decode_snapshot, read_json_snapshot, read_snapshot
+
+# these tests read the files written by the json backend
+pytestmark = pytest.mark.skipif(DATASTORE_BACKEND != 'json', reason='server is not using the json datastore')
+
+@pytest.fixture
+def clear_server():
+    requests.delete(config.url + "clear/v1")
+
+# Fixture to register someone and returns a dictionary of {token, auth_user_id}
+@pytest.fixture
+def get_user_1():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'owner@test.com',
+        'password': 'spotato',
+        'name_first': 'owner',
+        'name_last' : 'one'
+        })
+    return response.json()
+
+# Fixture to register someone and returns a dictionary of {token, auth_user_id}
+@pytest.fixture
+def get_user_2():
+    response = requests.post(config.url + 'auth/register/v2', json={
+        'email': 'example@email.com',
+        'password': 'potato',
+        'name_first': 'John',
+        'name_last' : 'smith'
+        })
+    return response.json()
+
+@pytest.fixture
+def channel_id(get_user_1):
+    return requests.post(config.url + 'channels/create/v2', json={
+        'token': get_user_1['token'],
+        'name': 'test channel',
+        'is_public': True
+    }).json()['channel_id']
+
+def test_users_are_reloaded(clear_server, get_user_1, get_user_2):
+    '''
+    Registered users and their sessions are visible to a freshly loaded Datastore
+
+    Expects:
+        Both users, their logins and their tokens to be restored
+    '''
+    store = Datastore()
+
+    assert store.get_user_from_u_id(get_user_2['auth_user_id'])['handle_str'] == 'johnsmith'
+    assert store.get_login_from_email('owner@test.com')['auth_id'] == get_user_1['auth_user_id']
+    session_id = jwt.decode(get_user_2['token'], SECRET, algorithms=['HS256'])['session_id']
+    assert store.get_u_id_from_session(session_id) == get_user_2['auth_user_id']
+
+def test_channel_membership_is_reloaded(clear_server, get_user_1, get_user_2, channel_id):
+    '''
+    Joining and leaving a channel are persisted
+
+    Expects:
+        Membership of the reloaded channel to match the server
+    '''
+    requests.post(config.url + 'channel/join/v2', json={'token': get_user_2['token'], 'channel_id': channel_id})
+
+    store = Datastore()
+    assert store.is_user_member_of_channel(channel_id, get_user_2['auth_user_id'])
+
+    requests.post(config.url + 'channel/leave/v1', json={'token': get_user_2['token'], 'channel_id': channel_id})
+
+    store = Datastore()
+    assert not store.is_user_member_of_channel(channel_id, get_user_2['auth_user_id'])
+    assert store.is_channel_owner(channel_id, get_user_1['auth_user_id'])
+
+    # members are listed in the order they joined
+    requests.post(config.url + 'channel/join/v2', json={'token': get_user_2['token'], 'channel_id': channel_id})
+
+    store = Datastore()
+    members = store.get_channel_from_channel_id(channel_id)['all_members']
+    assert [member['u_id'] for member in members] == [get_user_1['auth_user_id'], get_user_2['auth_user_id']]
+    assert members[1]['handle_str'] == 'johnsmith'
+
+def test_messages_are_reloaded(clear_server, get_user_1, channel_id):
+    '''
+    Sent, edited and removed messages are persisted
+
+    Expects:
+        The reloaded channel to hold the same messages as the server
+    '''
+    message_ids = [requests.post(config.url + 'message/send/v1', json={
+        'token': get_user_1['token'],
+        'channel_id': channel_id,
+        'message': f'message {index}'
+    }).json()['message_id'] for index in range(3)]
+
+    requests.put(config.url + 'message/edit/v1', json={'token': get_user_1['token'], 'message_id': message_ids[2], 'message': 'edited'})
+    requests.delete(config.url + 'message/remove/v1', json={'token': get_user_1['token'], 'message_id': message_ids[0]})
+
+    server_messages = requests.get(config.url + 'channel/messages/v2', params={
+        'token': get_user_1['token'],
+        'channel_id': channel_id,
+        'start': 0
+    }).json()['messages']
+
+    store = Datastore()
+    assert store.get_messages_from_channel_or_dm_id(channel_id) == server_messages
+    assert [message['message'] for message in server_messages] == ['edited', 'message 1']
+    assert store.get_messages_count() == 3
+
+def test_checkpoint_compacts_log(clear_server, get_user_1, channel_id):
+    '''
+    Once enough mutations are logged a checkpoint writes them into the snapshot
+
+    Expects:
+        The log to be truncated and a freshly loaded Datastore to match the server,
+        loading a channel's message index only once it is accessed
+    '''
+    quiet_channel_id = requests.post(config.url + 'channels/create/v2', json={
+        'token': get_user_1['token'],
+        'name': 'quiet channel',
+        'is_public': True
+    }).json()['channel_id']
+
+    requests.post(config.url + 'message/send/v1', json={
+        'token': get_user_1['token'],
+        'channel_id': quiet_channel_id,
+        'message': 'before checkpoint'
+    })
+
+    for _ in range(CHECKPOINT_LOG_RECORDS):
+        requests.post(config.url + 'message/send/v1', json={
+            'token': get_user_1['token'],
+            'channel_id': channel_id,
+            'message': 'hello'
+        })
+
+    # checkpoints run in the background
+    for _ in range(50):
+        stats = requests.get(config.url + 'admin/stats/v1', params={'token': get_user_1['token']}).json()['persistence']
+        if stats['last_checkpoint_seconds'] is not None:
+            break
+        time.sleep(0.1)
+
+    assert stats['last_checkpoint_seconds'] is not None
+    assert stats['log_records'] < CHECKPOINT_LOG_RECORDS
+
+    store = Datastore()
+    assert store.get_num_messages_from_channel_or_dm_id(channel_id) == CHECKPOINT_LOG_RECORDS
+    assert store.get_messages_count() == CHECKPOINT_LOG_RECORDS + 1
+
+    # a deep page is read straight from the checkpointed message log
+    deep_page = requests.get(config.url + 'channel/messages/v2', params={
+        'token': get_user_1['token'],
+        'channel_id': channel_id,
+        'start': CHECKPOINT_LOG_RECORDS - 50
+    }).json()
+    assert deep_page['end'] == -1
+    assert store.get_messages_page_from_channel_or_dm_id(channel_id, CHECKPOINT_LOG_RECORDS - 50, 50) == deep_page['messages']
+
+    # the quiet channel has not been touched since the checkpoint
+    assert quiet_channel_id not in store.get()['messages']
+    assert store.get_messages_from_channel_or_dm_id(quiet_channel_id)[0]['message'] == 'before checkpoint'
+
+@pytest.mark.skipif(DURABILITY != 'commit', reason='the log is not synced by each commit')
+def test_request_is_committed_once(clear_server, get_user_1):
+    '''
+    All the mutations made by a single request share one log sync
+
+    Expects:
+        Registering a user (4 logged mutations) to sync the log once
+    '''
+    def log_syncs():
+        return requests.get(config.url + 'admin/stats/v1', params={'token': get_user_1['token']}).json()['persistence']['log_syncs']
+
+    syncs_before = log_syncs()
+
+    requests.post(config.url + 'auth/register/v2', json={
+        'email': 'example@email.com',
+        'password': 'potato',
+        'name_first': 'John',
+        'name_last' : 'smith'
+    })
+
+    assert log_syncs() == syncs_before + 1
+
+def test_json_snapshot_is_converted(tmp_path):
+    '''
+    An older json text dump converts into a binary snapshot
+
+    Expects:
+        The int keys that json turned into strings to be restored
+    '''
+    json_path = tmp_path / 'data_store.txt'
+    json_path.write_text(json.dumps({
+        'login': {'owner@test.com': {'password': 'hash', 'auth_id': 0}},
+        'users': {'0': {'u_id': 0, 'email': 'owner@test.com'}},
+        'perms': {'0': 1},
+        'channels': {'1': {'name': 'test channel'}},
+        'message_count': 0
+    }))
+
+    convert_json_snapshot(str(json_path), str(tmp_path / 'data_store.bin'))
+    store = read_snapshot(str(tmp_path / 'data_store.bin'))
+
+    assert store['users'][0]['email'] == 'owner@test.com'
+    assert store['perms'] == {0: 1}
+    assert store['channels'][1]['name'] == 'test channel'
+    assert store['login']['owner@test.com']['auth_id'] == 0
+
+def test_corrupt_snapshot_is_rejected():
+    '''
+    A truncated, corrupt or foreign snapshot is never loaded
+
+    Expects:
+        SnapshotError
+    '''
+    snapshot = encode_snapshot({'users': {0: {'u_id': 0}}})
+    assert decode_snapshot(snapshot) == {'users': {0: {'u_id': 0}}}
+
+    with pytest.raises(SnapshotError):
+        decode_snapshot(snapshot[:-1])
+
+    with pytest.raises(SnapshotError):
+        decode_snapshot(snapshot[:-1] + b'\x00')
+
+    with pytest.raises(SnapshotError):
+        decode_snapshot(b'not a snapshot at all, but long enough')
+
+def test_checkpoint_writes_dirty_sections(clear_server, get_user_1):
+    '''
+    A checkpoint only rewrites the sections changed since the last checkpoint
+
+    Expects:
+        A checkpoint made after nothing but name changes to only write the users
+        section
+    '''
+    def wait_for_checkpoint(last_checkpoint):
+        for _ in range(50):
+            stats = requests.get(config.url + 'admin/stats/v1', params={'token': get_user_1['token']}).json()['persistence']
+            if stats['last_checkpoint_sections'] is not None and stats['last_checkpoint_sections'] != last_checkpoint:
+                return stats['last_checkpoint_sections']
+            time.sleep(0.1)
+
+    def setname_until_checkpoint(last_checkpoint):
+        for index in range(CHECKPOINT_LOG_RECORDS):
+            requests.put(config.url + 'user/profile/setname/v1', json={
+                'token': get_user_1['token'],
+                'name_first': 'owner',
+                'name_last': f'number{index}'
+            })
+        return wait_for_checkpoint(last_checkpoint)
+
+    # the first checkpoint writes every section changed by clear and register
+    first_checkpoint = setname_until_checkpoint(None)
+    assert 'users' in first_checkpoint
+
+    assert setname_until_checkpoint(first_checkpoint) == ['users']
+
+    store = Datastore()
+    assert store.get_user_from_u_id(get_user_1['auth_user_id'])['name_last'] == f'number{CHECKPOINT_LOG_RECORDS - 1}'
+
+def test_sessions_are_not_logged(clear_server, get_user_1):
+    '''
+    Logging in and out only writes to the sessions file
+
+    Expects:
+        No mutation log records for logins and logouts, and the sessions still
+        open to be visible to a freshly loaded Datastore
+    '''
+    def log_records():
+        return requests.get(config.url + 'admin/stats/v1', params={'token': get_user_1['token']}).json()['persistence']['log_records']
+
+    records = log_records()
+    tokens = [
+        requests.post(config.url + 'auth/login/v2', json={'email': 'owner@test.com', 'password': 'spotato'}).json()['token']
+        for _ in range(5)
+    ]
+    requests.post(config.url + 'auth/logout/v1', json={'token': tokens[0]})
+    assert log_records() == records
+
+    store = Datastore()
+    assert store.get_num_sessions() == 5
+
+def test_write_queue_metrics(clear_server, get_user_1):
+    '''
+    The log writer's queue depth and flush lag are reported
+
+    Expects:
+        The mutations of a request to have been written by the time it responds
+        to it, when every commit is synced
+    '''
+    stats = requests.get(config.url + 'admin/stats/v1', params={'token': get_user_1['token']}).json()['persistence']
+
+    assert stats['last_flush_lag_seconds'] >= 0
+    if DURABILITY == 'commit':
+        assert stats['write_queue_depth'] == 0
+
+def test_removed_messages_keep_pages_in_order(clear_server, get_user_1, channel_id):
+    '''
+    Removing messages leaves every other message where it was
+
+    Expects:
+        Pages of the server and of a reloaded Datastore to skip the removed
+        messages, and later edits to still find their message
+    '''
+    message_ids = [requests.post(config.url + 'message/send/v1', json={
+        'token': get_user_1['token'],
+        'channel_id': channel_id,
+        'message': f'message {index}'
+    }).json()['message_id'] for index in range(120)]
+
+    for message_id in message_ids[::3]:
+        requests.delete(config.url + 'message/remove/v1', json={'token': get_user_1['token'], 'message_id': message_id})
+
+    requests.put(config.url + 'message/edit/v1', json={'token': get_user_1['token'], 'message_id': message_ids[1], 'message': 'edited'})
+
+    remaining = [message_id for message_id in reversed(message_ids) if message_id not in message_ids[::3]]
+    store = Datastore()
+
+    for start in [0, 50]:
+        page = requests.get(config.url + 'channel/messages/v2', params={
+            'token': get_user_1['token'],
+            'channel_id': channel_id,
+            'start': start
+        }).json()
+        assert [message['message_id'] for message in page['messages']] == remaining[start:start + 50]
+        assert store.get_messages_page_from_channel_or_dm_id(channel_id, start, 50) == page['messages']
+
+    assert store.get_num_messages_from_channel_or_dm_id(channel_id) == 80
+    assert store.get_message_from_message_id(message_ids[1])['message'] == 'edited'
+    assert store.is_invalid_message_id(message_ids[0])
+
+def test_checkpoint_appends_to_slot_table(clear_server, get_user_1, channel_id):
+    '''
+    A checkpoint appends the slots of new messages to the channel's slot table
+    instead of writing it again, until a saved message changes
+
+    Expects:
+        The slot table to keep its version while messages are only sent, to get a
+        new one once a saved message is edited, and a reloaded Datastore to
+        match the server
+    '''
+    def send_until_checkpoint(message, last_segment):
+        for _ in range(CHECKPOINT_LOG_RECORDS):
+            requests.post(config.url + 'message/send/v1', json={
+                'token': get_user_1['token'],
+                'channel_id': channel_id,
+                'message': message
+            })
+
+        # checkpoints run in the background
+        for _ in range(50):
+            segment = read_snapshot().get('slots', {}).get(channel_id)
+            if segment is not None and segment != last_segment:
+                return segment
+            time.sleep(0.1)
+
+    first_version, first_length = send_until_checkpoint('first', None)
+    second_version, second_length = send_until_checkpoint('second', (first_version, first_length))
+
+    assert second_version == first_version
+    assert second_length > first_length
+
+    requests.put(config.url + 'message/edit/v1', json={'token': get_user_1['token'], 'message_id': 0, 'message': 'edited'})
+    third_version, _ = send_until_checkpoint('third', (second_version, second_length))
+
+    assert third_version != first_version
+
+    store = Datastore()
+    assert store.get_num_messages_from_channel_or_dm_id(channel_id) == 3 * CHECKPOINT_LOG_RECORDS
+    assert store.get_message_from_message_id(0)['message'] == 'edited'
+    assert store.get_message_from_message_id(CHECKPOINT_LOG_RECORDS)['message'] == 'second'
+
+def test_members_are_stored_as_u_ids(clear_server, get_user_1, get_user_2, channel_id):
+    '''
+    Channels and dms only store the u_ids of their members, profiles are
+    looked up as the members are listed
+
+    Expects:
+        The reloaded channel and dm to list the members' current profiles
+    '''
+    requests.post(config.url + 'channel/join/v2', json={'token': get_user_2['token'], 'channel_id': channel_id})
+    dm_id = requests.post(config.url + 'dm/create/v1', json={'token': get_user_1['token'], 'u_ids': [get_user_2['auth_user_id']]}).json()['dm_id']
+
+    requests.put(config.url + 'user/profile/setname/v1', json={'token': get_user_2['token'], 'name_first': 'Jane', 'name_last': 'Doe'})
+
+    store = Datastore()
+    assert list(store.get_channels_from_channel_id_dict()[channel_id]['all_members']) == [get_user_1['auth_user_id'], get_user_2['auth_user_id']]
+    assert store.get_channel_from_channel_id(channel_id)['all_members'][1]['name_first'] == 'Jane'
+    dm_members = {member['u_id']: member for member in store.get_dm_from_dm_id(dm_id)['members']}
+    assert dm_members[get_user_2['auth_user_id']]['name_last'] == 'Doe'
+
+def test_clear_after_restart(tmp_path, monkeypatch):
+    '''
+    Clearing a Datastore that was loaded with records in its log, before it
+    has logged anything itself
+
+    Expects:
+        The clear, and the mutations after it, to return
+    '''
+    os.makedirs(tmp_path / 'src' / 'json_dump')
+    shutil.copy(JSON_SNAPSHOT_PATH, tmp_path / JSON_SNAPSHOT_PATH)
+    monkeypatch.chdir(tmp_path)
+
+    store = Datastore()
+    store.insert_user_perm(5, 2)
+    store.flush()
+
+    restarted = Datastore()
+    assert restarted.get_user_perms_from_u_id(5) == 2
+
+    def clear_and_insert():
+        restarted.hard_reset()
+        restarted.insert_user_perm(6, 2)
+        restarted.flush()
+
+    thread = threading.Thread(target=clear_and_insert, daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert restarted.get_user_perms_from_u_id(5) is None
+    assert restarted.get_user_perms_from_u_id(6) == 2
+
+def test_set_survives_restart(tmp_path, monkeypatch):
+    '''
+    Replacing the whole store, then making a mutation, and loading a fresh
+    Datastore
+
+    Expects:
+        The fresh Datastore to see the store that was set, with its int keys,
+        and the mutation made after it
+    '''
+    os.makedirs(tmp_path / 'src' / 'json_dump')
+    shutil.copy(JSON_SNAPSHOT_PATH, tmp_path / JSON_SNAPSHOT_PATH)
+    monkeypatch.chdir(tmp_path)
+
+    store = Datastore()
+    contents = read_json_snapshot()
+    contents['users'] = {0: {'u_id': 0, 'email': 'owner@test.com', 'name_first': 'owner', 'name_last': 'one', 'handle_str': 'ownerone'}}
+    contents['login'] = {'owner@test.com': {'password': 'hash', 'auth_id': 0}}
+    contents['perms'] = {0: 1}
+    contents['channels'] = {1: {'name': 'test channel', 'is_public': True, 'owner_members': [{'u_id': 0}], 'all_members': [{'u_id': 0}]}}
+    contents['messages'] = {1: [{'message_id': 0, 'u_id': 0, 'message': 'hello', 'time_created': 1000}]}
+    contents['message_count'] = 1
+    store.set(contents)
+    store.insert_user_perm(5, 2)
+    store.flush()
+
+    restarted = Datastore()
+    assert restarted.get_user_perms_from_u_id(0) == 1
+    assert restarted.get_user_perms_from_u_id(5) == 2
+    assert restarted.get_channel_names_from_u_id(0) == {1: 'test channel'}
+    assert restarted.get_channel_or_dm_id_from_message_id(0) == 1
+    assert [message['message'] for message in restarted.get_messages_from_channel_or_dm_id(1)] == ['hello']
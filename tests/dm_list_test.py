@@ -122,6 +122,33 @@ def test_user_has_no_dms(register, dm_factory):
         'dms': []
     }
 
+def test_left_and_removed_dms(register, dm_factory):
+    '''
+    Tests that dms the user has left or that were removed are not listed.
+
+    Expects: 
+        Only the remaining dms, oldest first.
+    '''
+
+    dm_id1 = dm_factory(register[0]['token'], [register[1]['auth_user_id']])
+    dm_id2 = dm_factory(register[0]['token'], [register[1]['auth_user_id']])
+    dm_id3 = dm_factory(register[0]['token'], [register[1]['auth_user_id']])
+
+    requests.post(url + 'dm/leave/v1', json = {'token': register[1]['token'], 'dm_id': dm_id1})
+    requests.delete(url + 'dm/remove/v1', json = {'token': register[0]['token'], 'dm_id': dm_id2})
+
+    dm_list = requests.get(url + 'dm/list/v1', params = {
+        'token': register[1]['token']
+        }).json()
+
+    assert [dm['dm_id'] for dm in dm_list['dms']] == [dm_id3]
+
+    dm_list = requests.get(url + 'dm/list/v1', params = {
+        'token': register[0]['token']
+        }).json()
+
+    assert [dm['dm_id'] for dm in dm_list['dms']] == [dm_id1, dm_id3]
+
 def test_invalid_token():
     '''
     Test expecting access error when token is invalid. 
@@ -0,0 +1,125 @@
+import pytest
+import requests
+
+from src.config import url
+
+@pytest.fixture
+def clear():
+    requests.delete(url + 'clear/v1')
+
+# Create an owner and some users
+@pytest.fixture
+def register(clear):
+    owner_id = requests.post(url + 'auth/register/v2', json = {
+        'email': 'owner@test.com',
+        'password': 'password',
+        'name_first': 'owner',
+        'name_last': 'one' }
+        ).json()
+
+    user1_id = requests.post(url + 'auth/register/v2', json = {
+        'email': 'user1@test.com',
+        'password': 'password',
+        'name_first': 'user',
+        'name_last': 'one' }
+    ).json()
+
+    user2_id = requests.post(url + 'auth/register/v2', json = {
+        'email': 'user2@test.com',
+        'password': 'password',
+        'name_first': 'user',
+        'name_last': 'two' }
+    ).json()
+
+    return [owner_id, user1_id, user2_id]
+
+@pytest.fixture
+def dm_id(register):
+    return requests.post(url + 'dm/create/v1', json = {
+        'token': register[0]['token'],
+        'u_ids': [register[1]['auth_user_id']]}).json()['dm_id']
+
+# sends count messages and returns them, oldest first
+def send_messages(token, dm_id, count):
+    message_ids = [
+        requests.post(url + 'message/senddm/v1', json = {
+            'token': token,
+            'dm_id': dm_id,
+            'message': f'message {index}'}).json()['message_id']
+        for index in range(count)
+    ]
+
+    messages = requests.get(url + 'dm/messages/v1', params = {
+        'token': token,
+        'dm_id': dm_id,
+        'start': 0}).json()['messages']
+    by_id = {message['message_id']: message for message in messages}
+
+    return [by_id[message_id] for message_id in message_ids]
+
+def get_range(token, dm_id, **params):
+    return requests.get(url + 'dm/messages/range/v1', params = {
+        'token': token,
+        'dm_id': dm_id,
+        **params})
+
+def test_messages_in_range(register, dm_id):
+    '''
+    Only the messages created from time_start to time_end are returned, most
+    recent first, by every member of the DM
+
+    Expects:
+        The messages between the times of the second and fourth message
+    '''
+    messages = send_messages(register[0]['token'], dm_id, 6)
+
+    for member in register[:2]:
+        response = get_range(
+            member['token'],
+            dm_id,
+            time_start = messages[1]['time_created'],
+            time_end = messages[3]['time_created'])
+
+        assert response.json() == {'messages': list(reversed(messages[1:4])), 'start': 0, 'end': -1}
+
+def test_messages_since(register, dm_id):
+    '''
+    Without time_end, every message since time_start is returned
+
+    Expects:
+        The last two messages
+    '''
+    messages = send_messages(register[1]['token'], dm_id, 4)
+
+    response = get_range(register[1]['token'], dm_id, time_start = messages[2]['time_created'])
+    assert response.json()['messages'] == list(reversed(messages[2:]))
+
+def test_invalid_range(register, dm_id):
+    '''
+    time_end before time_start
+
+    Expects:
+        InputError (400 error)
+    '''
+    messages = send_messages(register[0]['token'], dm_id, 2)
+
+    response = get_range(register[0]['token'], dm_id, time_start = messages[1]['time_created'], time_end = messages[0]['time_created'])
+    assert response.status_code == 400
+
+def test_invalid_dm_id(register):
+    '''
+    dm_id does not refer to a valid DM
+
+    Expects:
+        InputError (400 error)
+    '''
+    assert get_range(register[0]['token'], 12345, time_start = 0).status_code == 400
+
+def test_not_member(register, dm_id):
+    '''
+    The authorised user is not a member of the DM
+
+    Expects:
+        AccessError (403 error)
+    '''
+    assert get_range(register[2]['token'], dm_id, time_start = 0).status_code == 403
@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+from src.config import url
+
+@pytest.fixture
+def clear():
+    requests.delete(url + 'clear/v1')
+
+# Create an owner and some users
+@pytest.fixture
+def register(clear):
+    owner_id = requests.post(url + 'auth/register/v2', json = {
+        'email': 'owner@test.com',
+        'password': 'password',
+        'name_first': 'owner',
+        'name_last': 'one' }
+        ).json()
+
+    user1_id = requests.post(url + 'auth/register/v2', json = {
+        'email': 'user1@test.com',
+        'password': 'password',
+        'name_first': 'user',
+        'name_last': 'one' }
+    ).json()
+
+    user2_id = requests.post(url + 'auth/register/v2', json = {
+        'email': 'user2@test.com',
+        'password': 'password',
+        'name_first': 'user',
+        'name_last': 'two' }
+    ).json()
+
+    return [owner_id, user1_id, user2_id]
+
+@pytest.fixture
+def dm_id(register):
+    return requests.post(url + 'dm/create/v1', json = {
+        'token': register[0]['token'],
+        'u_ids': [register[1]['auth_user_id']]}).json()['dm_id']
+
+def send_message(token, dm_id, message):
+    return requests.post(url + 'message/senddm/v1', json = {
+        'token': token,
+        'dm_id': dm_id,
+        'message': message}).json()['message_id']
+
+def get_page(token, dm_id, **params):
+    return requests.get(url + 'dm/messages/v2', params = {
+        'token': token,
+        'dm_id': dm_id,
+        **params})
+
+def test_no_messages(register, dm_id):
+    '''
+    Test case where there are no messages.
+
+    Expects:
+        No messages, end = -1 and no cursor to older messages
+    '''
+    page = get_page(register[0]['token'], dm_id).json()
+
+    assert page['messages'] == []
+    assert page['end'] == -1
+    assert page['before'] is None
+
+def test_cursors(register, dm_id):
+    '''
+    Walking back through the DM with before cursors while a message is removed
+    and another sent, then reading the new message with the after cursor
+
+    Expects:
+        Every message that was never removed exactly once, then the new message
+    '''
+    message_ids = [send_message(register[0]['token'], dm_id, f'message {index}') for index in range(60)]
+
+    first_page = get_page(register[1]['token'], dm_id).json()
+    assert first_page['end'] == 50
+
+    requests.delete(url + 'message/remove/v1', json = {'token': register[0]['token'], 'message_id': message_ids[5]})
+    new_id = send_message(register[1]['token'], dm_id, 'new')
+
+    second_page = get_page(register[1]['token'], dm_id, before = first_page['before']).json()
+    seen = [message['message_id'] for message in first_page['messages'] + second_page['messages']]
+    assert seen == [message_id for message_id in reversed(message_ids) if message_id != message_ids[5]]
+    assert second_page['end'] == -1
+
+    newer = get_page(register[1]['token'], dm_id, after = first_page['after']).json()
+    assert [message['message_id'] for message in newer['messages']] == [new_id]
+
+def test_invalid_cursor(register, dm_id):
+    '''
+    A cursor that was not returned by the endpoint
+
+    Expects:
+        InputError (400 error)
+    '''
+    assert get_page(register[0]['token'], dm_id, before = '!!').status_code == 400
+
+def test_invalid_dm_id(register):
+    '''
+    dm_id does not refer to a valid DM
+
+    Expects:
+        InputError (400 error)
+    '''
+    assert get_page(register[0]['token'], 12345).status_code == 400
+
+def test_not_member(register, dm_id):
+    '''
+    The authorised user is not a member of the DM
+
+    Expects:
+        AccessError (403 error)
+    '''
+    assert get_page(register[2]['token'], dm_id).status_code == 403
@@ -0,0 +1,55 @@
+'''
+
+Password hashing
+
+Passwords are stored as salted pbkdf2 hashes, and the legacy sha256 hashes
+are upgraded when their user logs in.
+
+'''
+
+from src.passwords import PasswordHasher, legacy_hash
+
+def test_hashes_are_salted():
+    '''
+    Hashing the same password twice
+
+    Expects:
+        Two different hashes that both match the password, and neither match
+        another password
+    '''
+    hasher = PasswordHasher(1000, 0, 1)
+    first = hasher.hash('password')
+    second = hasher.hash('password')
+
+    assert first != second
+    assert hasher.verify('password', first) == (True, False)
+    assert hasher.verify('password', second) == (True, False)
+    assert hasher.verify('passw0rd', first) == (False, False)
+
+def test_old_hashes_need_upgrade():
+    '''
+    Legacy sha256 hashes and hashes made with another work factor
+
+    Expects:
+        Both to match the password and to be marked for an upgrade
+    '''
+    hasher = PasswordHasher(1000, 0, 1)
+
+    assert hasher.verify('password', legacy_hash('password')) == (True, True)
+    assert hasher.verify('passw0rd', legacy_hash('password')) == (False, True)
+    assert hasher.verify('password', PasswordHasher(500, 0, 1).hash('password')) == (True, True)
+
+def test_hashes_in_pool():
+    '''
+    Hashing in worker processes
+
+    Expects:
+        The same hashes as on the calling thread
+    '''
+    hasher = PasswordHasher(1000, 2, 4)
+    try:
+        stored = hasher.hash('password')
+        assert hasher.verify('password', stored) == (True, False)
+        assert PasswordHasher(1000, 0, 1).verify('password', stored) == (True, False)
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,119 @@
+'''
+
+Session store
+
+Sessions expire ttl seconds after they are created, and survive a reload of
+the sessions file until then.
+
+'''
+
+from src.sessions import SessionStore, COMPACT_LINES
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_sessions_expire(tmp_path):
+    '''
+    A session lets its token through until it expires or is revoked
+
+    Expects:
+        The u_id of the session before it expires, None afterwards
+    '''
+    clock = Clock()
+    sessions = SessionStore(str(tmp_path / 'sessions.log'), 60, clock=clock)
+
+    first = sessions.create(1)
+    clock.now += 30
+    second = sessions.create(2)
+    revoked = sessions.create(2)
+    sessions.revoke(revoked)
+
+    assert sessions.get_u_id(first) == 1
+    assert sessions.get_u_id(second) == 2
+    assert sessions.get_u_id(revoked) is None
+
+    clock.now += 30
+    assert sessions.get_u_id(first) is None
+    assert sessions.get_u_id(second) == 2
+    assert len(sessions) == 1
+
+def test_sessions_are_reloaded(tmp_path):
+    '''
+    A freshly loaded store sees the sessions that were live, and ignores a line
+    that was cut short
+
+    Expects:
+        The live sessions, and none of the expired or revoked ones
+    '''
+    clock = Clock()
+    path = tmp_path / 'sessions.log'
+    sessions = SessionStore(str(path), 60, clock=clock)
+
+    expired = sessions.create(1)
+    clock.now += 30
+    live = sessions.create(2)
+    sessions.revoke_user(1)
+    revoked = sessions.create(3)
+    sessions.revoke(revoked)
+
+    with open(path, 'a') as FILE:
+        FILE.write('+ torn 4')
+
+    clock.now += 30
+    reloaded = SessionStore(str(path), 60, clock=clock)
+    assert reloaded.get_u_id(live) == 2
+    assert reloaded.get_u_id(expired) is None
+    assert reloaded.get_u_id(revoked) is None
+    assert reloaded.get_u_id('torn') is None
+    assert len(reloaded) == 1
+
+def test_sessions_file_is_compacted(tmp_path):
+    '''
+    Logging in and out many times does not grow the sessions file for ever
+
+    Expects:
+        The file to hold fewer lines than changes made, and the open session to
+        be reloaded
+    '''
+    path = tmp_path / 'sessions.log'
+    sessions = SessionStore(str(path), 60)
+
+    for _ in range(COMPACT_LINES):
+        sessions.revoke(sessions.create(1))
+    live = sessions.create(1)
+
+    assert len(path.read_text().splitlines()) < COMPACT_LINES
+    assert SessionStore(str(path), 60).get_u_id(live) == 1
+
+def test_user_sessions_are_revoked(tmp_path):
+    '''
+    Ending every session of a user, some of which have expired
+
+    Expects:
+        The user's live sessions to end, and no other user's
+    '''
+    clock = Clock()
+    path = tmp_path / 'sessions.log'
+    sessions = SessionStore(str(path), 60, clock=clock)
+
+    sessions.create(1)
+    clock.now += 30
+    first = [sessions.create(1) for _ in range(3)]
+    other = sessions.create(2)
+
+    # the first session expires, and is dropped by the next create
+    clock.now += 30
+    second = sessions.create(1)
+
+    assert sessions.revoke_user(1) == 4
+    assert sessions.revoke_user(1) == 0
+    assert [sessions.get_u_id(session_id) for session_id in first + [second]] == [None] * 4
+    assert sessions.get_u_id(other) == 2
+
+    reloaded = SessionStore(str(path), 60, clock=clock)
+    assert reloaded.get_u_id(second) is None
+    assert reloaded.get_u_id(other) == 2
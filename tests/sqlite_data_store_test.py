@@ -0,0 +1,46 @@
+'''
+
+Sqlite datastore
+
+Several processes can share one sqlite database, each with its own
+SqliteDatastore. Two datastores opened on the same file stand in for them.
+
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+from src.sqlite_data_store import SqliteDatastore
+
+def new_user(index):
+    return [f'john{index}@smith.com', 'password', 'John', 'Smith', 'johnsmith']
+
+def test_handles_from_two_processes(tmp_path):
+    '''
+    Users with the same name registered through two datastores on the same
+    database, one after the other and then at the same time
+
+    Expects:
+        Every user to get a different handle, the lowest free one when the
+        registrations take turns
+    '''
+    path = str(tmp_path / 'data_store.db')
+    first = SqliteDatastore(path)
+    second = SqliteDatastore(path)
+
+    # second's suffix counter knows nothing of the handles first gave out
+    first.insert_new_users([new_user(0), new_user(1), new_user(2)])
+    second.insert_new_users([new_user(3)])
+    first.insert_new_users([new_user(4)])
+
+    handles = [user['handle_str'] for user in first.get_users_from_u_id_dict().values()]
+    assert handles == ['johnsmith', 'johnsmith0', 'johnsmith1', 'johnsmith2', 'johnsmith3']
+
+    def register(index):
+        datastore = first if index % 2 else second
+        return datastore.insert_new_users([new_user(index)])
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(register, range(5, 45)))
+
+    handles = [user['handle_str'] for user in second.get_users_from_u_id_dict().values()]
+    assert len(handles) == len(set(handles)) == 45